@@ -1,4 +1,9 @@
 import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+from .lookup_grid import load_or_build_district_grid, lookup_district_codes
 
 
 def add_administrative_district(df, shp_path):
@@ -21,3 +26,92 @@ def add_administrative_district(df, shp_path):
     joined_gdf = joined_gdf.rename(columns={"NAME": "administrative_district"})
 
     return joined_gdf
+
+
+def _district_categorical(codes, names, index):
+    # Коды полигонов -> категории по NAME (отсортированы, как после astype("category"))
+    categories, name_codes = np.unique(np.asarray(names, dtype=str), return_inverse=True)
+    codes = np.where(codes >= 0, name_codes[np.maximum(codes, 0)], -1)
+
+    district = pd.Categorical.from_codes(codes, categories=categories)
+
+    return pd.Series(district, index=index).cat.remove_unused_categories()
+
+
+def add_administrative_district_grid(
+    df, shp_path, cache_dir, lon_min, lon_max, lat_min, lat_max, step
+):
+    """
+    То же, что add_administrative_district, но без sjoin: округ берется из
+    закэшированного растра, полигоны проверяются только в пограничных ячейках.
+    """
+    districts_gdf = gpd.read_file(shp_path).to_crs("EPSG:4326")
+    geometries = districts_gdf.geometry.values
+
+    grid = load_or_build_district_grid(
+        geometries, shp_path, cache_dir, lon_min, lon_max, lat_min, lat_max, step
+    )
+
+    codes = lookup_district_codes(
+        grid,
+        geometries,
+        df["longitude"].to_numpy(),
+        df["latitude"].to_numpy(),
+        lon_min,
+        lat_min,
+        step,
+    )
+
+    return df.assign(
+        administrative_district=_district_categorical(
+            codes, districts_gdf["NAME"], df.index
+        )
+    )
+
+
+def _unique_coordinates(lon, lat):
+    # lon/lat как одно комплексное число: np.unique по 1D массиву вместо axis=0
+    finite = np.isfinite(lon) & np.isfinite(lat)
+    keys = lon[finite].astype(np.float64) + 1j * lat[finite].astype(np.float64)
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+
+    return unique_keys.real, unique_keys.imag, finite, inverse
+
+
+def add_administrative_district_unique(df, shp_path):
+    """
+    То же, что add_administrative_district, но полигоны проверяются только
+    на уникальных координатах через shapely.contains_xy, без geometry-колонки
+    на всю таблицу. Результат разносится обратно по строкам как category.
+    """
+    districts_gdf = gpd.read_file(shp_path).to_crs("EPSG:4326")
+    geometries = districts_gdf.geometry.values
+
+    ux, uy, finite, inverse = _unique_coordinates(
+        df["longitude"].to_numpy(dtype=np.float64, na_value=np.nan),
+        df["latitude"].to_numpy(dtype=np.float64, na_value=np.nan),
+    )
+
+    unique_codes = np.full(len(ux), -1, dtype=np.int16)
+    for code, geom in enumerate(geometries):
+        min_x, min_y, max_x, max_y = shapely.bounds(geom)
+        # При перекрытии полигонов точка достается первому (в ao.shp перекрытий нет)
+        candidates = np.flatnonzero(
+            (unique_codes == -1)
+            & (ux >= min_x)
+            & (ux <= max_x)
+            & (uy >= min_y)
+            & (uy <= max_y)
+        )
+        shapely.prepare(geom)
+        inside = shapely.contains_xy(geom, ux[candidates], uy[candidates])
+        unique_codes[candidates[inside]] = code
+
+    codes = np.full(len(df), -1, dtype=np.int16)
+    codes[finite] = unique_codes[inverse]
+
+    return df.assign(
+        administrative_district=_district_categorical(
+            codes, districts_gdf["NAME"], df.index
+        )
+    )
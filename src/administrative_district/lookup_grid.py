@@ -0,0 +1,93 @@
+import hashlib
+from pathlib import Path
+
+import numpy as np
+import shapely
+
+OUTSIDE = -1  # ячейка целиком вне всех округов
+BOUNDARY = -2  # ячейку пересекает граница — нужна точная проверка полигоном
+
+SHAPEFILE_PARTS = [".shp", ".shx", ".dbf", ".prj"]
+
+
+def shapefile_hash(shp_path, extra=""):
+    shp_path = Path(shp_path)
+    md5 = hashlib.md5()
+    for suffix in SHAPEFILE_PARTS:
+        part = shp_path.with_suffix(suffix)
+        if part.exists():
+            md5.update(part.read_bytes())
+    md5.update(extra.encode())
+    return md5.hexdigest()
+
+
+def build_district_grid(geometries, lon_min, lon_max, lat_min, lat_max, step):
+    """
+    Растр id округа по ячейкам step x step градусов над bbox.
+    В ячейке либо id округа, в котором она лежит целиком, либо OUTSIDE,
+    либо BOUNDARY, если через ячейку проходит граница какого-то округа.
+    """
+    nx = int(np.ceil((lon_max - lon_min) / step))
+    ny = int(np.ceil((lat_max - lat_min) / step))
+
+    x0 = lon_min + step * np.arange(nx)
+    y0 = lat_min + step * np.arange(ny)
+    xx, yy = np.meshgrid(x0, y0)
+    xx, yy = xx.ravel(), yy.ravel()
+
+    grid = np.full(nx * ny, OUTSIDE, dtype=np.int16)
+
+    # Ячейки без границы внутри однородны — достаточно проверить центр
+    for code, geom in enumerate(geometries):
+        shapely.prepare(geom)
+        grid[shapely.contains_xy(geom, xx + step / 2, yy + step / 2)] = code
+
+    cells = shapely.STRtree(shapely.box(xx, yy, xx + step, yy + step))
+    for geom in geometries:
+        grid[cells.query(shapely.boundary(geom), predicate="intersects")] = BOUNDARY
+
+    return grid.reshape(ny, nx)
+
+
+def load_or_build_district_grid(
+    geometries, shp_path, cache_dir, lon_min, lon_max, lat_min, lat_max, step
+):
+    grid_key = f"{lon_min}:{lon_max}:{lat_min}:{lat_max}:{step}"
+    cache_path = Path(cache_dir) / f"ao_grid_{shapefile_hash(shp_path, grid_key)}.npy"
+
+    if cache_path.exists():
+        return np.load(cache_path)
+
+    grid = build_district_grid(geometries, lon_min, lon_max, lat_min, lat_max, step)
+
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    np.save(cache_path, grid)
+
+    return grid
+
+
+def lookup_district_codes(grid, geometries, lon, lat, lon_min, lat_min, step):
+    lon = np.asarray(lon, dtype=np.float64)
+    lat = np.asarray(lat, dtype=np.float64)
+    ny, nx = grid.shape
+
+    with np.errstate(invalid="ignore"):
+        ix = np.floor((lon - lon_min) / step)
+        iy = np.floor((lat - lat_min) / step)
+    in_grid = (ix >= 0) & (ix < nx) & (iy >= 0) & (iy < ny)
+
+    # Точки вне сетки (и NaN) тоже уходят на точную проверку
+    codes = np.full(len(lon), BOUNDARY, dtype=np.int16)
+    codes[in_grid] = grid[iy[in_grid].astype(np.intp), ix[in_grid].astype(np.intp)]
+
+    exact_idx = np.flatnonzero(codes == BOUNDARY)
+    codes[exact_idx] = OUTSIDE
+
+    for code, geom in enumerate(geometries):
+        if len(exact_idx) == 0:
+            break
+        inside = shapely.contains_xy(geom, lon[exact_idx], lat[exact_idx])
+        codes[exact_idx[inside]] = code
+        exact_idx = exact_idx[~inside]
+
+    return codes
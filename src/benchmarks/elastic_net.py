@@ -0,0 +1,67 @@
+"""
+Бенчмарк ElasticNet-trials: TorchElasticNet(solver="fista") — FISTA по X на
+каждый fit — против TorchElasticNet(solver="cd") — coordinate descent по
+кэшированной Gram-матрице с warm start по пути от alpha_max. Время cd
+включает построение Gram-матрицы при первом fit. Коэффициенты и
+предсказания обоих решателей должны совпадать с точностью --tol.
+
+    python -m src.benchmarks.elastic_net --rows 1000000 --features 40 --alphas 20
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from src.experiments.choose_model import TorchElasticNet
+
+
+def _fit_path(alphas, X, y, l1_ratio, device, solver):
+    coefs, preds = [], []
+    for alpha in alphas:
+        model = TorchElasticNet(
+            alpha=alpha, l1_ratio=l1_ratio, device=device, solver=solver
+        )
+        model.fit(X, y)
+        coefs.append(model.w.cpu().numpy())
+        preds.append(model.predict(X))
+    return np.stack(coefs), np.stack(preds)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--features", type=int, default=40)
+    parser.add_argument("--alphas", type=int, default=20)
+    parser.add_argument("--l1-ratio", type=float, default=0.5)
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--tol", type=float, default=1e-3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    X = rng.standard_normal((args.rows, args.features), dtype=np.float32)
+    coef = rng.standard_normal(args.features) * (rng.random(args.features) < 0.5)
+    y = (X @ coef + rng.standard_normal(args.rows)).astype(np.float32)
+    alphas = np.geomspace(1e-4, 1.0, args.alphas)
+
+    start = time.perf_counter()
+    old_coefs, old_preds = _fit_path(alphas, X, y, args.l1_ratio, args.device, "fista")
+    fista_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    new_coefs, new_preds = _fit_path(alphas, X, y, args.l1_ratio, args.device, "cd")
+    cd_time = time.perf_counter() - start
+
+    coef_diff = np.abs(old_coefs - new_coefs).max()
+    pred_diff = np.abs(old_preds - new_preds).max() / y.std()
+    print(f"fista: {fista_time:.3f} s ({fista_time / len(alphas) * 1e3:.1f} ms/fit)")
+    print(f"cd   : {cd_time:.3f} s ({cd_time / len(alphas) * 1e3:.1f} ms/fit)")
+    print(f"max |w_fista - w_cd| = {coef_diff:.2e}")
+    print(f"max |pred_fista - pred_cd| / std(y) = {pred_diff:.2e}")
+    print(f"speedup x{fista_time / cd_time:.1f}")
+    assert coef_diff <= args.tol, f"coefficients differ by {coef_diff:.2e}"
+    assert pred_diff <= args.tol, f"predictions differ by {pred_diff:.2e}"
+
+
+if __name__ == "__main__":
+    main()
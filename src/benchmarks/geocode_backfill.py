@@ -0,0 +1,94 @@
+"""
+Бенчмарк дозаполнения координат в geocode_addresses.
+Сравнивает старую схему (два dict + Series.map) с hash join по
+категориальному адресу на синтетическом фрейме в несколько миллионов строк.
+
+    python -m src.benchmarks.geocode_backfill --rows 5000000
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.geocode.geocoding import _backfill_coordinates
+
+
+def _backfill_dict_map(df, df_geocoded):
+    lat_map = df_geocoded.set_index("address")["latitude"].to_dict()
+    lon_map = df_geocoded.set_index("address")["longitude"].to_dict()
+
+    df["latitude"] = df["latitude"].fillna(df["address"].map(lat_map))
+    df["longitude"] = df["longitude"].fillna(df["address"].map(lon_map))
+
+    return df
+
+
+def make_frames(n_rows, n_addresses, missing_share, seed=42):
+    rng = np.random.default_rng(seed)
+
+    pool = pd.Series(
+        [f"ул. Тестовая, д. {i}, корп. {i % 7}" for i in range(n_addresses)],
+        dtype="string",
+    )
+    address = pool.iloc[rng.integers(0, n_addresses, n_rows)].reset_index(drop=True)
+
+    latitude = rng.uniform(55.15, 56.0, n_rows).astype(np.float32)
+    longitude = rng.uniform(36.9, 38.05, n_rows).astype(np.float32)
+    missing = rng.random(n_rows) < missing_share
+    latitude[missing] = np.nan
+    longitude[missing] = np.nan
+
+    df = pd.DataFrame(
+        {"address": address, "latitude": latitude, "longitude": longitude}
+    )
+
+    df_geocoded = pd.DataFrame(
+        {
+            "address": pool,
+            "latitude": rng.uniform(55.15, 56.0, n_addresses),
+            "longitude": rng.uniform(36.9, 38.05, n_addresses),
+        }
+    )
+
+    return df, df_geocoded
+
+
+def _timeit(fn, df, df_geocoded, repeat):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        df_run = df.copy()
+        start = time.perf_counter()
+        result = fn(df_run, df_geocoded)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=5_000_000)
+    parser.add_argument("--addresses", type=int, default=300_000)
+    parser.add_argument("--missing-share", type=float, default=0.3)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    df, df_geocoded = make_frames(args.rows, args.addresses, args.missing_share)
+    print(f"rows={len(df):,} unique addresses={args.addresses:,}")
+
+    t_old, res_old = _timeit(_backfill_dict_map, df, df_geocoded, args.repeat)
+    t_new, res_new = _timeit(_backfill_coordinates, df, df_geocoded, args.repeat)
+
+    for col in ["latitude", "longitude"]:
+        np.testing.assert_allclose(
+            res_old[col].to_numpy(dtype=np.float32),
+            res_new[col].to_numpy(dtype=np.float32),
+        )
+
+    print(f"dict + map : {t_old:.3f} s")
+    print(f"hash join  : {t_new:.3f} s  (x{t_old / t_new:.1f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Бенчмарк HDBSCAN с обучением на выборке (HDBSCAN_FIT_SAMPLE в choose_model)
+против обучения на всем train, на подвыборке train/valid из
+data/interim/wnir_all. Для каждого размера выборки — время и согласие
+разметок с полным fit (ARI, AMI) на train и valid, доля шума и число
+кластеров. --samples — размеры выборок для сравнения.
+
+    python -m src.benchmarks.hdbscan_sample --rows 200000 --samples 20000 50000 100000
+"""
+
+import argparse
+import time
+
+import numpy as np
+from sklearn.metrics import adjusted_mutual_info_score, adjusted_rand_score
+
+from src.experiments.choose_model import (
+    BASE_CAT_FEATURES,
+    BASE_NUM_FEATURES,
+    get_preprocessor,
+)
+from src.experiments.clustering import HDBSCANHierarchy, spatial_sample
+from src.interim.dataset import read_interim_dataset
+
+
+def _describe(labels):
+    n_clusters = len(np.unique(labels[labels != -1]))
+    return f"{n_clusters} clusters, noise {np.mean(labels == -1):.1%}"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--valid-rows", type=int, default=50_000)
+    parser.add_argument("--samples", type=int, nargs="+", default=[20_000, 50_000])
+    parser.add_argument("--min-cluster-size", type=int, default=100)
+    parser.add_argument("--min-samples", type=int, default=20)
+    parser.add_argument("--n-jobs", type=int, default=-1)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    columns = BASE_NUM_FEATURES + BASE_CAT_FEATURES + ["market_type"]
+    df_train, df_valid = (
+        read_interim_dataset("data/interim/wnir_all", columns=columns, split=split)
+        for split in ("train", "valid")
+    )
+    df_train = df_train.iloc[
+        np.sort(rng.choice(len(df_train), min(args.rows, len(df_train)), replace=False))
+    ]
+    df_valid = df_valid.iloc[
+        np.sort(
+            rng.choice(len(df_valid), min(args.valid_rows, len(df_valid)), replace=False)
+        )
+    ]
+
+    preprocessor = get_preprocessor()
+    X_train = preprocessor.fit_transform(df_train).astype(np.float32)
+    X_valid = preprocessor.transform(df_valid).astype(np.float32)
+    params = (args.min_cluster_size, args.min_samples)
+
+    start = time.perf_counter()
+    full_train, full_valid = HDBSCANHierarchy(
+        X_train, X_valid, core_dist_n_jobs=args.n_jobs
+    ).labels(*params)
+    full_time = time.perf_counter() - start
+    print(f"full   {len(X_train):>9}: {full_time:7.1f} s, {_describe(full_train)}")
+
+    for size in args.samples:
+        start = time.perf_counter()
+        fit_rows = spatial_sample(
+            df_train["longitude"].to_numpy(),
+            df_train["latitude"].to_numpy(),
+            df_train["market_type"].to_numpy(),
+            size,
+        )
+        train_labels, valid_labels = HDBSCANHierarchy(
+            X_train, X_valid, core_dist_n_jobs=args.n_jobs, fit_rows=fit_rows
+        ).labels(*params)
+        sample_time = time.perf_counter() - start
+
+        print(
+            f"sample {size:>9}: {sample_time:7.1f} s (x{full_time / sample_time:.1f}), "
+            f"{_describe(train_labels)}"
+        )
+        print(
+            f"    train ARI {adjusted_rand_score(full_train, train_labels):.3f} "
+            f"AMI {adjusted_mutual_info_score(full_train, train_labels):.3f} | "
+            f"valid ARI {adjusted_rand_score(full_valid, valid_labels):.3f} "
+            f"AMI {adjusted_mutual_info_score(full_valid, valid_labels):.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
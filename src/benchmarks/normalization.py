@@ -0,0 +1,131 @@
+"""
+Бенчмарк normalize_datasets и разбора дат на пяти источниках clean.
+Сравнивает старую схему (Series.map по строкам + apply с _assign_housing_type,
+pd.to_datetime по всем строкам) с маппингом категорий и parse_dates, который
+разбирает уникальные даты по формату источника из adapters.py.
+--tile размножает строки источников.
+
+    python -m src.benchmarks.normalization --tile 10
+"""
+
+import argparse
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from src.clean.adapters import (
+    DF1_ADAPTER,
+    DF1_DATE_FORMAT,
+    DF2_ADAPTER,
+    DF2_DATE_FORMAT,
+    DF3_ADAPTER,
+    DF3_DATE_FORMAT,
+    DF4_ADAPTER,
+    DF4_DATE_FORMAT,
+    DF5_ADAPTER,
+    DF5_DATE_FORMAT,
+    adapt_dataframes,
+    parse_dates,
+)
+from src.clean.data_loader import RAW_SOURCES, read_dfs_projected
+from src.clean.normalization import FLAT_TYPE_MAP, normalize_datasets
+
+ADAPTERS = [DF1_ADAPTER, DF2_ADAPTER, DF3_ADAPTER, DF4_ADAPTER, DF5_ADAPTER]
+
+DATE_COLUMNS = [
+    ("Дата последней брони", DF1_DATE_FORMAT),
+    ("actualized_at", DF2_DATE_FORMAT),
+    ("created_at", DF3_DATE_FORMAT),
+    ("Дата договора", DF4_DATE_FORMAT),
+    ("lastDate", DF5_DATE_FORMAT),
+]
+
+
+def _assign_housing_type(flat_type):
+    if pd.isna(flat_type):
+        return pd.NA
+    if flat_type in ["flat", "studio"]:
+        return "residential"
+    elif flat_type in ["parking", "storage", "office"]:
+        return "non_residential"
+    return pd.NA
+
+
+def _normalize_rowwise(dfs):
+    for df in dfs:
+        if "balcony" in df.columns:
+            df["balcony"] = pd.to_numeric(df["balcony"], errors="coerce")
+            df["balcony"] = (df["balcony"].fillna(0) > 0).astype("UInt8")
+
+        if "flat_type" in df.columns:
+            df["flat_type"] = (
+                df["flat_type"].astype(object).map(FLAT_TYPE_MAP).astype("category")
+            )
+            df.loc[df["flat_type"] == "studio", "room_count"] = 0
+
+        housing_type = df["flat_type"].astype(object).apply(_assign_housing_type)
+        df["housing_type"] = housing_type.astype("category")
+
+    for df in dfs:
+        if "date" in df.columns:
+            df["date"] = pd.to_datetime(df["date"], errors="coerce")
+            df["date"] = df["date"].dt.normalize()
+
+    return dfs
+
+
+def _timeit(fn, repeat):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--raw-dir", default=None)
+    parser.add_argument("--tile", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    paths = RAW_SOURCES
+    if args.raw_dir is not None:
+        paths = [str(Path(args.raw_dir) / Path(p).name) for p in RAW_SOURCES]
+
+    raw = read_dfs_projected(ADAPTERS, paths=paths)
+    raw = [pd.concat([df] * args.tile, ignore_index=True) for df in raw]
+    print(f"rows={sum(len(df) for df in raw):,}")
+
+    print("dates:")
+    for df, (col, date_format) in zip(raw, DATE_COLUMNS):
+        t_old, res_old = _timeit(
+            lambda: pd.to_datetime(df[col], errors="coerce"), args.repeat
+        )
+        t_new, res_new = _timeit(lambda: parse_dates(df[col], date_format), args.repeat)
+        pd.testing.assert_series_equal(res_old, res_new)
+        print(
+            f"  {col:<22} {date_format or '-':<8}: per row {t_old:.3f} s, "
+            f"unique {t_new:.3f} s  (x{t_old / t_new:.1f})"
+        )
+
+    adapted = adapt_dataframes(raw, ADAPTERS)
+
+    t_old, res_old = _timeit(
+        lambda: _normalize_rowwise([df.copy() for df in adapted]), args.repeat
+    )
+    t_new, res_new = _timeit(
+        lambda: normalize_datasets([df.copy() for df in adapted]), args.repeat
+    )
+    for old, new in zip(res_old, res_new):
+        pd.testing.assert_frame_equal(old, new)
+
+    print(f"normalize rowwise    : {t_old:.3f} s")
+    print(f"normalize categories : {t_new:.3f} s  (x{t_old / t_new:.1f})")
+
+
+if __name__ == "__main__":
+    main()
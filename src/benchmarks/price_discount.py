@@ -0,0 +1,105 @@
+"""
+Бенчмарк PriceDiscounter на train+valid+test из data/interim/split.
+Сравнивает старую схему (copy + Period + merge по market_type/period)
+с плотной матрицей индексов и выборкой по целочисленному коду месяца.
+--tile размножает строки выборок.
+
+    python -m src.benchmarks.price_discount --tile 20
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.interim.dataset import SPLITS, read_interim_dataset
+from src.stages.price_discount import PriceDiscounter
+
+
+class _MergePriceDiscounter:
+    def __init__(self, min_obs=30):
+        self.min_obs = min_obs
+
+    def fit(self, df):
+        df_ = df.copy()
+        df_["period"] = df_["date"].dt.to_period("M").dt.to_timestamp()
+
+        monthly = (
+            df_.groupby(["market_type", "period"], as_index=False)
+            .agg(
+                price_sqm_median=("price_per_square_meter", "median"),
+                n_obs=("price_per_square_meter", "size"),
+            )
+            .sort_values(["market_type", "period"])
+        )
+        monthly = monthly[monthly["n_obs"] >= self.min_obs].copy()
+        monthly["base_value"] = monthly.groupby("market_type")[
+            "price_sqm_median"
+        ].transform("last")
+        monthly["discount_index"] = monthly["price_sqm_median"] / monthly["base_value"]
+
+        self.discount_map_ = monthly[["market_type", "period", "discount_index"]]
+        return self
+
+    def transform(self, df):
+        df_ = df.copy()
+        df_["period"] = df_["date"].dt.to_period("M").dt.to_timestamp()
+        df_ = df_.merge(self.discount_map_, on=["market_type", "period"], how="left")
+        df_["discount_index"] = df_["discount_index"].fillna(1.0)
+
+        df_["price_per_square_meter_normalized"] = (
+            df_["price_per_square_meter"] / df_["discount_index"]
+        ).astype("float32")
+        df_["price_normalized"] = (
+            df_["price_per_square_meter_normalized"] * df_["area"]
+        ).astype("float32")
+
+        return df_.drop(columns=["period", "discount_index"])
+
+
+def _run(discounter, splits):
+    fit_start = time.perf_counter()
+    discounter.fit(splits["train"])
+    fit_time = time.perf_counter() - fit_start
+
+    start = time.perf_counter()
+    results = {split: discounter.transform(df) for split, df in splits.items()}
+    return fit_time, time.perf_counter() - start, results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--path", default="data/interim/split")
+    parser.add_argument("--tile", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    splits = {}
+    for split in SPLITS:
+        df = read_interim_dataset(args.path, split=split)
+        splits[split] = pd.concat([df] * args.tile, ignore_index=True)
+    print(", ".join(f"{split}={len(df):,}" for split, df in splits.items()))
+
+    timings = {}
+    for name, make in [("merge", _MergePriceDiscounter), ("dense", PriceDiscounter)]:
+        runs = [_run(make(min_obs=30), splits) for _ in range(args.repeat)]
+        fit_time = min(run[0] for run in runs)
+        transform_time = min(run[1] for run in runs)
+        timings[name] = (fit_time, transform_time, runs[-1][2])
+        print(f"{name:<6}: fit {fit_time:.3f} s, transform {transform_time:.3f} s")
+
+    for split in SPLITS:
+        old = timings["merge"][2][split]
+        new = timings["dense"][2][split]
+        for col in ["price_per_square_meter_normalized", "price_normalized"]:
+            np.testing.assert_allclose(
+                old[col].to_numpy(), new[col].to_numpy(), rtol=1e-6
+            )
+
+    speedup = timings["merge"][1] / timings["dense"][1]
+    print(f"transform speedup x{speedup:.1f}")
+
+
+if __name__ == "__main__":
+    main()
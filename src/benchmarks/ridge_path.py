@@ -0,0 +1,63 @@
+"""
+Бенчмарк ridge-trials: TorchRidge(solver="lstsq") — нормальные уравнения
+на каждое alpha — против RidgePath — одно разложение Gram-матрицы,
+дальше O(d²) на alpha. Данные синтетические, стандартизованные,
+как после preprocessor в choose_model.
+
+    python -m src.benchmarks.ridge_path --rows 1000000 --features 40 --alphas 50
+"""
+
+import argparse
+import time
+
+import numpy as np
+import torch
+
+from src.experiments.choose_model import TorchRidge
+from src.experiments.linear_models import GramStats, RidgePath
+
+
+def _fit_lstsq(X, y, alpha, device):
+    model = TorchRidge(alpha=alpha, device=device, solver="lstsq")
+    model.fit(X, y)
+    return model.w.view(-1).cpu().numpy()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--features", type=int, default=40)
+    parser.add_argument("--alphas", type=int, default=50)
+    parser.add_argument("--device", default="cpu")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    X = rng.standard_normal((args.rows, args.features), dtype=np.float32)
+    y = (X @ rng.standard_normal(args.features) + rng.standard_normal(args.rows))
+    y = y.astype(np.float32)
+    alphas = np.geomspace(1e-3, 1e3, args.alphas)
+
+    start = time.perf_counter()
+    old = np.stack([_fit_lstsq(X, y, alpha, args.device) for alpha in alphas])
+    lstsq_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    path = RidgePath(GramStats(X, y, args.device))
+    setup_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    W, intercepts = path.coefs(alphas)
+    solve_time = time.perf_counter() - start
+
+    new = torch.cat([intercepts[None], W]).T.cpu().numpy()
+    np.testing.assert_allclose(new, old, rtol=1e-3, atol=1e-4)
+
+    print(f"lstsq: {lstsq_time:.3f} s ({lstsq_time / len(alphas) * 1e3:.1f} ms/alpha)")
+    print(
+        f"path : setup {setup_time:.3f} s, all {len(alphas)} alphas {solve_time * 1e3:.2f} ms"
+    )
+    print(f"speedup x{lstsq_time / (setup_time + solve_time):.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,143 +1,283 @@
 import numpy as np
 import pandas as pd
 
+from src.clean.constants import INTERIM_CLEAN_COLUMNS
+
+# Форматы дат источников (strftime). None — формат выводится pandas, как
+# раньше; формат стоит заявлять, только сверив его с сырым файлом. Значения,
+# не подошедшие под заявленный формат, разбираются с выводом формата и
+# попадают в DATE_FORMAT_FALLBACKS (отчет clean).
+DF1_DATE_FORMAT = None
+DF2_DATE_FORMAT = None
+DF3_DATE_FORMAT = None
+DF4_DATE_FORMAT = None  # в parquet дата уже datetime64
+DF5_DATE_FORMAT = None
+
+# {колонка: {"rows": строк не по формату, "examples": [...]}} за один запуск
+# clean; stages/clean сбрасывает его в начале запуска
+DATE_FORMAT_FALLBACKS = {}
+
+# {колонка: строк, где непустое значение источника стало NA при приведении
+# к dtype из INTERIM_CLEAN_COLUMNS} — так же за один запуск clean
+COERCED_TO_NA = {}
+
+
+def parse_dates(values, format=None):
+    """
+    pd.to_datetime(values, format=format, errors="coerce"), но разбирается
+    каждая уникальная строка один раз: различных дат в источнике на порядки
+    меньше, чем строк. Непустые значения, не подошедшие под заявленный
+    format, разбираются с выводом формата и учитываются в
+    DATE_FORMAT_FALLBACKS.
+    """
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return pd.to_datetime(values)
+
+    codes, uniques = pd.factorize(values)
+    uniques = pd.Series(uniques)
+
+    dates = pd.to_datetime(uniques, format=format, errors="coerce")
+
+    failed = dates.isna().to_numpy()
+    if format is not None and failed.any():
+        rows = int(np.bincount(codes[codes >= 0], minlength=len(uniques))[failed].sum())
+        entry = DATE_FORMAT_FALLBACKS.setdefault(
+            str(values.name), {"rows": 0, "examples": []}
+        )
+        entry["rows"] += rows
+        examples = [str(value) for value in uniques[failed].head(3)]
+        entry["examples"] = (entry["examples"] + examples)[:3]
+        dates[failed] = pd.to_datetime(uniques[failed], errors="coerce")
+
+    return pd.Series(
+        dates.array.take(codes, allow_fill=True), index=values.index, name=values.name
+    )
+
 
 DF1_ADAPTER = {
     "address": pd.NA,
     "longitude": np.nan,
     "latitude": np.nan,
-    "area": lambda df: pd.to_numeric(df["SFA, м2"], errors="coerce"),
+    "area": lambda src: src.numeric("SFA, м2"),
     "room_count": pd.NA,
-    "floor": lambda df: pd.to_numeric(df["Этаж"], errors="coerce"),
-    "floor_count": lambda df: pd.to_numeric(
-        df["Максимальное кол-во этажей в этой секциии"], errors="coerce"
+    "floor": lambda src: src.numeric("Этаж"),
+    "floor_count": lambda src: src.numeric(
+        "Максимальное кол-во этажей в этой секциии"
     ),
-    "market_type": lambda df: "secondary",
+    "market_type": lambda src: "secondary",
     "housing_type": pd.NA,
     "flat_type": "Вид помещения",
     "ceiling_height": np.nan,
     "build_year": np.nan,
     "balcony": "Количество балконов",
-    "price": lambda df: pd.to_numeric(df["Стоимость"], errors="coerce"),
-    "price_per_square_meter": lambda df: (
-        pd.to_numeric(df["Стоимость"], errors="coerce")
-        / pd.to_numeric(df["SFA, м2"], errors="coerce")
+    "price": lambda src: src.numeric("Стоимость"),
+    "price_per_square_meter": lambda src: (
+        src.numeric("Стоимость") / src.numeric("SFA, м2")
     ),
-    "date": "Дата последней брони",
+    "date": lambda src: src.datetime("Дата последней брони", DF1_DATE_FORMAT),
 }
 
 DF2_ADAPTER = {
     "address": "address",
     "longitude": np.nan,
     "latitude": np.nan,
-    "area": lambda df: pd.to_numeric(df["area"], errors="coerce"),
-    "room_count": lambda df: pd.to_numeric(df["room_count"], errors="coerce"),
-    "floor": lambda df: pd.to_numeric(df["floor"], errors="coerce"),
-    "floor_count": lambda df: pd.to_numeric(df["floor_count"], errors="coerce"),
-    "market_type": lambda df: "secondary",
+    "area": lambda src: src.numeric("area"),
+    "room_count": lambda src: src.numeric("room_count"),
+    "floor": lambda src: src.numeric("floor"),
+    "floor_count": lambda src: src.numeric("floor_count"),
+    "market_type": lambda src: "secondary",
     "housing_type": pd.NA,
     "flat_type": "flat_type",
-    "ceiling_height": lambda df: pd.to_numeric(df["ceiling_height"], errors="coerce"),
+    "ceiling_height": lambda src: src.numeric("ceiling_height"),
     "build_year": "build_year",
     "balcony": "balcony",
-    "price": lambda df: pd.to_numeric(df["price"], errors="coerce"),
-    "price_per_square_meter": lambda df: pd.to_numeric(
-        df["price_per_square_meter"], errors="coerce"
-    ),
-    "date": "actualized_at",
+    "price": lambda src: src.numeric("price"),
+    "price_per_square_meter": lambda src: src.numeric("price_per_square_meter"),
+    "date": lambda src: src.datetime("actualized_at", DF2_DATE_FORMAT),
 }
 
 DF3_ADAPTER = {
-    "address": lambda df: (
-        df["street_name"].astype(str) + ", " + df["house_number"].astype(str)
+    "address": lambda src: (
+        src["street_name"].astype(str) + ", " + src["house_number"].astype(str)
     ),
     "longitude": np.nan,
     "latitude": np.nan,
     "area": "area",
-    "room_count": lambda df: pd.to_numeric(df["room_count"], errors="coerce"),
-    "floor": lambda df: pd.to_numeric(df["floor"], errors="coerce"),
-    "floor_count": lambda df: pd.to_numeric(df["floor_count"], errors="coerce"),
-    "market_type": lambda df: "secondary",
+    "room_count": lambda src: src.numeric("room_count"),
+    "floor": lambda src: src.numeric("floor"),
+    "floor_count": lambda src: src.numeric("floor_count"),
+    "market_type": lambda src: "secondary",
     "housing_type": pd.NA,
     "flat_type": "flat_type",
-    "ceiling_height": lambda df: pd.to_numeric(df["ceiling_height"], errors="coerce"),
+    "ceiling_height": lambda src: src.numeric("ceiling_height"),
     "build_year": "build_year",
     "balcony": pd.NA,
-    "price": lambda df: pd.to_numeric(df["price"], errors="coerce"),
-    "price_per_square_meter": lambda df: pd.to_numeric(
-        df["price_per_square_meter"], errors="coerce"
-    ),
-    "date": "created_at",
+    "price": lambda src: src.numeric("price"),
+    "price_per_square_meter": lambda src: src.numeric("price_per_square_meter"),
+    "date": lambda src: src.datetime("created_at", DF3_DATE_FORMAT),
 }
 
 DF4_ADAPTER = {
     "address": "Адрес корпуса",
-    "longitude": lambda df: pd.to_numeric(df["longitude"], errors="coerce"),
-    "latitude": lambda df: pd.to_numeric(df["latitude"], errors="coerce"),
-    "area": lambda df: pd.to_numeric(df["Площадь согласно ЕГРН"], errors="coerce"),
-    "room_count": lambda df: pd.to_numeric(df["Количество комнат"], errors="coerce"),
-    "floor": lambda df: pd.to_numeric(df["Этаж"], errors="coerce"),
+    "longitude": lambda src: src.numeric("longitude"),
+    "latitude": lambda src: src.numeric("latitude"),
+    "area": lambda src: src.numeric("Площадь согласно ЕГРН"),
+    "room_count": lambda src: src.numeric("Количество комнат"),
+    "floor": lambda src: src.numeric("Этаж"),
     "floor_count": np.nan,
-    "market_type": lambda df: "primary",
+    "market_type": lambda src: "primary",
     "housing_type": pd.NA,
     "flat_type": "Тип объекта",
     "ceiling_height": np.nan,
-    "build_year": lambda df: (
-        pd.to_datetime(df["Дата договора"], errors="coerce").dt.year
-    ),
+    "build_year": lambda src: src.datetime("Дата договора", DF4_DATE_FORMAT).dt.year,
     "balcony": pd.NA,
-    "price": lambda df: (
-        pd.to_numeric(df["Площадь согласно ЕГРН"], errors="coerce")
-        * pd.to_numeric(df["Цена за кв. метр"], errors="coerce")
+    "price": lambda src: (
+        src.numeric("Площадь согласно ЕГРН") * src.numeric("Цена за кв. метр")
     ),
-    "price_per_square_meter": lambda df: pd.to_numeric(
-        df["Цена за кв. метр"], errors="coerce"
-    ),
-    "date": "Дата договора",
+    "price_per_square_meter": lambda src: src.numeric("Цена за кв. метр"),
+    "date": lambda src: src.datetime("Дата договора", DF4_DATE_FORMAT),
 }
 
 
 DF5_ADAPTER = {
-    "address": lambda df: df["address_fias"].fillna(df["address"]),
-    "longitude": lambda df: pd.to_numeric(df["longitude"], errors="coerce"),
-    "latitude": lambda df: pd.to_numeric(df["latitude"], errors="coerce"),
-    "area": lambda df: pd.to_numeric(df["totalArea"], errors="coerce"),
-    "room_count": lambda df: pd.to_numeric(df["roomsOffered"], errors="coerce"),
-    "floor": lambda df: pd.to_numeric(df["floorsOffered"], errors="coerce"),
-    "floor_count": lambda df: pd.to_numeric(df["floorsTotal"], errors="coerce"),
-    "market_type": lambda df: "secondary",
+    "address": lambda src: src["address_fias"].fillna(src["address"]),
+    "longitude": lambda src: src.numeric("longitude"),
+    "latitude": lambda src: src.numeric("latitude"),
+    "area": lambda src: src.numeric("totalArea"),
+    "room_count": lambda src: src.numeric("roomsOffered"),
+    "floor": lambda src: src.numeric("floorsOffered"),
+    "floor_count": lambda src: src.numeric("floorsTotal"),
+    "market_type": lambda src: "secondary",
     "housing_type": pd.NA,
-    "flat_type": lambda df: "FLAT",
-    "ceiling_height": lambda df: pd.to_numeric(df["ceilingHeight"], errors="coerce"),
-    "build_year": lambda df: pd.to_numeric(df["buildYear"], errors="coerce"),
-    "balcony": lambda df: (
-        df["balconyType"].notna() & df["balconyType"].astype(str).ne("UNKNOWN")
+    "flat_type": lambda src: "FLAT",
+    "ceiling_height": lambda src: src.numeric("ceilingHeight"),
+    "build_year": lambda src: src.numeric("buildYear"),
+    "balcony": lambda src: (
+        src["balconyType"].notna() & src["balconyType"].astype(str).ne("UNKNOWN")
     ).astype("Int64"),
-    "price": lambda df: pd.to_numeric(df["lastPrice"], errors="coerce"),
-    "price_per_square_meter": lambda df: (
-        pd.to_numeric(df["lastPrice"], errors="coerce")
-        / pd.to_numeric(df["totalArea"], errors="coerce")
+    "price": lambda src: src.numeric("lastPrice"),
+    "price_per_square_meter": lambda src: (
+        src.numeric("lastPrice") / src.numeric("totalArea")
     ),
-    "date": lambda df: (
-        pd.to_datetime(df["lastDate"].fillna(df["creationDate"]), errors="coerce")
+    "date": lambda src: (
+        parse_dates(src["lastDate"].fillna(src["creationDate"]), DF5_DATE_FORMAT)
         .dt.tz_localize(None)
         .dt.normalize()
     ),
 }
 
 
+class _SourceColumns:
+    """
+    Колонки источника для lambda-адаптеров. numeric()/datetime() кэшируются
+    в рамках одной адаптации, чтобы одна колонка не парсилась дважды.
+    """
+
+    def __init__(self, df):
+        self.df = df
+        self._numeric = {}
+        self._datetime = {}
+
+    def __getitem__(self, col):
+        return self.df[col]
+
+    def numeric(self, col):
+        if col not in self._numeric:
+            self._numeric[col] = pd.to_numeric(self.df[col], errors="coerce")
+        return self._numeric[col]
+
+    def datetime(self, col, format=None):
+        if col not in self._datetime:
+            self._datetime[col] = parse_dates(self.df[col], format)
+        return self._datetime[col]
+
+
+class _ColumnRecorder:
+    """Подставляется вместо df, чтобы узнать, какие колонки читают lambda-адаптеры."""
+
+    def __init__(self):
+        self.columns = []
+
+    def __getitem__(self, col):
+        self.columns.append(col)
+        return pd.Series([], dtype="object")
+
+
+def source_columns(adapter):
+    columns = []
+
+    for source in adapter.values():
+        if isinstance(source, str):
+            columns.append(source)
+        elif callable(source):
+            recorder = _ColumnRecorder()
+            source(_SourceColumns(recorder))
+            columns.extend(recorder.columns)
+
+    return list(dict.fromkeys(columns))
+
+
+INTEGER_RANGES = {
+    "UInt8": (0, 2**8 - 1),
+    "Int16": (-(2**15), 2**15 - 1),
+    "UInt16": (0, 2**16 - 1),
+}
+
+
+def _to_canonical(values, dtype, index):
+    """
+    Приводит значение адаптера (колонку или скаляр) к dtype из
+    INTERIM_CLEAN_COLUMNS. Приведение идет до фильтров, поэтому
+    дедупликация сравнивает уже приведенные значения: строки, различавшиеся
+    только за пределами точности float32, считаются дубликатами.
+    """
+    if not isinstance(values, pd.Series):
+        if pd.api.types.is_scalar(values) and pd.isna(values):
+            return pd.Series(None, index=index, dtype="object").astype(dtype)
+        values = pd.Series(values, index=index)
+
+    if dtype == "float32":
+        return pd.to_numeric(values, errors="coerce").astype("float32")
+
+    if dtype in INTEGER_RANGES:
+        # Нецелые и не влезающие в тип значения -> NA (раньше cast_types падал на них)
+        low, high = INTEGER_RANGES[dtype]
+        numeric = pd.to_numeric(values, errors="coerce").to_numpy(
+            dtype=np.float64, na_value=np.nan
+        )
+        with np.errstate(invalid="ignore"):
+            bad = (numeric != np.floor(numeric)) | (numeric < low) | (numeric > high)
+        return pd.Series(np.where(bad, np.nan, numeric), index=index).astype(dtype)
+
+    if dtype == "datetime64[ns]":
+        return pd.to_datetime(values, errors="coerce").astype("datetime64[ns]")
+
+    return values.astype(dtype)
+
+
 def _adapt_dataframe(df, adapter):
-    adapted = pd.DataFrame()
+    src = _SourceColumns(df)
+    columns = {}
 
     for canonical_col, source in adapter.items():
         if isinstance(source, str):
-            adapted[canonical_col] = df[source] if source in df.columns else pd.NA
+            values = df[source] if source in df.columns else pd.NA
         elif callable(source):
-            adapted[canonical_col] = source(df)
+            values = source(src)
         else:
-            adapted[canonical_col] = source
+            values = source
+
+        columns[canonical_col] = _to_canonical(
+            values, INTERIM_CLEAN_COLUMNS[canonical_col], df.index
+        )
+        if isinstance(values, pd.Series):
+            coerced = int((values.notna() & columns[canonical_col].isna()).sum())
+            if coerced:
+                COERCED_TO_NA[canonical_col] = (
+                    COERCED_TO_NA.get(canonical_col, 0) + coerced
+                )
 
-    return adapted
+    return pd.DataFrame(columns, index=df.index)
 
 
 def adapt_dataframes(dfs, adapters):
@@ -1,5 +1,20 @@
 import pandas as pd
 
 
+def _unify_categories(dfs):
+    # При разных категориях pd.concat выдал бы object — приводим к общему набору
+    for col in dfs[0].columns:
+        if not all(isinstance(df[col].dtype, pd.CategoricalDtype) for df in dfs):
+            continue
+
+        categories = sorted(
+            set().union(*(df[col].cat.categories for df in dfs)), key=str
+        )
+        for df in dfs:
+            df[col] = df[col].cat.set_categories(categories)
+
+    return dfs
+
+
 def concat_dfs(dfs):
-    return pd.concat(dfs, ignore_index=True)
+    return pd.concat(_unify_categories(dfs), ignore_index=True)
@@ -1,4 +1,58 @@
+import hashlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pv
+import pyarrow.parquet as pq
+import yaml
+
+from src.clean.adapters import source_columns
+
+
+RAW_SOURCES = [
+    "data/raw/Dataset_SCO_KVM_MONS_GRC_IZD_DMA_MTK_20250805.csv",
+    "data/raw/Etagi_secondary_classified_dataset_20250805.csv",
+    "data/raw/Etagi_secondary_dataset_20250805.csv",
+    "data/raw/msk_united_geo_market_deals.parquet",
+    "data/raw/msk_houses_deals_ds.csv",
+]
+
+# Канонические колонки, которые адаптер берет из источника как есть (без lambda)
+# и которые дальше кастуются в число без coerce. Остальные колонки читаются
+# строками: адаптеры и normalize_datasets сами приводят их через errors="coerce".
+DIRECT_NUMERIC_COLUMNS = {"area", "build_year"}
+
+RAW_CACHE_DIR = "data/cache/raw"
+# Версия формата кэша: меняется вместе с правилами чтения CSV, чтобы
+# persist-кэш, записанный по старым правилам, не читался
+RAW_CACHE_VERSION = 2
+
+# Строки, которые pd.read_csv по умолчанию читает как NaN
+CSV_NULL_VALUES = [
+    "",
+    "#N/A",
+    "#N/A N/A",
+    "#NA",
+    "-1.#IND",
+    "-1.#QNAN",
+    "-NaN",
+    "-nan",
+    "1.#IND",
+    "1.#QNAN",
+    "<NA>",
+    "N/A",
+    "NA",
+    "NULL",
+    "NaN",
+    "None",
+    "n/a",
+    "nan",
+    "null",
+]
 
 
 # def _read_msk_houses_deals():
@@ -18,3 +72,159 @@ def read_dfs():
     # df5 = _read_msk_houses_deals()
 
     return [df1, df2, df3, df4, df5]
+
+
+def source_column_types(adapter):
+    direct_numeric = {
+        source
+        for canonical_col, source in adapter.items()
+        if isinstance(source, str) and canonical_col in DIRECT_NUMERIC_COLUMNS
+    }
+
+    return {
+        col: pa.float64() if col in direct_numeric else pa.string()
+        for col in source_columns(adapter)
+    }
+
+
+def _dvc_md5(path):
+    dvc_file = Path(f"{path}.dvc")
+    if not dvc_file.exists():
+        return None
+
+    with open(dvc_file) as f:
+        outs = yaml.safe_load(f).get("outs") or []
+
+    return outs[0].get("md5") if outs else None
+
+
+def source_fingerprint(path):
+    """Отпечаток содержимого источника: md5 из .dvc, вне DVC — путь, размер и mtime."""
+    md5 = _dvc_md5(path)
+    if md5 is not None:
+        return md5
+
+    stat = os.stat(path)
+    return f"{path}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def _raw_cache_path(path, column_types, cache_dir):
+    # Ключ: md5 исходника из .dvc + набор/типы колонок, которые нужны адаптеру
+    md5 = _dvc_md5(path)
+    if md5 is None:
+        return None
+
+    columns_key = hashlib.md5(
+        repr(
+            (RAW_CACHE_VERSION, sorted((col, str(t)) for col, t in column_types.items()))
+        ).encode()
+    ).hexdigest()[:8]
+
+    return Path(cache_dir) / f"{Path(path).stem}_{md5}_{columns_key}.parquet"
+
+
+def _write_raw_cache(table, cache_path):
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+
+    # Старые версии того же источника больше не понадобятся
+    stem = cache_path.name.rsplit("_", 2)[0]
+    for stale in cache_path.parent.glob(f"{stem}_*.parquet"):
+        if stale.name.rsplit("_", 2)[0] == stem:
+            stale.unlink()
+
+    tmp_path = cache_path.with_suffix(".tmp")
+    pq.write_table(table, tmp_path)
+    tmp_path.replace(cache_path)
+
+
+def present_columns(column_types, names):
+    """Колонки адаптера, которые есть в файле (в порядке column_types)."""
+    return [col for col in column_types if col in names]
+
+
+def csv_convert_options(path, column_types):
+    # Пустые ячейки и "NA"/"null"/... — null, как NaN у pd.read_csv,
+    # в том числе в строковых колонках
+    return pv.ConvertOptions(
+        include_columns=present_columns(column_types, pv.open_csv(path).schema.names),
+        column_types=column_types,
+        null_values=CSV_NULL_VALUES,
+        strings_can_be_null=True,
+    )
+
+
+def _read_csv(path, column_types):
+    return pv.read_csv(
+        path,
+        read_options=pv.ReadOptions(use_threads=True),
+        convert_options=csv_convert_options(path, column_types),
+    )
+
+
+def _read_source(path, column_types, cache_dir=None):
+    start = time.perf_counter()
+    cached = False
+
+    if path.endswith(".parquet"):
+        # В parquet типы уже заданы — достаточно проекции
+        table = pq.read_table(
+            path,
+            columns=present_columns(column_types, pq.read_schema(path).names),
+            use_threads=True,
+        )
+    else:
+        cache_path = (
+            _raw_cache_path(path, column_types, cache_dir) if cache_dir else None
+        )
+
+        if cache_path is not None and cache_path.exists():
+            table = pq.read_table(cache_path, memory_map=True)
+            cached = True
+        else:
+            table = _read_csv(path, column_types)
+            if cache_path is not None:
+                _write_raw_cache(table, cache_path)
+
+    df = table.to_pandas()
+
+    stats = {
+        "path": path,
+        "seconds": time.perf_counter() - start,
+        "file_bytes": os.path.getsize(path),
+        "table_bytes": table.nbytes,
+        "rows": table.num_rows,
+        "columns": table.num_columns,
+        "cached": cached,
+    }
+
+    return df, stats
+
+
+def read_dfs_projected(adapters, paths=RAW_SOURCES, cache_dir=RAW_CACHE_DIR):
+    """
+    Читает только колонки, нужные адаптерам, многопоточным pyarrow-ридером,
+    все источники параллельно. Печатает время и объем чтения по каждому файлу.
+
+    CSV один раз конвертируются в типизированный parquet в cache_dir (ключ —
+    md5 из .dvc-файла источника), дальше читается кэш через memory map.
+    cache_dir=None отключает кэш.
+    """
+    column_types = [source_column_types(adapter) for adapter in adapters]
+
+    with ThreadPoolExecutor(max_workers=len(paths)) as executor:
+        results = list(
+            executor.map(
+                _read_source, paths, column_types, [cache_dir] * len(paths)
+            )
+        )
+
+    for _, stats in results:
+        print(
+            f"{stats['path']}: {stats['seconds']:.1f} s, "
+            f"{stats['file_bytes'] / 2**20:.1f} MB on disk, "
+            f"{stats['table_bytes'] / 2**20:.1f} MB read "
+            f"({stats['rows']:,} rows x {stats['columns']} cols"
+            f"{', from cache' if stats['cached'] else ''})"
+        )
+
+    return [df for df, _ in results]
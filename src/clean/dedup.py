@@ -0,0 +1,139 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+HASH_KEY = "0123456789123456"
+SECOND_HASH_KEY = "fedcba9876543210"
+_PRIME = np.uint64(0x100000001B3)
+
+
+def _hashable(values):
+    # Приводим колонку к типу, не зависящему от того, какие значения в нее попали,
+    # чтобы одинаковые строки из разных кусков/источников давали одинаковый хэш
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values  # хэшируются значения категорий, а не коды
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values.astype("datetime64[ns]")
+    if pd.api.types.is_bool_dtype(values) or pd.api.types.is_numeric_dtype(values):
+        # + 0.0 сводит -0.0 к 0.0, а NaN с любыми битами — к одному NaN:
+        # duplicated() считает такие значения равными, хэш тоже должен
+        floats = values.to_numpy(dtype=np.float64, na_value=np.nan) + 0.0
+        floats[np.isnan(floats)] = np.nan
+        return pd.Series(floats, index=values.index)
+    if not (pd.api.types.is_string_dtype(values) and values.dtype != object):
+        values = values.astype("string")
+    # Строки хэшируем через категории: каждый уникальный адрес хэшируется один
+    # раз, а хэш категориальной колонки совпадает с хэшем исходных строк
+    return values.astype("category")
+
+
+def row_hashes(df, rows=None, hash_key=HASH_KEY):
+    """
+    uint64-хэш строки по всем колонкам df (только по позициям rows, если заданы).
+    Колонки хэшируются по одной, так что в памяти держится максимум одна колонка.
+    """
+    n = len(df) if rows is None else len(rows)
+    hashes = np.zeros(n, dtype=np.uint64)
+
+    for col in df.columns:
+        values = df[col] if rows is None else df[col].iloc[rows]
+        col_hashes = pd.util.hash_pandas_object(
+            _hashable(values), index=False, hash_key=hash_key
+        ).to_numpy()
+        hashes = (hashes ^ col_hashes) * _PRIME
+
+    return hashes
+
+
+def first_occurrence(df, rows=None):
+    """
+    Маска первых вхождений строк df (среди позиций rows, если заданы) — то же,
+    что ~df.duplicated(). Дубликаты ищутся по uint64-ключу; строки с
+    совпавшими хэшами перепроверяются точным сравнением, так что коллизии
+    не приводят к потере строк.
+    """
+    hashes = pd.Series(row_hashes(df, rows))
+
+    keep = ~hashes.duplicated().to_numpy()
+
+    candidates = np.flatnonzero(hashes.duplicated(keep=False).to_numpy())
+    if len(candidates) > 0:
+        candidate_rows = candidates if rows is None else np.asarray(rows)[candidates]
+        keep[candidates] = ~df.iloc[candidate_rows].duplicated().to_numpy()
+
+    return keep
+
+
+class SeenRows:
+    """
+    Множество уже встреченных строк для потоковой дедупликации: отсортированный
+    массив 128-битных ключей (два независимых uint64-хэша). Строк между кусками
+    не хранится, поэтому вместо точного сравнения — второй хэш.
+
+    path — файл .npz с ключами строк и отпечатками источников прошлого запуска
+    (save() пишет туда состояние текущего). Прошлые ключи применяются только
+    к источникам, которых в прошлом запуске не было: так новая выгрузка
+    дедуплицируется относительно прошлых, а повторный запуск на тех же
+    источниках дает тот же результат, что и без состояния.
+    """
+
+    KEY_DTYPE = np.dtype([("h1", "<u8"), ("h2", "<u8")])
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path is not None else None
+        self.keys = np.empty(0, dtype=self.KEY_DTYPE)
+        self.sources = []
+
+        self.previous = np.empty(0, dtype=self.KEY_DTYPE)
+        self.previous_sources = set()
+        if self.path is not None and self.path.exists():
+            with np.load(self.path) as state:
+                self.previous = state["keys"]
+                self.previous_sources = set(state["sources"].tolist())
+
+        self._check_previous = False
+
+    def start_source(self, fingerprint):
+        """Следующие куски — из источника с отпечатком fingerprint."""
+        self.sources.append(fingerprint)
+        self._check_previous = fingerprint not in self.previous_sources
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _keys(self, df, rows):
+        keys = np.empty(len(df) if rows is None else len(rows), dtype=self.KEY_DTYPE)
+        keys["h1"] = row_hashes(df, rows)
+        keys["h2"] = row_hashes(df, rows, hash_key=SECOND_HASH_KEY)
+        return keys
+
+    def first_occurrence(self, df, rows=None):
+        # Внутри куска — точная дедупликация, между кусками — по ключу
+        keep = first_occurrence(df, rows)
+        keys = self._keys(df, rows)
+
+        keep &= ~_isin(keys, self.keys)
+        if self._check_previous:
+            keep &= ~_isin(keys, self.previous)
+
+        # self.keys отсортирован: новые ключи вливаются вставкой, без пересортировки
+        new_keys = np.unique(keys[keep])
+        self.keys = np.insert(self.keys, np.searchsorted(self.keys, new_keys), new_keys)
+
+        return keep
+
+    def save(self):
+        """Ключи строк, прошедших дедупликацию в этом запуске, и его источники."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "wb") as f:
+            np.savez(f, keys=self.keys, sources=np.array(self.sources, dtype=str))
+        tmp_path.replace(self.path)
+
+
+def _isin(keys, sorted_keys):
+    pos = np.searchsorted(sorted_keys, keys)
+    found = pos < len(sorted_keys)
+    found[found] = sorted_keys[pos[found]] == keys[found]
+    return found
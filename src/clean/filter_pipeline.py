@@ -0,0 +1,55 @@
+import json
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+
+
+@dataclass(frozen=True)
+class FilterStep:
+    """
+    Шаг фильтрации в apply_filters.
+
+    predicate(df) -> bool-маска по всем строкам df (True — строка остается).
+    Для staged=True вызывается predicate(df, mask): шаг зависит от того, какие
+    строки уже отсеяны (перцентиль цены, дедупликация).
+    """
+
+    name: str
+    predicate: Callable
+    staged: bool = False
+
+
+def apply_filters(df, steps, columns=None):
+    """
+    Вычисляет все шаги в одну общую маску и материализует результат один раз.
+    Возвращает (отфильтрованный df, отчет по отброшенным строкам).
+    """
+    mask = np.ones(len(df), dtype=bool)
+    report = {"rows_in": len(df), "steps": {}}
+
+    for step in steps:
+        keep = step.predicate(df, mask) if step.staged else step.predicate(df)
+
+        rows_before = int(mask.sum())
+        mask &= np.asarray(keep, dtype=bool)
+        rows_after = int(mask.sum())
+
+        report["steps"][step.name] = {
+            "dropped": rows_before - rows_after,
+            "rows_after": rows_after,
+        }
+
+    report["rows_out"] = int(mask.sum())
+
+    if columns is None:
+        columns = df.columns
+
+    return df.loc[mask, columns].reset_index(drop=True), report
+
+
+def write_filter_report(report, path):
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
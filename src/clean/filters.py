@@ -1,6 +1,9 @@
+import numpy as np
 from pandas import DataFrame
 import pandas as pd
 
+from src.clean.dedup import first_occurrence
+
 
 def drop_nan_rows(df):
     return df.dropna(how="all")
@@ -69,8 +72,81 @@ def filter_by_build_year(df, min_value, max_value):
 
 
 def drop_duplicates(df):
-    return df.drop_duplicates()
+    return df.loc[first_occurrence(df)]
 
 
 def select_residential(df):
     return df[df["housing_type"] == "residential"].drop(columns=["housing_type"])
+
+
+# ==========================================
+# Маски для apply_filters: строка остается, если True.
+# Числовые сравнения делаются в тех же типах, что и после cast_types
+# (float32), чтобы граничные значения отсекались так же, как в цепочке выше.
+# ==========================================
+def residential_mask(df):
+    return (df["housing_type"] == "residential").to_numpy()
+
+
+def first_occurrence_mask(df, mask):
+    # duplicated() считается только среди строк, прошедших предыдущие шаги.
+    # housing_type не участвует: select_residential удаляет ее до drop_duplicates
+    keep = np.ones(len(df), dtype=bool)
+    rows = np.flatnonzero(mask)
+    keep[rows] = first_occurrence(df.drop(columns=["housing_type"]), rows)
+    return keep
+
+
+def not_all_nan_mask(df, ignore=("housing_type",)):
+    all_nan = np.ones(len(df), dtype=bool)
+    for col in df.columns:
+        if col not in ignore:
+            all_nan &= df[col].isna().to_numpy()
+    return ~all_nan
+
+
+def notna_mask(df, columns):
+    keep = np.ones(len(df), dtype=bool)
+    for col in columns:
+        keep &= df[col].notna().to_numpy()
+    return keep
+
+
+def range_mask(df, col, min_value, max_value, dtype=None):
+    values = df[col] if dtype is None else df[col].astype(dtype)
+    return ((values >= min_value) & (values <= max_value)).to_numpy(
+        dtype=bool, na_value=False
+    )
+
+
+def price_quantile_mask(df, mask, q=0.99):
+    price = df["price"].astype("float32")
+    return (price <= price[mask].quantile(q)).to_numpy()
+
+
+def build_year_mask(df, min_value, max_value):
+    # Повторяет filter_by_build_year, который сравнивает колонку price
+    price = df["price"].astype("float32")
+    keep = np.ones(len(df), dtype=bool)
+    if min_value is not None:
+        keep &= (price >= min_value).to_numpy()
+    if max_value is not None:
+        keep &= (price <= max_value).to_numpy()
+    return keep
+
+
+def address_len_mask(df, min_len):
+    lengths = df["address"].astype("string").str.len()
+    return (lengths >= min_len).to_numpy(dtype=bool, na_value=False)
+
+
+def common_moscow_geo_point_mask(df, longitude, latitude):
+    return ~(
+        (df["longitude"].astype("float32") == longitude)
+        & (df["latitude"].astype("float32") == latitude)
+    ).to_numpy()
+
+
+def after_2017_mask(df, date_col):
+    dates = pd.to_datetime(df[date_col], errors="coerce")
+    return (dates > "2017-12-31").to_numpy()
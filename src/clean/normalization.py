@@ -25,31 +25,49 @@ FLAT_TYPE_MAP = {
 }
 
 
-def _assign_housing_type(flat_type):
-    if pd.isna(flat_type):
-        return pd.NA
-    if flat_type in ["flat", "studio"]:
-        return "residential"
-    elif flat_type in ["parking", "storage", "office"]:
-        return "non_residential"
-    return pd.NA
+HOUSING_TYPE_MAP = {
+    "flat": "residential",
+    "studio": "residential",
+    "parking": "non_residential",
+    "storage": "non_residential",
+    "office": "non_residential",
+}
+
+
+def _map_categories(values, mapping):
+    """
+    То же, что values.map(mapping).astype("category"), но mapping применяется
+    к уникальным значениям, а строки получают только перекодированные коды.
+    Значения не из mapping и NA становятся NA.
+    """
+    codes, uniques = pd.factorize(values)
+    mapped = pd.Series(uniques).map(mapping)
+
+    categories = pd.Index(np.sort(mapped.dropna().unique().astype(object)))
+    # Последний элемент — код для NA (factorize отдает для него -1)
+    recode = np.append(categories.get_indexer(mapped), -1)
+
+    return pd.Series(
+        pd.Categorical.from_codes(recode[codes], categories=categories),
+        index=values.index,
+    )
 
 
 def normalize_datasets(dfs):
     for df in dfs:
         if "balcony" in df.columns:
             df["balcony"] = pd.to_numeric(df["balcony"], errors="coerce")
-            df["balcony"] = df["balcony"].fillna(0) > 0
+            df["balcony"] = (df["balcony"].fillna(0) > 0).astype("UInt8")
 
         if "flat_type" in df.columns:
-            df["flat_type"] = df["flat_type"].map(FLAT_TYPE_MAP)
+            df["flat_type"] = _map_categories(df["flat_type"], FLAT_TYPE_MAP)
             df.loc[df["flat_type"] == "studio", "room_count"] = 0
 
-        df["housing_type"] = df["flat_type"].apply(_assign_housing_type)
+        df["housing_type"] = _map_categories(df["flat_type"], HOUSING_TYPE_MAP)
 
     for df in dfs:
         if "date" in df.columns:
-            df["date"] = pd.to_datetime(df["date"], errors="coerce")
+            # Даты уже разобраны адаптерами по форматам источников
             df["date"] = df["date"].dt.normalize()
 
     return dfs
@@ -0,0 +1,209 @@
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pv
+import pyarrow.parquet as pq
+
+from src.clean.adapters import _adapt_dataframe
+from src.clean.constants import INTERIM_CLEAN_COLUMNS
+from src.clean.data_loader import (
+    _raw_cache_path,
+    csv_convert_options,
+    present_columns,
+    source_column_types,
+    source_fingerprint,
+)
+from src.clean.dedup import SeenRows
+from src.clean.normalization import normalize_datasets
+from src.clean.type_casting import cast_types
+from src.sketch import QuantileSketch
+
+ARROW_TYPES = {
+    "string": pa.string(),
+    "float32": pa.float32(),
+    "UInt8": pa.uint8(),
+    "Int16": pa.int16(),
+    "UInt16": pa.uint16(),
+    "category": pa.dictionary(pa.int32(), pa.string()),
+    "datetime64[ns]": pa.timestamp("ns"),
+    "uint16": pa.uint16(),
+    "uint8": pa.uint8(),
+}
+
+
+def arrow_schema(columns, dtypes):
+    # Схема с pandas-метаданными, чтобы read_parquet вернул те же dtypes (UInt8, string, ...)
+    schema = pa.schema([(col, ARROW_TYPES[dtypes[col]]) for col in columns])
+    empty = pd.DataFrame({col: pd.Series(dtype=dtypes[col]) for col in columns})
+    return pa.Table.from_pandas(empty, schema=schema, preserve_index=False).schema
+
+
+def iter_source_batches(path, adapter, csv_block_mb, parquet_batch_rows, cache_dir):
+    """Отдает источник кусками в виде pandas DataFrame, читая только нужные колонки."""
+    column_types = source_column_types(adapter)
+
+    cache_path = _raw_cache_path(path, column_types, cache_dir) if cache_dir else None
+    if path.endswith(".parquet") or (cache_path is not None and cache_path.exists()):
+        parquet_file = pq.ParquetFile(path if path.endswith(".parquet") else cache_path)
+        batches = parquet_file.iter_batches(
+            batch_size=parquet_batch_rows,
+            columns=present_columns(column_types, parquet_file.schema_arrow.names),
+        )
+    else:
+        batches = pv.open_csv(
+            path,
+            read_options=pv.ReadOptions(block_size=csv_block_mb * 2**20),
+            convert_options=csv_convert_options(path, column_types),
+        )
+
+    for batch in batches:
+        yield batch.to_pandas()
+
+
+def _count(report, step_name, rows_before, keep):
+    entry = report["steps"].setdefault(step_name, {"dropped": 0, "rows_after": 0})
+    rows_after = int(keep.sum())
+    entry["dropped"] += rows_before - rows_after
+    entry["rows_after"] += rows_after
+    return rows_after
+
+
+def _apply_row_local(df, steps, report, seen=None):
+    mask = np.ones(len(df), dtype=bool)
+    rows = len(df)
+
+    for step in steps:
+        if step.name == "drop_duplicates":
+            keep = np.zeros(len(df), dtype=bool)
+            idx = np.flatnonzero(mask)
+            keep[idx] = seen.first_occurrence(df.drop(columns=["housing_type"]), idx)
+        elif step.staged:
+            raise ValueError(f"Шаг {step.name} нельзя выполнить по кускам")
+        else:
+            keep = step.predicate(df)
+
+        mask &= keep
+        rows = _count(report, step.name, rows, mask)
+
+    return mask
+
+
+def run_streaming_clean(
+    paths,
+    adapters,
+    steps,
+    output_path,
+    dropped_columns,
+    price_min,
+    price_max,
+    csv_block_mb=64,
+    parquet_batch_rows=500_000,
+    quantile_bins=4096,
+    cache_dir=None,
+    dedup_state_path=None,
+):
+    """
+    Потоковый вариант clean: adapter -> normalize -> row-local фильтры -> cast
+    по кускам с записью parquet row group'ами. Между кусками живут только
+    множество хэшей для дедупликации и гистограмма цен для 99-го перцентиля.
+
+    Проход 1 пишет строки, прошедшие шаги до перцентиля, во временный parquet.
+    Проход 2 читает из него только колонку price, чтобы получить точный
+    перцентиль внутри бина гистограммы. Проход 3 применяет оставшиеся шаги.
+
+    dedup_state_path — состояние дедупликации прошлого запуска (SeenRows):
+    строки новых источников, встреченные в прошлом запуске, отбрасываются
+    как дубликаты. Источники прошлого запуска с ним не сравниваются.
+    """
+    quantile_idx = next(
+        i for i, step in enumerate(steps) if step.name == "filter_by_price_quantile"
+    )
+    pre_steps, post_steps = steps[:quantile_idx], steps[quantile_idx + 1 :]
+
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = output_path.with_suffix(".pre_quantile.parquet")
+
+    seen = SeenRows(dedup_state_path)
+    sketch = QuantileSketch(price_min, price_max, quantile_bins)
+    report = {"rows_in": 0, "steps": {}}
+
+    columns = [c for c in adapters[0] if c not in dropped_columns]
+    schema = arrow_schema(columns, INTERIM_CLEAN_COLUMNS)
+
+    # --- проход 1 ---
+    start = time.perf_counter()
+    with pq.ParquetWriter(tmp_path, schema) as writer:
+        for path, adapter in zip(paths, adapters):
+            seen.start_source(source_fingerprint(path))
+            for df in iter_source_batches(
+                path, adapter, csv_block_mb, parquet_batch_rows, cache_dir
+            ):
+                df = _adapt_dataframe(df, adapter)
+                df = normalize_datasets([df])[0]
+                report["rows_in"] += len(df)
+
+                mask = _apply_row_local(df, pre_steps, report, seen)
+
+                df = cast_types(df.loc[mask, columns], INTERIM_CLEAN_COLUMNS)
+                sketch.update(df["price"])
+
+                writer.write_table(
+                    pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+                )
+            print(f"{path}: streamed in {time.perf_counter() - start:.1f} s")
+
+    # --- проход 2: точный перцентиль внутри найденных бинов ---
+    def read_values(lo_bin, hi_bin):
+        values = []
+        for batch in pq.ParquetFile(tmp_path).iter_batches(
+            batch_size=parquet_batch_rows, columns=["price"]
+        ):
+            price = batch.column("price").to_numpy(zero_copy_only=False)
+            bins = sketch._bins(price)
+            values.append(price[(bins >= lo_bin) & (bins <= hi_bin)])
+        return np.concatenate(values)
+
+    price_threshold = sketch.quantile(0.99, read_values)
+
+    # --- проход 3 ---
+    report["rows_out"] = 0
+
+    out_dtypes = {
+        **INTERIM_CLEAN_COLUMNS,
+        "year": "uint16",
+        "month": "uint8",
+        "day": "uint8",
+    }
+    out_schema = arrow_schema(columns + ["year", "month", "day"], out_dtypes)
+
+    with pq.ParquetWriter(output_path, out_schema) as writer:
+        for batch in pq.ParquetFile(tmp_path).iter_batches(
+            batch_size=parquet_batch_rows
+        ):
+            df = batch.to_pandas()
+
+            keep = (df["price"] <= price_threshold).to_numpy()
+            _count(report, "filter_by_price_quantile", len(df), keep)
+
+            df = df.loc[keep]
+            df = df.loc[_apply_row_local(df, post_steps, report)]
+
+            df["year"] = df["date"].dt.year.astype("uint16")
+            df["month"] = df["date"].dt.month.astype("uint8")
+            df["day"] = df["date"].dt.day.astype("uint8")
+
+            report["rows_out"] += len(df)
+            writer.write_table(
+                pa.Table.from_pandas(df, schema=out_schema, preserve_index=False)
+            )
+
+    tmp_path.unlink()
+
+    if dedup_state_path is not None:
+        seen.save()
+
+    return report
@@ -1,8 +1,12 @@
+import argparse
 import gc
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from dataclasses import dataclass
 from typing import Literal
 
-import hdbscan
 import mlflow
 import numpy as np
 import optuna
@@ -11,6 +15,7 @@ import torch
 from catboost import CatBoostRegressor
 from dvc.api import params_show
 from fast_pytorch_kmeans import KMeans as TorchKMeans
+from mlflow.utils.mlflow_tags import MLFLOW_PARENT_RUN_ID
 from sklearn.compose import ColumnTransformer
 from sklearn.metrics import (
     mean_absolute_error,
@@ -19,7 +24,23 @@ from sklearn.metrics import (
     r2_score,
 )
 from sklearn.preprocessing import OneHotEncoder, StandardScaler
+from threadpoolctl import threadpool_limits
 
+from src.experiments.clustering import (
+    AssignmentCache,
+    HDBSCANHierarchy,
+    kmeans_path,
+    spatial_sample,
+)
+from src.experiments.linear_models import (
+    array_key,
+    batched_predict,
+    batched_ridge,
+    elastic_net_cd_path,
+    gram_stats,
+    ridge_path,
+)
+from src.interim.dataset import SPLITS, read_interim_dataset
 from src.wnir.wnir import calculate_and_impute_wnir
 
 # ==========================================
@@ -39,6 +60,28 @@ BASE_CAT_FEATURES = ["administrative_district"]
 DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 print(f"Using device: {DEVICE}")
 
+# Потоки для HDBSCAN и CatBoost; в процессах пула — потоки на воркер
+N_JOBS = -1
+
+# HDBSCAN: обучение на spatial_sample из стольких строк train, остальные —
+# approximate_predict; None — на всем train. Согласие с полным fit для
+# выбора размера — src.benchmarks.hdbscan_sample
+HDBSCAN_FIT_SAMPLE = None
+
+# KMeans: fast_pytorch_kmeans рассчитан на GPU, на CPU быстрее sklearn с
+# warm start между k (KMeansPath)
+KMEANS_BACKEND = "torch" if DEVICE.type == "cuda" else "cpu"
+# Опорный k для warm start KMeansPath — середина диапазона n_clusters
+KMEANS_ANCHOR_K = 10
+
+OPTUNA_STORAGE = "sqlite:///optuna.db"
+MLFLOW_TRACKING_URI = "sqlite:///mlflow.db"
+MLFLOW_EXPERIMENT = "Real_Estate_Pricing_Pipelines"
+
+# Метки кластеров по (данные, алгоритм, параметры, seed) — общие для всех
+# study, процессов и перезапусков
+CLUSTER_CACHE = AssignmentCache("data/cache/cluster_labels")
+
 
 # ==========================================
 # 0.5 КОНФИГ ЭКСПЕРИМЕНТА
@@ -97,12 +140,25 @@ class ExpConfig:
 # 1. МОДЕЛИ (RIDGE И ВРАППЕРЫ)
 # ==========================================
 class TorchRidge:
-    def __init__(self, alpha=1.0, device="cuda"):
+    """
+    solver="lstsq" — решение нормальных уравнений на каждый fit;
+    solver="path" — через RidgePath: разложение Gram-матрицы кэшируется
+    по (X, y), и fit с другим alpha стоит O(d²).
+    """
+
+    def __init__(self, alpha=1.0, device="cuda", solver="lstsq"):
         self.alpha = alpha
         self.device = device
+        self.solver = solver
         self.w = None
 
     def fit(self, X, y):
+        if self.solver == "path":
+            W, intercepts = ridge_path(X, y, self.device).coefs([self.alpha])
+            self.w = torch.cat([intercepts, W[:, 0]]).float().view(-1, 1)
+            self.w = torch.nan_to_num(self.w, nan=0.0, posinf=0.0, neginf=0.0)
+            return
+
         X_t = torch.tensor(X, dtype=torch.float32, device=self.device)
         y_t = torch.tensor(y, dtype=torch.float32, device=self.device).view(-1, 1)
 
@@ -177,21 +233,48 @@ class TorchLinearRegression:
 
 
 class TorchElasticNet:
-    """GPU ElasticNet via FISTA. l1_ratio=1.0 -> Lasso, l1_ratio=0.0 -> Ridge-like (no closed form, still iterative)."""
+    """GPU ElasticNet via FISTA. l1_ratio=1.0 -> Lasso, l1_ratio=0.0 -> Ridge-like (no closed form, still iterative).
+
+    solver="cd" — coordinate descent по кэшированной Gram-матрице (O(d²) на
+    итерацию вместо двух проходов по X), с warm start по короткому пути
+    alpha от alpha_max (linear_models.elastic_net_cd_path): решение зависит
+    только от параметров trial'а, не от порядка trials в процессе.
+    """
 
     def __init__(
-        self, alpha=1.0, l1_ratio=0.5, max_iter=1000, tol=1e-5, device="cuda"
+        self, alpha=1.0, l1_ratio=0.5, max_iter=1000, tol=1e-5, device="cuda",
+        solver="fista",
     ):
         self.alpha = float(alpha)
         self.l1_ratio = float(l1_ratio)
         self.max_iter = int(max_iter)
         self.tol = float(tol)
         self.device = device
+        self.solver = solver
         self.w = None
         self.intercept = 0.0
         self._x_mean = None
 
+    def _fit_cd(self, X, y):
+        stats = gram_stats(X, y, self.device)
+        w = elastic_net_cd_path(
+            stats,
+            self.alpha,
+            self.l1_ratio,
+            max_iter=self.max_iter,
+            tol=self.tol,
+        )
+
+        w = torch.tensor(w, device=self.device)
+        self.w = torch.nan_to_num(w, nan=0.0, posinf=0.0, neginf=0.0).float()
+        self.intercept = float(stats.y_mean - stats.x_mean @ w)
+        self._x_mean = stats.x_mean.float()
+
     def fit(self, X, y):
+        if self.solver == "cd":
+            self._fit_cd(X, y)
+            return
+
         X_t = torch.tensor(X, dtype=torch.float32, device=self.device)
         y_t = torch.tensor(y, dtype=torch.float32, device=self.device)
         n, d = X_t.shape
@@ -261,23 +344,28 @@ class TorchElasticNet:
 
 
 class TorchLasso(TorchElasticNet):
-    def __init__(self, alpha=1.0, max_iter=1000, tol=1e-5, device="cuda"):
+    def __init__(
+        self, alpha=1.0, max_iter=1000, tol=1e-5, device="cuda", solver="fista"
+    ):
         super().__init__(
-            alpha=alpha, l1_ratio=1.0, max_iter=max_iter, tol=tol, device=device
+            alpha=alpha, l1_ratio=1.0, max_iter=max_iter, tol=tol, device=device,
+            solver=solver,
         )
 
 
 def get_model(trial, model_type, prefix="1"):
     if model_type == "ridge":
         alpha = trial.suggest_float(f"ridge_alpha{prefix}", 1e-3, 1e3, log=True)
-        return TorchRidge(alpha=alpha, device=DEVICE)
+        return TorchRidge(alpha=alpha, device=DEVICE, solver="path")
     elif model_type == "lasso":
         alpha = trial.suggest_float(f"lasso_alpha{prefix}", 1e-4, 1e2, log=True)
-        return TorchLasso(alpha=alpha, device=DEVICE)
+        return TorchLasso(alpha=alpha, device=DEVICE, solver="cd")
     elif model_type == "elastic_net":
         alpha = trial.suggest_float(f"en_alpha{prefix}", 1e-4, 1e2, log=True)
         l1_ratio = trial.suggest_float(f"en_l1_ratio{prefix}", 0.05, 0.95)
-        return TorchElasticNet(alpha=alpha, l1_ratio=l1_ratio, device=DEVICE)
+        return TorchElasticNet(
+            alpha=alpha, l1_ratio=l1_ratio, device=DEVICE, solver="cd"
+        )
     elif model_type == "ols":
         return TorchLinearRegression(device=DEVICE)
     elif model_type == "catboost":
@@ -288,6 +376,7 @@ def get_model(trial, model_type, prefix="1"):
             "verbose": 0,
             "task_type": "GPU" if torch.cuda.is_available() else "CPU",
             "random_seed": 42,
+            "thread_count": N_JOBS,
         }
         return CatBoostRegressor(**params)
 
@@ -308,13 +397,18 @@ def get_preprocessor():
     )
 
 
-def load_data():
-    df_train = pd.read_parquet("data/interim/wnir_all_train.parquet")
-    df_valid = pd.read_parquet("data/interim/wnir_all_valid.parquet")
-    df_test = pd.read_parquet("data/interim/wnir_all_test.parquet")
-    df_train["date"] = pd.to_datetime(df_train["date"])
-    df_valid["date"] = pd.to_datetime(df_valid["date"])
-    df_test["date"] = pd.to_datetime(df_test["date"])
+def load_data(columns=None, filter=None):
+    """
+    Выборки из data/interim/wnir_all. columns и filter (выражение
+    pyarrow.dataset, например ds.field("market_type") == "primary")
+    проталкиваются в чтение parquet.
+    """
+    df_train, df_valid, df_test = (
+        read_interim_dataset(
+            "data/interim/wnir_all", columns=columns, filter=filter, split=split
+        )
+        for split in SPLITS
+    )
     df_train["set_type"] = "train"
     df_valid["set_type"] = "valid"
     df_test["set_type"] = "test"
@@ -342,46 +436,189 @@ def fit_transform_block(X_tr, X_va):
     return X_tr_s, X_va_s
 
 
+def column_values(df, cols):
+    return df[cols].fillna(0).values.astype(np.float32)
+
+
+def group_rows(labels):
+    """{метка: индексы строк по возрастанию} за одну сортировку вместо маски на метку."""
+    order = np.argsort(labels, kind="stable")
+    values, starts = np.unique(labels[order], return_index=True)
+    return dict(zip(values.tolist(), np.split(order, starts[1:])))
+
+
+class FeatureStore:
+    """
+    Матрицы, не зависящие от гиперпараметров trial, для одной пары
+    (train, valid) и фазы: base-признаки, wnir-блоки, таргеты и proxy-таргеты.
+    Считаются при первом обращении и дальше отдаются всем trials (и всем
+    ExpConfig на тех же данных) как read-only float32-массивы.
+
+    Строковые матрицы — только по primary-строкам, в порядке строк df;
+    primary_masks() переводит позиции df в эти строки.
+    """
+
+    def __init__(self, df_train, df_valid, phase="valid"):
+        self.df_train = df_train.reset_index(drop=True)
+        self.df_valid = df_valid.reset_index(drop=True)
+        self.phase = phase
+        self._cache = {}
+
+    def _cached(self, key, compute):
+        if key not in self._cache:
+            value = compute()
+            for item in value if isinstance(value, tuple) else (value,):
+                if isinstance(item, np.ndarray):
+                    item.setflags(write=False)
+            self._cache[key] = value
+        return self._cache[key]
+
+    def primary_masks(self):
+        return self._cached(
+            "primary",
+            lambda: (
+                (self.df_train["market_type"] == "primary").to_numpy(),
+                (self.df_valid["market_type"] == "primary").to_numpy(),
+            ),
+        )
+
+    def _primary_frames(self):
+        train_primary, valid_primary = self.primary_masks()
+        return self.df_train[train_primary], self.df_valid[valid_primary]
+
+    @property
+    def global_mean_price(self):
+        def compute():
+            train_p, _ = self._primary_frames()
+            return train_p[TARGET].mean()
+
+        return self._cached("global_mean_price", compute)
+
+    def base(self):
+        """(X_train, X_valid, feature_names): preprocessor, обученный на train primary."""
+
+        def compute():
+            train_p, valid_p = self._primary_frames()
+            preprocessor = get_preprocessor()
+            X_tr = preprocessor.fit_transform(train_p).astype(np.float32)
+            X_va = preprocessor.transform(valid_p).astype(np.float32)
+            return X_tr, X_va, get_base_feature_names(preprocessor)
+
+        return self._cached("base", compute)
+
+    def cluster_inputs(self):
+        """Признаки кластеризации по всем строкам (primary + secondary)."""
+
+        def compute():
+            preprocessor = get_preprocessor()
+            X_tr = preprocessor.fit_transform(self.df_train).astype(np.float32)
+            X_va = preprocessor.transform(self.df_valid).astype(np.float32)
+            return X_tr, X_va
+
+        return self._cached("cluster_inputs", compute)
+
+    def cluster_fingerprint(self):
+        """Отпечаток cluster_inputs() — ключ данных в CLUSTER_CACHE."""
+        return self._cached(
+            "cluster_fingerprint", lambda: array_key(*self.cluster_inputs())
+        )
+
+    def hdbscan_hierarchy(self):
+        """Иерархии HDBSCAN по cluster_inputs(), общие для всех trials."""
+
+        def compute():
+            fit_rows = None
+            if HDBSCAN_FIT_SAMPLE is not None:
+                fit_rows = spatial_sample(
+                    self.df_train["longitude"].to_numpy(),
+                    self.df_train["latitude"].to_numpy(),
+                    self.df_train["market_type"].to_numpy(),
+                    HDBSCAN_FIT_SAMPLE,
+                )
+            return HDBSCANHierarchy(
+                *self.cluster_inputs(), core_dist_n_jobs=N_JOBS, fit_rows=fit_rows
+            )
+
+        return self._cached("hdbscan", compute)
+
+    def kmeans_path(self):
+        """KMeansPath по cluster_inputs(): центроиды по k, общие для всех trials."""
+        return self._cached(
+            "kmeans",
+            lambda: kmeans_path(*self.cluster_inputs(), anchor_k=KMEANS_ANCHOR_K),
+        )
+
+    def wnir_cols(self, suffix):
+        return [
+            col
+            for col in self.df_train.columns
+            if col.startswith("wnir_s_") and col.endswith(f"_{suffix}")
+        ]
+
+    def primary_values(self, cols):
+        """cols (колонка или список) по primary-строкам, NaN -> 0."""
+
+        def compute():
+            train_p, valid_p = self._primary_frames()
+            return column_values(train_p, cols), column_values(valid_p, cols)
+
+        key = ("values", cols if isinstance(cols, str) else tuple(cols))
+        return self._cached(key, compute)
+
+    def target(self):
+        def compute():
+            train_p, valid_p = self._primary_frames()
+            return (
+                train_p[TARGET].values.astype(np.float32),
+                valid_p[TARGET].values.astype(np.float32),
+            )
+
+        return self._cached("target", compute)
+
+    def global_step1(self, include_wnir_all):
+        """Вход первой модели objective_global: base [+ отмасштабированный wnir_s_*_all]."""
+
+        def compute():
+            X_tr, X_va, names = self.base()
+            if not include_wnir_all:
+                return X_tr, X_va, names
+
+            s_cols = self.wnir_cols("all")
+            X_tr_s, X_va_s = fit_transform_block(*self.primary_values(s_cols))
+            return np.hstack([X_tr, X_tr_s]), np.hstack([X_va, X_va_s]), names + s_cols
+
+        return self._cached(("global_step1", include_wnir_all), compute)
+
+    def scaled_proxy(self, proxy_col):
+        """(y_train_scaled, y_valid_raw, scaler) proxy-таргета; scaler обучен на train."""
+
+        def compute():
+            y_tr, y_va = self.primary_values(proxy_col)
+            scaler = StandardScaler()
+            y_tr_scaled = scaler.fit_transform(y_tr.reshape(-1, 1)).flatten()
+            return y_tr_scaled, y_va, scaler
+
+        return self._cached(("scaled_proxy", proxy_col), compute)
+
+
 # ==========================================
 # 3. ЦЕЛЕВЫЕ ФУНКЦИИ OPTUNA
 # ==========================================
-def objective_global(
-    trial, df_train, df_valid, preprocessor, cfg: ExpConfig, wnir_params, model_type,
-    phase="valid",
-):
+def objective_global(trial, features, cfg: ExpConfig, wnir_params, model_type):
     torch.manual_seed(42)
     np.random.seed(42)
+    phase = features.phase
 
-    train_p = df_train[df_train["market_type"] == "primary"].copy()
-    valid_p = df_valid[df_valid["market_type"] == "primary"].copy()
-
-    X_train_base = preprocessor.fit_transform(train_p).astype(np.float32)
-    X_valid_base = preprocessor.transform(valid_p).astype(np.float32)
-
-    base_feat_names = get_base_feature_names(preprocessor)
-
-    y_train = train_p[TARGET].values.astype(np.float32)
-    y_valid = valid_p[TARGET].values.astype(np.float32)
+    y_train, y_valid = features.target()
+    X_tr_step1, X_va_step1, feat_names_step1 = features.global_step1(
+        cfg.includes_wnir_all
+    )
 
     metrics = {}
 
     if cfg.mode == "two_stage":
         R = trial.suggest_categorical("R", list(wnir_params["R"].values()))
 
-    if cfg.includes_wnir_all:
-        s_cols = [
-            c for c in train_p.columns if c.startswith("wnir_s_") and c.endswith("_all")
-        ]
-        X_tr_s = train_p[s_cols].fillna(0).values.astype(np.float32)
-        X_va_s = valid_p[s_cols].fillna(0).values.astype(np.float32)
-        X_tr_s, X_va_s = fit_transform_block(X_tr_s, X_va_s)
-        X_tr_step1 = np.hstack([X_train_base, X_tr_s])
-        X_va_step1 = np.hstack([X_valid_base, X_va_s])
-        feat_names_step1 = base_feat_names + s_cols
-    else:
-        X_tr_step1, X_va_step1 = X_train_base, X_valid_base
-        feat_names_step1 = base_feat_names.copy()
-
     if cfg.mode == "direct":
         model = get_model(trial, model_type, prefix="1")
         model.fit(X_tr_step1, y_train)
@@ -390,13 +627,9 @@ def objective_global(
 
     else:  # corrector
         proxy_col = f"wnir_p_value_{R}_{cfg.proxy_suffix}"
-        y_train_proxy = train_p[proxy_col].fillna(0).values.astype(np.float32)
-        y_valid_proxy = valid_p[proxy_col].fillna(0).values.astype(np.float32)
-
-        y_proxy_scaler = StandardScaler()
-        y_tr_proxy_scaled = y_proxy_scaler.fit_transform(
-            y_train_proxy.reshape(-1, 1)
-        ).flatten()
+        y_tr_proxy_scaled, y_valid_proxy, y_proxy_scaler = features.scaled_proxy(
+            proxy_col
+        )
 
         model1 = get_model(trial, model_type, prefix="1")
         model1.fit(X_tr_step1, y_tr_proxy_scaled)
@@ -428,89 +661,344 @@ def objective_global(
     metrics["valid_mape"] = float(mean_absolute_percentage_error(y_valid, preds))
     metrics["valid_r2"] = float(r2_score(y_valid, preds))
 
-    del train_p, valid_p, X_train_base, X_valid_base, X_tr_step1, X_va_step1
     gc.collect()
 
     return metrics
 
 
-def objective_cluster(
-    trial,
-    df_train,
-    df_valid,
-    preprocessor,
-    cfg: ExpConfig,
-    wnir_params,
-    model_type,
-    cluster_algo,
-    phase="valid",
-):
-    torch.manual_seed(42)
-    np.random.seed(42)
+def cluster_wnir_frames(features, train_rows, valid_rows, wnir_params):
+    """
+    WNIR по сделкам одного кластера (train_rows/valid_rows — маски по всем
+    строкам). Возвращает primary-строки кластера с колонками *_cluster
+    в исходном порядке строк — том же, что у матриц FeatureStore.
+    """
+    c_train_all = features.df_train[train_rows].copy()
+    c_valid_all = features.df_valid[valid_rows].copy()
+
+    c_train_all["orig_idx"] = c_train_all.index
+    c_valid_all["orig_idx"] = c_valid_all.index
+    c_combined = pd.concat([c_train_all, c_valid_all], ignore_index=True)
+    c_combined = c_combined.sort_values("date").reset_index(drop=True)
+
+    new_wnir_cluster = calculate_and_impute_wnir(
+        df_group=c_combined,
+        Rs=list(wnir_params["R"].values()),
+        h=wnir_params["h"],
+        batch_size=wnir_params.get("batch_size", 20000),
+        suffix="cluster",
+        device=DEVICE,
+        fill_nearest_threshold=wnir_params["fill_nearest_threshold"],
+    )
 
-    df_train = df_train.reset_index(drop=True).copy()
-    df_valid = df_valid.reset_index(drop=True).copy()
+    new_wnir_cluster = new_wnir_cluster.reset_index(drop=True)
+    c_combined = pd.concat([c_combined, new_wnir_cluster], axis=1)
 
-    global_mean_price = df_train[df_train["market_type"] == "primary"][TARGET].mean()
+    frames = []
+    for set_type in ["train", "valid"]:
+        frame = c_combined[c_combined["set_type"] == set_type]
+        frame = frame.set_index("orig_idx").sort_index()
+        frame.index.name = None
+        frames.append(frame[frame["market_type"] == "primary"])
 
-    # 1. Кластеризация — отдельный preprocessor на primary+secondary
-    cluster_preprocessor = get_preprocessor()
-    X_train_all = cluster_preprocessor.fit_transform(df_train).astype(np.float32)
-    X_valid_all = cluster_preprocessor.transform(df_valid).astype(np.float32)
+    return frames
 
-    # Regression preprocessor — фит на primary, единая шкала с objective_global
-    preprocessor.fit(df_train[df_train["market_type"] == "primary"])
-    base_feat_names = get_base_feature_names(preprocessor)
 
-    if cluster_algo == "kmeans":
-        n_clusters = trial.suggest_int("n_clusters", 3, 20)
-        kmeans = TorchKMeans(
-            n_clusters=n_clusters, mode="euclidean", verbose=0, max_iter=100
+# Модели, которые objective_cluster обучает сразу на всех кластерах
+BATCHED_MODELS = {"ridge", "ols"}
+
+
+@dataclass
+class ClusterBlock:
+    """Готовые к обучению матрицы одного кластера (primary-строки)."""
+
+    va_rows: np.ndarray
+    n_p: int
+    X_tr: np.ndarray
+    X_va: np.ndarray
+    y_tr: np.ndarray
+    y_tr_proxy: np.ndarray | None = None
+    y_va_proxy: np.ndarray | None = None
+
+
+@dataclass
+class ClusterFit:
+    preds: np.ndarray
+    fi1: np.ndarray
+    fi2: np.ndarray | None = None
+    proxy_preds: np.ndarray | None = None  # на сырой шкале proxy-таргета
+
+
+def fit_cluster(trial, block, cfg: ExpConfig, model_type):
+    X_tr_step1, X_va_step1, y_tr = block.X_tr, block.X_va, block.y_tr
+
+    if cfg.mode == "direct":
+        # Проверяем, не одинаковые ли все значения таргета
+        if np.all(y_tr == y_tr[0]):
+            cluster_preds = np.full(len(X_va_step1), y_tr[0], dtype=np.float32)
+            fi = np.zeros(X_tr_step1.shape[1], dtype=np.float32)
+        else:
+            model = get_model(trial, model_type, prefix="1")
+            model.fit(X_tr_step1, y_tr)
+            cluster_preds = model.predict(X_va_step1)
+            fi = model.feature_importances_
+
+        return ClusterFit(cluster_preds, fi)
+
+    y_tr_proxy = block.y_tr_proxy
+
+    # --- МОДЕЛЬ 1 (PROXY) ---
+    if np.all(y_tr_proxy == y_tr_proxy[0]):
+        pred_proxy_va = np.full(
+            (len(X_va_step1), 1), y_tr_proxy[0], dtype=np.float32
         )
-        X_tr_t = torch.tensor(X_train_all, dtype=torch.float32, device=DEVICE)
-        X_va_t = torch.tensor(X_valid_all, dtype=torch.float32, device=DEVICE)
+        pred_proxy_tr_scaled = np.zeros((len(X_tr_step1), 1), dtype=np.float32)
+        pred_proxy_va_scaled = np.zeros((len(X_va_step1), 1), dtype=np.float32)
+        fi1 = np.zeros(X_tr_step1.shape[1], dtype=np.float32)
+    else:
+        y_proxy_scaler = StandardScaler()
+        y_tr_proxy_scaled = y_proxy_scaler.fit_transform(
+            y_tr_proxy.reshape(-1, 1)
+        ).flatten()
 
-        df_train["cluster"] = kmeans.fit_predict(X_tr_t).cpu().numpy()
-        df_valid["cluster"] = kmeans.predict(X_va_t).cpu().numpy()
+        model1 = get_model(trial, model_type, prefix="1")
+        model1.fit(X_tr_step1, y_tr_proxy_scaled)
+        pred_proxy_tr_scaled = model1.predict(X_tr_step1).reshape(-1, 1)
+        pred_proxy_va_scaled = model1.predict(X_va_step1).reshape(-1, 1)
 
-        del X_tr_t, X_va_t, kmeans
-        torch.cuda.empty_cache()
+        # Защита от inf (Ridge на плохо обусловленной X^T X)
+        pred_proxy_tr_scaled = np.nan_to_num(
+            pred_proxy_tr_scaled, nan=0.0, posinf=0.0, neginf=0.0
+        )
+        pred_proxy_va_scaled = np.nan_to_num(
+            pred_proxy_va_scaled, nan=0.0, posinf=0.0, neginf=0.0
+        )
 
-    elif cluster_algo == "hdbscan":
-        min_cluster_size = trial.suggest_int("hdb_min_cluster_size", 15, 300)
-        min_samples = trial.suggest_int("hdb_min_samples", 5, 50)
-
-        clusterer = hdbscan.HDBSCAN(
-            min_cluster_size=min_cluster_size,
-            min_samples=min_samples,
-            prediction_data=True,
-            core_dist_n_jobs=-1,
+        # Unscale для valid_proxy_rmse (хранится на сырой шкале proxy-таргета)
+        pred_proxy_va = y_proxy_scaler.inverse_transform(
+            pred_proxy_va_scaled
+        ).astype(np.float32)
+
+        fi1 = model1.feature_importances_
+
+    X_tr_step2 = np.hstack([X_tr_step1, pred_proxy_tr_scaled])
+    X_va_step2 = np.hstack([X_va_step1, pred_proxy_va_scaled])
+
+    # --- МОДЕЛЬ 2 (ОСНОВНАЯ) ---
+    if np.all(y_tr == y_tr[0]):
+        cluster_preds = np.full(len(X_va_step2), y_tr[0], dtype=np.float32)
+        fi2 = np.zeros(X_tr_step2.shape[1], dtype=np.float32)
+    else:
+        model2 = get_model(trial, model_type, prefix="2")
+        model2.fit(X_tr_step2, y_tr)
+        cluster_preds = model2.predict(X_va_step2)
+        fi2 = model2.feature_importances_
+
+    return ClusterFit(cluster_preds, fi1, fi2, pred_proxy_va.flatten())
+
+
+def fit_clusters_batched(trial, blocks, cfg: ExpConfig, model_type):
+    """
+    То же, что fit_cluster по каждому блоку, но модель каждого шага обучается
+    сразу на всех кластерах: Gram-матрицы кластеров — одним сегментным
+    проходом, системы — одним batched solve (linear_models.batched_ridge).
+    Только для ridge/ols (BATCHED_MODELS).
+    """
+    # alpha — из того же trial-параметра, что и у get_model в fit_cluster
+    alpha1 = getattr(get_model(trial, model_type, prefix="1"), "alpha", 0.0)
+    X_tr = [block.X_tr for block in blocks]
+    X_va = [block.X_va for block in blocks]
+
+    def constant(y):
+        return np.all(y == y[0])
+
+    if cfg.mode == "direct":
+        W = batched_ridge(X_tr, [block.y_tr for block in blocks], alpha1, DEVICE)
+        preds = batched_predict(W, X_va)
+
+        fits = []
+        for i, block in enumerate(blocks):
+            if constant(block.y_tr):
+                fits.append(
+                    ClusterFit(
+                        np.full(len(block.X_va), block.y_tr[0], dtype=np.float32),
+                        np.zeros(block.X_tr.shape[1], dtype=np.float32),
+                    )
+                )
+            else:
+                fits.append(ClusterFit(preds[i], np.abs(W[i, 1:])))
+        return fits
+
+    # --- МОДЕЛЬ 1 (PROXY): таргет масштабируется внутри кластера ---
+    proxy_mean = [block.y_tr_proxy.mean(dtype=np.float64) for block in blocks]
+    proxy_std = [block.y_tr_proxy.std(dtype=np.float64) or 1.0 for block in blocks]
+    y_tr_proxy_scaled = [
+        ((block.y_tr_proxy - mean) / std).astype(np.float32)
+        for block, mean, std in zip(blocks, proxy_mean, proxy_std)
+    ]
+
+    W1 = batched_ridge(X_tr, y_tr_proxy_scaled, alpha1, DEVICE)
+    pred_proxy_tr_scaled = batched_predict(W1, X_tr)
+    pred_proxy_va_scaled = batched_predict(W1, X_va)
+
+    fi1 = []
+    pred_proxy_va = []
+    for i, block in enumerate(blocks):
+        if constant(block.y_tr_proxy):
+            pred_proxy_tr_scaled[i] = np.zeros(len(block.X_tr), dtype=np.float32)
+            pred_proxy_va_scaled[i] = np.zeros(len(block.X_va), dtype=np.float32)
+            pred_proxy_va.append(
+                np.full(len(block.X_va), block.y_tr_proxy[0], dtype=np.float32)
+            )
+            fi1.append(np.zeros(block.X_tr.shape[1], dtype=np.float32))
+            continue
+
+        # Защита от inf (Ridge на плохо обусловленной X^T X)
+        for preds in (pred_proxy_tr_scaled, pred_proxy_va_scaled):
+            preds[i] = np.nan_to_num(preds[i], nan=0.0, posinf=0.0, neginf=0.0)
+        pred_proxy_va.append(
+            (pred_proxy_va_scaled[i] * proxy_std[i] + proxy_mean[i]).astype(np.float32)
         )
-        df_train["cluster"] = clusterer.fit_predict(X_train_all)
+        fi1.append(np.abs(W1[i, 1:]))
+
+    # --- МОДЕЛЬ 2 (ОСНОВНАЯ) ---
+    alpha2 = getattr(get_model(trial, model_type, prefix="2"), "alpha", 0.0)
+    X_tr_step2 = [
+        np.hstack([X, pred[:, None]]) for X, pred in zip(X_tr, pred_proxy_tr_scaled)
+    ]
+    X_va_step2 = [
+        np.hstack([X, pred[:, None]]) for X, pred in zip(X_va, pred_proxy_va_scaled)
+    ]
+
+    W2 = batched_ridge(X_tr_step2, [block.y_tr for block in blocks], alpha2, DEVICE)
+    preds = batched_predict(W2, X_va_step2)
+
+    fits = []
+    for i, block in enumerate(blocks):
+        if constant(block.y_tr):
+            cluster_preds = np.full(len(block.X_va), block.y_tr[0], dtype=np.float32)
+            fi2 = np.zeros(block.X_tr.shape[1] + 1, dtype=np.float32)
+        else:
+            cluster_preds, fi2 = preds[i], np.abs(W2[i, 1:])
+        fits.append(ClusterFit(cluster_preds, fi1[i], fi2, pred_proxy_va[i]))
+    return fits
+
+
+def assign_clusters(trial, features, cluster_algo, seed=42):
+    """
+    Метки кластеров (train, valid) для параметров trial. Зависят только от
+    cluster_inputs() и параметров кластеризации, поэтому берутся из
+    CLUSTER_CACHE, если такая разметка уже считалась.
+    """
+    if cluster_algo == "kmeans":
+        params = {
+            "n_clusters": trial.suggest_int("n_clusters", 3, 20),
+            "mode": "euclidean",
+            "max_iter": 100,
+            "backend": KMEANS_BACKEND,
+        }
+        if KMEANS_BACKEND == "cpu":
+            params["anchor_k"] = KMEANS_ANCHOR_K
+
+        def compute():
+            if KMEANS_BACKEND == "cpu":
+                return features.kmeans_path().labels(params["n_clusters"])
+
+            torch.manual_seed(seed)
+            kmeans = TorchKMeans(
+                n_clusters=params["n_clusters"],
+                mode=params["mode"],
+                max_iter=params["max_iter"],
+                verbose=0,
+            )
+            X_train_all, X_valid_all = features.cluster_inputs()
+            X_tr_t = torch.tensor(X_train_all, dtype=torch.float32, device=DEVICE)
+            X_va_t = torch.tensor(X_valid_all, dtype=torch.float32, device=DEVICE)
+
+            train_labels = kmeans.fit_predict(X_tr_t).cpu().numpy()
+            valid_labels = kmeans.predict(X_va_t).cpu().numpy()
+
+            del X_tr_t, X_va_t, kmeans
+            torch.cuda.empty_cache()
+            return train_labels, valid_labels
+
+    elif cluster_algo == "hdbscan":
+        params = {
+            "min_cluster_size": trial.suggest_int("hdb_min_cluster_size", 15, 300),
+            "min_samples": trial.suggest_int("hdb_min_samples", 5, 50),
+        }
+        if HDBSCAN_FIT_SAMPLE is not None:
+            params["fit_sample"] = HDBSCAN_FIT_SAMPLE
+
+        # Дерево по min_samples строится один раз, новый min_cluster_size —
+        # только новый разрез condensed tree
+        def compute():
+            return features.hdbscan_hierarchy().labels(
+                params["min_cluster_size"], params["min_samples"]
+            )
+
+    train_labels, valid_labels, hit = CLUSTER_CACHE.get_or_compute(
+        features.cluster_fingerprint(), cluster_algo, params, seed, compute
+    )
+    trial.set_user_attr("cluster_cache_hit", hit)
+    mlflow.log_metric("cluster_cache_hit", float(hit))
+    return train_labels, valid_labels
 
-        labels, _ = hdbscan.approximate_predict(clusterer, X_valid_all)
-        df_valid["cluster"] = labels
 
-        del clusterer
+def objective_cluster(
+    trial,
+    features,
+    cfg: ExpConfig,
+    wnir_params,
+    model_type,
+    cluster_algo,
+):
+    torch.manual_seed(42)
+    np.random.seed(42)
+    phase = features.phase
 
-    del X_train_all, X_valid_all
+    global_mean_price = features.global_mean_price
+
+    # Матрицы из FeatureStore: кластеризация (assign_clusters) — отдельный
+    # preprocessor на primary+secondary, регрессия — фит на primary, единая
+    # шкала с objective_global
+    X_tr_base_p, X_va_base_p, base_feat_names = features.base()
+    y_tr_p, y_va_p = features.target()
+    train_primary, valid_primary = features.primary_masks()
+
+    # 1. Кластеризация
+    train_labels, valid_labels = assign_clusters(trial, features, cluster_algo)
     gc.collect()
 
-    unique_clusters = sorted(df_train["cluster"].unique())
+    unique_clusters = np.unique(train_labels)
     # Log actual cluster count — for hdbscan it's the only place this is recorded
     # (params only carry min_cluster_size/min_samples). -1 is HDBSCAN noise.
     mlflow.log_metric(
         "n_clusters_actual", len([c for c in unique_clusters if c != -1])
     )
 
-    # 2. Подготовка массивов для валидации
-    valid_p_idx = df_valid[df_valid["market_type"] == "primary"].index
-    valid_preds = pd.Series(index=valid_p_idx, dtype=np.float32)
+    # 2. Подготовка массивов для валидации (по primary-строкам valid)
+    train_labels_p = train_labels[train_primary]
+    valid_labels_p = valid_labels[valid_primary]
+    valid_preds = np.full(len(y_va_p), np.nan, dtype=np.float32)
+
+    # Строки кластеров — индексы, а не маски: работа на кластер O(его размера).
+    # Крупные кластеры первыми: pruner раньше видит RMSE по большей части valid
+    train_rows_by_cluster = group_rows(train_labels_p)
+    valid_rows_by_cluster = group_rows(valid_labels_p)
+    no_rows = np.empty(0, dtype=np.intp)
+    clusters = sorted(
+        (int(c) for c in unique_clusters),
+        key=lambda c: (
+            -len(valid_rows_by_cluster.get(c, no_rows)),
+            -len(train_rows_by_cluster.get(c, no_rows)),
+        ),
+    )
 
     if cfg.mode == "two_stage":
-        valid_proxy_preds = pd.Series(index=valid_p_idx, dtype=np.float32)
-        valid_proxy_true = pd.Series(index=valid_p_idx, dtype=np.float32)
+        valid_proxy_preds = np.full(len(y_va_p), np.nan, dtype=np.float32)
+        valid_proxy_true = np.full(len(y_va_p), np.nan, dtype=np.float32)
         R = trial.suggest_categorical("R", list(wnir_params["R"].values()))
+        proxy_col = f"wnir_p_value_{R}_{cfg.proxy_suffix}"
 
     fi_accum_step1 = 0
     fi_accum_step2 = 0
@@ -518,93 +1006,104 @@ def objective_cluster(
     feat_names_step1 = None
     feat_names_step2 = None
 
-    # 3. Цикл по уникальным кластерам
-    for cluster_idx, c in enumerate(unique_clusters):
-        c_train_all = df_train[df_train["cluster"] == c].copy()
-        c_valid_all = df_valid[df_valid["cluster"] == c].copy()
+    batched = model_type in BATCHED_MODELS
+    blocks = []
 
-        if cfg.needs_per_cluster_wnir:
-            c_train_all["orig_idx"] = c_train_all.index
-            c_valid_all["orig_idx"] = c_valid_all.index
-            c_combined = pd.concat([c_train_all, c_valid_all], ignore_index=True)
-            c_combined = c_combined.sort_values("date").reset_index(drop=True)
-
-            new_wnir_cluster = calculate_and_impute_wnir(
-                df_group=c_combined,
-                Rs=list(wnir_params["R"].values()),
-                h=wnir_params["h"],
-                batch_size=wnir_params.get("batch_size", 20000),
-                suffix="cluster",
-                device=DEVICE,
-                fill_nearest_threshold=wnir_params["fill_nearest_threshold"],
-            )
+    # Running RMSE для pruner: суммы по уже заполненным строкам valid_preds
+    sse = 0.0
+    n_scored = 0
 
-            new_wnir_cluster = new_wnir_cluster.reset_index(drop=True)
-            c_combined = pd.concat([c_combined, new_wnir_cluster], axis=1)
+    def score(va_rows):
+        nonlocal sse, n_scored
+        err = y_va_p[va_rows].astype(np.float64) - valid_preds[va_rows]
+        sse += float(err @ err)
+        n_scored += len(va_rows)
 
-            c_train_all = c_combined[c_combined["set_type"] == "train"].set_index(
-                "orig_idx"
-            )
-            c_valid_all = c_combined[c_combined["set_type"] == "valid"].set_index(
-                "orig_idx"
+    def record(block, fit):
+        nonlocal fi_accum_step1, fi_accum_step2, total_samples
+
+        fi_accum_step1 += fit.fi1 * block.n_p
+        if cfg.mode == "two_stage":
+            fi_accum_step2 += fit.fi2 * block.n_p
+            valid_proxy_preds[block.va_rows] = fit.proxy_preds
+            valid_proxy_true[block.va_rows] = block.y_va_proxy
+        total_samples += block.n_p
+
+        valid_preds[block.va_rows] = np.nan_to_num(
+            fit.preds,
+            nan=global_mean_price,
+            posinf=global_mean_price,
+            neginf=global_mean_price,
+        )
+        score(block.va_rows)
+
+    # 3. Цикл по кластерам
+    for cluster_idx, c in enumerate(clusters):
+        tr_rows = train_rows_by_cluster.get(c, no_rows)
+        va_rows = valid_rows_by_cluster.get(c, no_rows)
+        n_p = len(tr_rows)
+        n_va = len(va_rows)
+
+        if cfg.needs_per_cluster_wnir:
+            c_train_p, c_valid_p = cluster_wnir_frames(
+                features, train_labels == c, valid_labels == c, wnir_params
             )
-            c_train_all.index.name = None
-            c_valid_all.index.name = None
-            del c_combined, new_wnir_cluster
 
-        c_train_p = c_train_all[c_train_all["market_type"] == "primary"]
-        c_valid_p = c_valid_all[c_valid_all["market_type"] == "primary"]
-        n_p = len(c_train_p)
+        if cfg.mode == "two_stage":
+            if cfg.needs_per_cluster_wnir:
+                y_tr_proxy = column_values(c_train_p, proxy_col)
+                y_va_proxy = column_values(c_valid_p, proxy_col)
+            else:
+                proxy_tr, proxy_va = features.primary_values(proxy_col)
+                y_tr_proxy, y_va_proxy = proxy_tr[tr_rows], proxy_va[va_rows]
 
         # ==========================================
         # ИСПРАВЛЕНИЕ: обработка мелких кластеров и proxy-NaN
         # ==========================================
-        if n_p < 5 or len(c_valid_p) == 0:
-            if len(c_valid_p) > 0:
-                valid_preds.loc[c_valid_p.index] = np.float32(global_mean_price)
+        if n_p < 5 or n_va == 0:
+            if n_va > 0:
+                valid_preds[va_rows] = np.float32(global_mean_price)
+                score(va_rows)
 
                 if cfg.mode == "two_stage":
-                    proxy_col = f"wnir_p_value_{R}_{cfg.proxy_suffix}"
-
-                    y_va_proxy_fallback = (
-                        c_valid_p[proxy_col].fillna(0).values.astype(np.float32)
-                    )
-                    valid_proxy_true.loc[c_valid_p.index] = y_va_proxy_fallback
+                    valid_proxy_true[va_rows] = y_va_proxy
 
                     fallback_pred = (
-                        np.nanmean(y_va_proxy_fallback)
-                        if len(y_va_proxy_fallback) > 0
-                        else 0.0
+                        np.nanmean(y_va_proxy) if len(y_va_proxy) > 0 else 0.0
                     )
                     if np.isnan(fallback_pred):
                         fallback_pred = 0.0
-                    valid_proxy_preds.loc[c_valid_p.index] = np.float32(fallback_pred)
+                    valid_proxy_preds[va_rows] = np.float32(fallback_pred)
             continue
         # ==========================================
 
-        X_tr_base = preprocessor.transform(c_train_p).astype(np.float32)
-        X_va_base = preprocessor.transform(c_valid_p).astype(np.float32)
-        y_tr = c_train_p[TARGET].values.astype(np.float32)
+        X_tr_base = X_tr_base_p[tr_rows]
+        X_va_base = X_va_base_p[va_rows]
+        y_tr = y_tr_p[tr_rows]
 
         # 4. Формирование фичей
         extra_cols = []
+        extra_tr, extra_va = [], []
         if cfg.includes_wnir_all:
-            extra_cols.extend(
-                col
-                for col in c_train_p.columns
-                if col.startswith("wnir_s_") and col.endswith("_all")
-            )
+            cols = features.wnir_cols("all")
+            values_tr, values_va = features.primary_values(cols)
+            extra_cols.extend(cols)
+            extra_tr.append(values_tr[tr_rows])
+            extra_va.append(values_va[va_rows])
         if cfg.includes_wnir_cluster:
-            extra_cols.extend(
+            cols = [
                 col
                 for col in c_train_p.columns
                 if col.startswith("wnir_s_") and col.endswith("_cluster")
-            )
+            ]
+            extra_cols.extend(cols)
+            extra_tr.append(column_values(c_train_p, cols))
+            extra_va.append(column_values(c_valid_p, cols))
 
         if extra_cols:
-            X_tr_extra = c_train_p[extra_cols].fillna(0).values.astype(np.float32)
-            X_va_extra = c_valid_p[extra_cols].fillna(0).values.astype(np.float32)
-            X_tr_extra, X_va_extra = fit_transform_block(X_tr_extra, X_va_extra)
+            X_tr_extra, X_va_extra = fit_transform_block(
+                np.hstack(extra_tr), np.hstack(extra_va)
+            )
             X_tr_step1 = np.hstack([X_tr_base, X_tr_extra])
             X_va_step1 = np.hstack([X_va_base, X_va_extra])
             if feat_names_step1 is None:
@@ -614,127 +1113,34 @@ def objective_cluster(
             if feat_names_step1 is None:
                 feat_names_step1 = base_feat_names.copy()
 
-        # 5. Обучение моделей
-        if cfg.mode == "direct":
-            # Проверяем, не одинаковые ли все значения таргета
-            if np.all(y_tr == y_tr[0]):
-                cluster_preds = np.full(len(X_va_step1), y_tr[0], dtype=np.float32)
-                fi = np.zeros(X_tr_step1.shape[1], dtype=np.float32)
-            else:
-                model = get_model(trial, model_type, prefix="1")
-                model.fit(X_tr_step1, y_tr)
-                cluster_preds = model.predict(X_va_step1)
-                fi = model.feature_importances_
-
-            fi_accum_step1 += fi * n_p
-            total_samples += n_p
-
-        else:
-            proxy_col = f"wnir_p_value_{R}_{cfg.proxy_suffix}"
-
-            y_tr_proxy = c_train_p[proxy_col].fillna(0).values.astype(np.float32)
-            y_va_proxy = c_valid_p[proxy_col].fillna(0).values.astype(np.float32)
+        block = ClusterBlock(va_rows, n_p, X_tr_step1, X_va_step1, y_tr)
+        if cfg.mode == "two_stage":
+            block.y_tr_proxy, block.y_va_proxy = y_tr_proxy, y_va_proxy
 
-            # --- МОДЕЛЬ 1 (PROXY) ---
-            if np.all(y_tr_proxy == y_tr_proxy[0]):
-                pred_proxy_tr = np.full(
-                    (len(X_tr_step1), 1), y_tr_proxy[0], dtype=np.float32
-                )
-                pred_proxy_va = np.full(
-                    (len(X_va_step1), 1), y_tr_proxy[0], dtype=np.float32
-                )
-                pred_proxy_tr_scaled = np.zeros(
-                    (len(X_tr_step1), 1), dtype=np.float32
-                )
-                pred_proxy_va_scaled = np.zeros(
-                    (len(X_va_step1), 1), dtype=np.float32
-                )
-                fi1 = np.zeros(X_tr_step1.shape[1], dtype=np.float32)
-            else:
-                y_proxy_scaler = StandardScaler()
-                y_tr_proxy_scaled = y_proxy_scaler.fit_transform(
-                    y_tr_proxy.reshape(-1, 1)
-                ).flatten()
-
-                model1 = get_model(trial, model_type, prefix="1")
-                model1.fit(X_tr_step1, y_tr_proxy_scaled)
-                pred_proxy_tr_scaled = model1.predict(X_tr_step1).reshape(-1, 1)
-                pred_proxy_va_scaled = model1.predict(X_va_step1).reshape(-1, 1)
-
-                # Защита от inf (Ridge на плохо обусловленной X^T X)
-                pred_proxy_tr_scaled = np.nan_to_num(
-                    pred_proxy_tr_scaled, nan=0.0, posinf=0.0, neginf=0.0
-                )
-                pred_proxy_va_scaled = np.nan_to_num(
-                    pred_proxy_va_scaled, nan=0.0, posinf=0.0, neginf=0.0
-                )
-
-                # Unscale для valid_proxy_rmse (хранится на сырой шкале proxy-таргета)
-                pred_proxy_tr = y_proxy_scaler.inverse_transform(
-                    pred_proxy_tr_scaled
-                ).astype(np.float32)
-                pred_proxy_va = y_proxy_scaler.inverse_transform(
-                    pred_proxy_va_scaled
-                ).astype(np.float32)
-
-                fi1 = model1.feature_importances_
-
-            X_tr_step2 = np.hstack([X_tr_step1, pred_proxy_tr_scaled])
-            X_va_step2 = np.hstack([X_va_step1, pred_proxy_va_scaled])
-            if feat_names_step2 is None:
-                feat_names_step2 = feat_names_step1 + ["proxy_prediction"]
-
-            # --- МОДЕЛЬ 2 (ОСНОВНАЯ) ---
-            if np.all(y_tr == y_tr[0]):
-                cluster_preds = np.full(len(X_va_step2), y_tr[0], dtype=np.float32)
-                fi2 = np.zeros(X_tr_step2.shape[1], dtype=np.float32)
-            else:
-                model2 = get_model(trial, model_type, prefix="2")
-                model2.fit(X_tr_step2, y_tr)
-                cluster_preds = model2.predict(X_va_step2)
-                fi2 = model2.feature_importances_
-
-            # ==========================================
-            # ИСПРАВЛЕНИЕ: строгое приведение типов (убирает FutureWarning)
-            # ==========================================
-            valid_proxy_preds.loc[c_valid_p.index] = pred_proxy_va.flatten().astype(
-                np.float32
-            )
-            valid_proxy_true.loc[c_valid_p.index] = y_va_proxy.astype(np.float32)
-            # ==========================================
-
-            fi_accum_step1 += fi1 * n_p
-            fi_accum_step2 += fi2 * n_p
-            total_samples += n_p
-
-        cluster_preds = np.nan_to_num(
-            cluster_preds,
-            nan=global_mean_price,
-            posinf=global_mean_price,
-            neginf=global_mean_price,
-        )
+        if batched:
+            blocks.append(block)
+            continue
 
-        # ==========================================
-        # ИСПРАВЛЕНИЕ: строгое приведение типов
-        # ==========================================
-        valid_preds.loc[c_valid_p.index] = cluster_preds.astype(np.float32)
-        # ==========================================
+        # 5. Обучение моделей
+        record(block, fit_cluster(trial, block, cfg, model_type))
 
         # Pruner: running RMSE на уже обработанных valid-точках.
         # Только во время HPO (phase == "valid"), не на финальном test-replay.
-        if phase == "valid":
-            processed = valid_preds.dropna()
-            if len(processed) > 0:
-                y_true_so_far = df_valid.loc[processed.index, TARGET].values.astype(
-                    np.float32
-                )
-                y_pred_so_far = processed.values.astype(np.float32)
-                running_rmse = float(
-                    np.sqrt(mean_squared_error(y_true_so_far, y_pred_so_far))
-                )
-                trial.report(running_rmse, step=cluster_idx)
-                if trial.should_prune():
-                    raise optuna.TrialPruned()
+        if phase == "valid" and n_scored > 0:
+            running_rmse = float(np.sqrt(sse / n_scored))
+            trial.report(running_rmse, step=cluster_idx)
+            if trial.should_prune():
+                raise optuna.TrialPruned()
+
+    # 5'. Все кластеры одним batched-решением. Прунить тут нечего:
+    # промежуточных результатов по кластерам нет
+    if batched and blocks:
+        fits = fit_clusters_batched(trial, blocks, cfg, model_type)
+        for block, fit in zip(blocks, fits):
+            record(block, fit)
+
+    if cfg.mode == "two_stage" and feat_names_step1 is not None:
+        feat_names_step2 = feat_names_step1 + ["proxy_prediction"]
 
     # 6. Усреднение и логирование FI
     if total_samples > 0:
@@ -748,18 +1154,15 @@ def objective_cluster(
             log_fi(avg_fi_main, feat_names_step2, f"{phase}_fi_main.csv")
 
     # 7. Финальные метрики (со страховкой от NaN)
-    y_true_final = df_valid.loc[valid_p_idx, TARGET].values.astype(np.float32)
-    y_pred_final = valid_preds.fillna(global_mean_price).values.astype(np.float32)
-
     # ИСПРАВЛЕНИЕ: Глобальная очистка от inf перед расчетом метрик
     y_true_final = np.nan_to_num(
-        y_true_final,
+        y_va_p,
         nan=global_mean_price,
         posinf=global_mean_price,
         neginf=global_mean_price,
     )
     y_pred_final = np.nan_to_num(
-        y_pred_final,
+        valid_preds,
         nan=global_mean_price,
         posinf=global_mean_price,
         neginf=global_mean_price,
@@ -773,12 +1176,9 @@ def objective_cluster(
     }
 
     if cfg.mode == "two_stage":
-        vp_true = valid_proxy_true.fillna(0.0).values.astype(np.float32)
-        vp_preds = valid_proxy_preds.fillna(0.0).values.astype(np.float32)
-
-        # ИСПРАВЛЕНИЕ: Очистка от inf для прокси-таргета
-        vp_true = np.nan_to_num(vp_true, nan=0.0, posinf=0.0, neginf=0.0)
-        vp_preds = np.nan_to_num(vp_preds, nan=0.0, posinf=0.0, neginf=0.0)
+        # ИСПРАВЛЕНИЕ: Очистка от NaN/inf для прокси-таргета
+        vp_true = np.nan_to_num(valid_proxy_true, nan=0.0, posinf=0.0, neginf=0.0)
+        vp_preds = np.nan_to_num(valid_proxy_preds, nan=0.0, posinf=0.0, neginf=0.0)
 
         metrics["valid_proxy_rmse"] = float(
             np.sqrt(mean_squared_error(vp_true, vp_preds))
@@ -797,7 +1197,6 @@ def evaluate_on_test(
     df_train,
     df_valid,
     df_test,
-    preprocessor,
     wnir_params,
     cluster_algo,
 ):
@@ -821,6 +1220,7 @@ def evaluate_on_test(
     df_test_eval["set_type"] = "valid"
 
     fixed_trial = optuna.trial.FixedTrial(best_params)
+    features = FeatureStore(df_train_full, df_test_eval, phase="test")
 
     with mlflow.start_run(nested=True, run_name="Final_Test"):
         mlflow.set_tags({**cfg.tags(), "model_type": model_type,
@@ -831,13 +1231,11 @@ def evaluate_on_test(
 
         if cfg.scope == "global":
             metrics_dict = objective_global(
-                fixed_trial, df_train_full, df_test_eval, preprocessor,
-                cfg, wnir_params, model_type, phase="test",
+                fixed_trial, features, cfg, wnir_params, model_type,
             )
         else:
             metrics_dict = objective_cluster(
-                fixed_trial, df_train_full, df_test_eval, preprocessor,
-                cfg, wnir_params, model_type, cluster_algo, phase="test",
+                fixed_trial, features, cfg, wnir_params, model_type, cluster_algo,
             )
 
         test_metrics = {k.replace("valid_", "test_"): v for k, v in metrics_dict.items()}
@@ -853,17 +1251,87 @@ def evaluate_on_test(
     return test_metrics, best_params, float(best_valid_rmse)
 
 
+def get_storage():
+    # sqlite под несколькими процессами пула: ждать блокировку, а не падать
+    # с "database is locked"
+    return optuna.storages.RDBStorage(
+        OPTUNA_STORAGE, engine_kwargs={"connect_args": {"timeout": 300}}
+    )
+
+
+def create_study(study_name, seed=42):
+    return optuna.create_study(
+        direction="minimize",
+        study_name=study_name,
+        storage=get_storage(),
+        load_if_exists=True,
+        sampler=optuna.samplers.TPESampler(seed=seed),
+        pruner=optuna.pruners.MedianPruner(n_startup_trials=2, n_warmup_steps=2),
+    )
+
+
+def make_objective(
+    cfg: ExpConfig,
+    model_type,
+    cluster_algo,
+    features,
+    wnir_params,
+    parent_run_id=None,
+):
+    """
+    Целевая функция study. parent_run_id — ран эксперимента, когда trial
+    выполняется в процессе пула и активного родительского рана там нет.
+    """
+    if parent_run_id is None:
+        run_kwargs = {"nested": True}
+    else:
+        run_kwargs = {"tags": {MLFLOW_PARENT_RUN_ID: parent_run_id}}
+
+    def objective(trial):
+        with mlflow.start_run(run_name=f"Trial_{trial.number}", **run_kwargs):
+            mlflow.set_tags({**cfg.tags(), "model_type": model_type,
+                             "cluster_algo": cluster_algo, "phase": "valid"})
+            try:
+                if cfg.scope == "global":
+                    metrics_dict = objective_global(
+                        trial, features, cfg, wnir_params, model_type,
+                    )
+                else:
+                    metrics_dict = objective_cluster(
+                        trial, features, cfg, wnir_params, model_type, cluster_algo,
+                    )
+
+                mlflow.log_params(trial.params)
+                mlflow.log_metrics(metrics_dict)
+
+                return metrics_dict["valid_rmse"]
+            except optuna.TrialPruned:
+                mlflow.set_tag("status", "pruned")
+                raise
+            finally:
+                gc.collect()
+                torch.cuda.empty_cache()
+
+    return objective
+
+
 def run_experiment(
     cfg: ExpConfig,
     model_type,
     df_train,
     df_valid,
     df_test,
-    preprocessor,
     wnir_params,
     cluster_algo="none",
     n_trials=20,
+    pool=None,
+    features=None,
 ):
+    """
+    pool — пул из make_pool(): trials study раздаются его процессам по одному,
+    общее состояние study — в хранилище Optuna. features — FeatureStore
+    по (df_train, df_valid), общий для нескольких экспериментов на этих данных.
+    """
     print(
         f"\n{'=' * 60}\nRunning: {cfg.name} | Model: {model_type.upper()} "
         f"| Clustering: {cluster_algo.upper()}\n{'=' * 60}"
@@ -871,18 +1339,11 @@ def run_experiment(
 
     # Tag parent run with orthogonal axes for filter/group in MLflow UI
     mlflow.set_tags({**cfg.tags(), "model_type": model_type, "cluster_algo": cluster_algo})
+    if cluster_algo == "hdbscan" and HDBSCAN_FIT_SAMPLE is not None:
+        mlflow.set_tag("hdbscan_fit_sample", HDBSCAN_FIT_SAMPLE)
 
     study_name = f"{cfg.name}__{model_type}__{cluster_algo}"
-    optuna_db_path = "sqlite:///optuna.db"
-
-    study = optuna.create_study(
-        direction="minimize",
-        study_name=study_name,
-        storage=optuna_db_path,
-        load_if_exists=True,
-        sampler=optuna.samplers.TPESampler(seed=42),
-        pruner=optuna.pruners.MedianPruner(n_startup_trials=2, n_warmup_steps=2),
-    )
+    study = create_study(study_name)
 
     completed_trials = len(
         [t for t in study.trials if t.state.name in ["COMPLETE", "PRUNED"]]
@@ -896,34 +1357,31 @@ def run_experiment(
             f"[{study_name}] Found {completed_trials} completed trials. Running {trials_to_run} more..."
         )
 
-        def objective(trial):
-            with mlflow.start_run(nested=True, run_name=f"Trial_{trial.number}"):
-                mlflow.set_tags({**cfg.tags(), "model_type": model_type,
-                                 "cluster_algo": cluster_algo, "phase": "valid"})
-                try:
-                    if cfg.scope == "global":
-                        metrics_dict = objective_global(
-                            trial, df_train, df_valid, preprocessor, cfg,
-                            wnir_params, model_type,
-                        )
-                    else:
-                        metrics_dict = objective_cluster(
-                            trial, df_train, df_valid, preprocessor, cfg,
-                            wnir_params, model_type, cluster_algo,
-                        )
-
-                    mlflow.log_params(trial.params)
-                    mlflow.log_metrics(metrics_dict)
-
-                    return metrics_dict["valid_rmse"]
-                except optuna.TrialPruned:
-                    mlflow.set_tag("status", "pruned")
-                    raise
-                finally:
-                    gc.collect()
-                    torch.cuda.empty_cache()
-
-        study.optimize(objective, n_trials=trials_to_run)
+        n_before = len(study.trials)
+        start = time.perf_counter()
+
+        if pool is None:
+            if features is None:
+                features = FeatureStore(df_train, df_valid)
+            objective = make_objective(
+                cfg, model_type, cluster_algo, features, wnir_params,
+            )
+            study.optimize(objective, n_trials=trials_to_run)
+        else:
+            parent_run_id = mlflow.active_run().info.run_id
+            futures = [
+                pool.submit(
+                    _run_trial, study_name, slot, cfg, model_type, cluster_algo,
+                    parent_run_id,
+                )
+                for slot in range(completed_trials, completed_trials + trials_to_run)
+            ]
+            for future in futures:
+                future.result()
+
+        log_hpo_timing(study, n_before, time.perf_counter() - start)
+        log_cluster_cache_hits(study, n_before)
+
         try:
             print(f"[{study_name}] HPO finished! Best valid RMSE: {study.best_value:.4f}")
         except ValueError:
@@ -936,7 +1394,6 @@ def run_experiment(
         df_train=df_train,
         df_valid=df_valid,
         df_test=df_test,
-        preprocessor=preprocessor,
         wnir_params=wnir_params,
         cluster_algo=cluster_algo,
     )
@@ -949,6 +1406,125 @@ def run_experiment(
         mlflow.log_params({f"best_{k}": v for k, v in best_params.items()})
 
 
+def log_hpo_timing(study, n_before, wall):
+    """
+    Ускорение HPO = суммарное время trials / время по часам. Для
+    последовательного прогона оно ~1, для пула — сколько trials шло одновременно.
+    """
+    busy = sum(
+        t.duration.total_seconds()
+        for t in study.trials[n_before:]
+        if t.duration is not None
+    )
+    speedup = busy / wall if wall > 0 else 0.0
+    mlflow.log_metrics(
+        {"hpo_wall_s": wall, "hpo_trials_s": busy, "hpo_speedup": speedup}
+    )
+    print(
+        f"[{study.study_name}] HPO wall {wall:.1f} s, trials {busy:.1f} s, "
+        f"speedup x{speedup:.2f}"
+    )
+
+
+def log_cluster_cache_hits(study, n_before):
+    """Доля trials с разметкой из CLUSTER_CACHE (по user_attrs — видно и trials пула)."""
+    hits = [
+        t.user_attrs["cluster_cache_hit"]
+        for t in study.trials[n_before:]
+        if "cluster_cache_hit" in t.user_attrs
+    ]
+    if hits:
+        rate = float(np.mean(hits))
+        mlflow.log_metric("cluster_cache_hit_rate", rate)
+        print(f"[{study.study_name}] cluster cache hit rate {rate:.2f} ({len(hits)} trials)")
+
+
+# ==========================================
+# 4.5 ПАРАЛЛЕЛЬНЫЙ РЕЖИМ
+# ==========================================
+# Состояние процесса пула: данные и параметры загружаются один раз на процесс
+_WORKER = {}
+
+
+def make_pool(workers, threads_per_worker):
+    """
+    Пул процессов для trials и целых study. spawn, а не fork: форк после
+    инициализации пулов потоков BLAS/OpenMP и torch может зависнуть.
+    """
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(threads_per_worker, HDBSCAN_FIT_SAMPLE),
+    )
+
+
+def _init_worker(threads, hdbscan_fit_sample):
+    global N_JOBS, HDBSCAN_FIT_SAMPLE
+
+    # Без лимитов каждый процесс берет под BLAS/OpenMP все ядра машины
+    _WORKER["limits"] = threadpool_limits(limits=threads)
+    torch.set_num_threads(threads)
+    N_JOBS = threads
+    HDBSCAN_FIT_SAMPLE = hdbscan_fit_sample
+
+    mlflow.set_tracking_uri(MLFLOW_TRACKING_URI)
+    mlflow.set_experiment(MLFLOW_EXPERIMENT)
+
+    _WORKER["wnir_params"] = load_wnir_params()
+    _WORKER["data"] = load_data()
+    _WORKER["features"] = FeatureStore(*_WORKER["data"][:2])
+
+
+def _run_trial(study_name, slot, cfg, model_type, cluster_algo, parent_run_id):
+    # Свой seed на каждый trial: с одинаковым seed и одной историей
+    # параллельные TPE-сэмплеры предложили бы одни и те же параметры
+    study = create_study(study_name, seed=42 + slot)
+    objective = make_objective(
+        cfg, model_type, cluster_algo, _WORKER["features"], _WORKER["wnir_params"],
+        parent_run_id,
+    )
+    study.optimize(objective, n_trials=1)
+
+
+def _run_study(cfg, model_type, cluster_algo, n_trials):
+    df_train, df_valid, df_test = _WORKER["data"]
+
+    start = time.perf_counter()
+    with mlflow.start_run(run_name=run_name_for(cfg, model_type, cluster_algo)):
+        run_experiment(
+            cfg=cfg,
+            model_type=model_type,
+            df_train=df_train,
+            df_valid=df_valid,
+            df_test=df_test,
+            wnir_params=_WORKER["wnir_params"],
+            cluster_algo=cluster_algo,
+            n_trials=n_trials,
+            features=_WORKER["features"],
+        )
+    return time.perf_counter() - start
+
+
+def run_studies_parallel(jobs, pool):
+    """Независимые study из jobs — по одной на процесс пула."""
+    start = time.perf_counter()
+    futures = {pool.submit(_run_study, *job): job for job in jobs}
+
+    busy = 0.0
+    for future in as_completed(futures):
+        cfg, model_type, cluster_algo, _ = futures[future]
+        elapsed = future.result()
+        busy += elapsed
+        print(f"[{run_name_for(cfg, model_type, cluster_algo)}] done in {elapsed:.1f} s")
+
+    wall = time.perf_counter() - start
+    print(
+        f"\n{len(jobs)} studies: wall {wall:.1f} s, sum of studies {busy:.1f} s, "
+        f"speedup x{busy / wall:.2f}"
+    )
+
+
 # ==========================================
 # 5. АДАПТИВНЫЙ РАЗМЕР HPO
 # ==========================================
@@ -981,24 +1557,28 @@ def n_trials_for(cfg: ExpConfig, model_type: str, cluster_algo: str) -> int:
 # ==========================================
 # 6. ТОЧКА ВХОДА
 # ==========================================
-if __name__ == "__main__":
-    mlflow.set_tracking_uri("sqlite:///mlflow.db")
-    mlflow.set_experiment("Real_Estate_Pricing_Pipelines")
-
+def load_wnir_params():
     try:
-        wnir_params = params_show()["wnir"]
+        return params_show()["wnir"]
     except Exception as e:
         print(f"Warning: Could not load DVC params ({e}), using defaults.")
-        wnir_params = {
+        return {
             "h": 500,
             "R": {"r1": 100, "r2": 500, "r3": 1000},
             "fill_nearest_threshold": 3000,
             "batch_size": 20000,
         }
 
-    df_train, df_valid, df_test = load_data()
-    preprocessor = get_preprocessor()
 
+def run_name_for(cfg: ExpConfig, model_type, cluster_algo):
+    run_name_parts = [cfg.name, model_type]
+    if cluster_algo != "none":
+        run_name_parts.append(cluster_algo)
+    return "__".join(run_name_parts)
+
+
+def experiment_grid():
+    """Список study: (cfg, model_type, cluster_algo, n_trials)."""
     experiments = [
         ExpConfig("global", "direct"),
         ExpConfig("global", "direct", use_wnir=True),
@@ -1014,31 +1594,87 @@ if __name__ == "__main__":
 
     model_types = ["ridge", "lasso", "elastic_net", "ols", "catboost"]
 
+    jobs = []
     for cfg in experiments:
         cluster_algos = ["none"] if cfg.scope == "global" else ["kmeans", "hdbscan"]
 
         for model_type in model_types:
             for cluster_algo in cluster_algos:
-                run_name_parts = [cfg.name, model_type]
-                if cluster_algo != "none":
-                    run_name_parts.append(cluster_algo)
-                run_name = "__".join(run_name_parts)
-
                 n_trials = n_trials_for(cfg, model_type, cluster_algo)
-                with mlflow.start_run(run_name=run_name):
-                    run_experiment(
-                        cfg=cfg,
-                        model_type=model_type,
-                        df_train=df_train,
-                        df_valid=df_valid,
-                        df_test=df_test,
-                        preprocessor=preprocessor,
-                        wnir_params=wnir_params,
-                        cluster_algo=cluster_algo,
-                        n_trials=n_trials,
-                    )
+                jobs.append((cfg, model_type, cluster_algo, n_trials))
+    return jobs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="процессы пула (для CPU-узлов); 1 — последовательный прогон",
+    )
+    parser.add_argument(
+        "--threads-per-worker",
+        type=int,
+        default=None,
+        help="потоки BLAS/OpenMP/torch на процесс, по умолчанию ядра / workers",
+    )
+    parser.add_argument(
+        "--parallel",
+        choices=["studies", "trials"],
+        default="studies",
+        help="studies — study целиком на процесс (данные в памяти каждого "
+        "процесса); trials — study по очереди, их trials параллельно",
+    )
+    parser.add_argument(
+        "--hdbscan-sample",
+        type=int,
+        default=None,
+        help="обучать HDBSCAN на стратифицированной выборке из стольких строк "
+        "train, остальные строки — approximate_predict",
+    )
+    args = parser.parse_args()
+    HDBSCAN_FIT_SAMPLE = args.hdbscan_sample
+
+    mlflow.set_tracking_uri(MLFLOW_TRACKING_URI)
+    mlflow.set_experiment(MLFLOW_EXPERIMENT)
+
+    jobs = experiment_grid()
+    start = time.perf_counter()
+
+    if args.workers > 1:
+        threads = args.threads_per_worker or max(1, os.cpu_count() // args.workers)
+        pool = make_pool(args.workers, threads)
+    else:
+        pool = None
+
+    if pool is not None and args.parallel == "studies":
+        with pool:
+            run_studies_parallel(jobs, pool)
+    else:
+        wnir_params = load_wnir_params()
+        df_train, df_valid, df_test = load_data()
+        features = FeatureStore(df_train, df_valid)
+
+        for cfg, model_type, cluster_algo, n_trials in jobs:
+            with mlflow.start_run(run_name=run_name_for(cfg, model_type, cluster_algo)):
+                run_experiment(
+                    cfg=cfg,
+                    model_type=model_type,
+                    df_train=df_train,
+                    df_valid=df_valid,
+                    df_test=df_test,
+                    wnir_params=wnir_params,
+                    cluster_algo=cluster_algo,
+                    n_trials=n_trials,
+                    pool=pool,
+                    features=features,
+                )
+
+        if pool is not None:
+            pool.shutdown()
 
-    print("\nAll experiments finished!")
+    print(f"\nAll experiments finished in {time.perf_counter() - start:.1f} s!")
     print(
-        "Run 'mlflow ui --backend-store-uri sqlite:///mlflow.db' to view the dashboard."
+        f"Run 'mlflow ui --backend-store-uri {MLFLOW_TRACKING_URI}' to view the dashboard."
     )
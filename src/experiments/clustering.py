@@ -0,0 +1,371 @@
+"""
+Кластеризация для objective_cluster: то, что зависит только от данных
+и параметров кластеризации, считается один раз и переиспользуется
+между trials.
+"""
+
+import functools
+import hashlib
+import importlib.metadata
+import json
+import os
+import tempfile
+from pathlib import Path
+
+import hdbscan
+import numpy as np
+from hdbscan.hdbscan_ import _tree_to_labels
+from sklearn.cluster import KMeans, kmeans_plusplus
+from sklearn.metrics import pairwise_distances_argmin
+from sklearn.metrics.pairwise import euclidean_distances
+
+from src.experiments.linear_models import LRUCache, array_key
+
+
+class AssignmentCache:
+    """
+    Метки кластеров train/valid на диске: <cache_dir>/<key>.npz, где key —
+    хэш (отпечаток данных, алгоритм, параметры, seed). Разметка не зависит
+    от регрессора и ExpConfig, поэтому общая для всех study и процессов пула.
+    Файл пишется во временный и переименовывается — параллельные записи
+    одного ключа не оставляют битых файлов.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = Path(cache_dir)
+
+    @staticmethod
+    def key(fingerprint, algorithm, params, seed):
+        payload = json.dumps(
+            {"data": fingerprint, "algorithm": algorithm, "params": params, "seed": seed},
+            sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+    def get_or_compute(self, fingerprint, algorithm, params, seed, compute):
+        """(train_labels, valid_labels, hit); compute() -> (train_labels, valid_labels)."""
+        path = self.cache_dir / f"{self.key(fingerprint, algorithm, params, seed)}.npz"
+        if path.exists():
+            with np.load(path) as cached:
+                return cached["train"], cached["valid"], True
+
+        train_labels, valid_labels = compute()
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            dir=self.cache_dir, suffix=".tmp", delete=False
+        ) as f:
+            np.savez(f, train=train_labels, valid=valid_labels)
+        os.replace(f.name, path)
+
+        return train_labels, valid_labels, False
+
+
+def spatial_sample(longitude, latitude, strata, size, cell_deg=0.01, seed=42):
+    """
+    Индексы (по возрастанию) стратифицированной выборки size строк: страта —
+    значение strata в ячейке сетки cell_deg x cell_deg градусов. Квоты
+    пропорциональны размерам страт (остаток — по наибольшим дробным частям),
+    так что выборка покрывает все районы и типы рынка в их долях, без
+    случайных сгущений и провалов.
+    """
+    n = len(longitude)
+    if size >= n:
+        return np.arange(n)
+
+    cells = np.stack(
+        [
+            np.floor(np.asarray(longitude) / cell_deg).astype(np.int64),
+            np.floor(np.asarray(latitude) / cell_deg).astype(np.int64),
+            np.unique(np.asarray(strata), return_inverse=True)[1],
+        ],
+        axis=1,
+    )
+    _, groups, counts = np.unique(
+        cells, axis=0, return_inverse=True, return_counts=True
+    )
+    groups = groups.reshape(-1)
+
+    exact = counts * (size / n)
+    quota = np.floor(exact).astype(np.int64)
+    remainder = size - quota.sum()
+    quota[np.argsort(quota - exact, kind="stable")[:remainder]] += 1
+
+    # Случайный порядок внутри страты: ранг строки в перемешанной страте < квоты
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(n)
+    order = order[np.argsort(groups[order], kind="stable")]
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    rank = np.arange(n) - starts[groups[order]]
+
+    return np.sort(order[rank < quota[groups[order]]])
+
+
+@functools.cache
+def check_hdbscan_internals():
+    """
+    HDBSCANHierarchy собирает кластеризатор из приватных частей hdbscan
+    (_tree_to_labels, _raw_data, _metric_kwargs, _all_finite), проверенных
+    на версии из requirements.txt. Один раз на процесс сверяет его разметку
+    train и approximate_predict на небольших данных с обычным fit, чтобы
+    обновление hdbscan не поменяло метки молча.
+    """
+    rng = np.random.default_rng(0)
+    centers = rng.normal(scale=5.0, size=(4, 3))
+    X = (centers[rng.integers(0, 4, 600)] + rng.normal(size=(600, 3))).astype(
+        np.float32
+    )
+    X_train, X_valid = X[:500], X[500:]
+
+    direct = hdbscan.HDBSCAN(min_cluster_size=20, min_samples=5, prediction_data=True)
+    direct.fit(X_train)
+    direct_valid, _ = hdbscan.approximate_predict(direct, X_valid)
+
+    train_labels, valid_labels = HDBSCANHierarchy(X_train, X_valid, _check=False).labels(
+        20, 5
+    )
+    if not (
+        np.array_equal(train_labels, direct.labels_)
+        and np.array_equal(valid_labels, direct_valid)
+    ):
+        version = importlib.metadata.version("hdbscan")
+        raise RuntimeError(
+            f"HDBSCANHierarchy расходится с HDBSCAN.fit на hdbscan {version}: "
+            "проверьте приватные API, на которые он опирается"
+        )
+
+
+class HDBSCANHierarchy:
+    """
+    HDBSCAN по (X_train, X_valid) для многих пар параметров.
+
+    MST по mutual reachability зависит только от min_samples, а
+    min_cluster_size лишь режет condensed tree. Поэтому single linkage tree
+    хранится по min_samples, а разметка для нового min_cluster_size — это
+    condense + выбор кластеров (_tree_to_labels — то же, чем заканчивается
+    HDBSCAN.fit), без пересчета расстояний. Кластеризатор с prediction_data
+    и разметка valid через approximate_predict кэшируются по паре параметров.
+
+    Дерево — (n - 1) x 4 float64, prediction_data — копия X в float64 и
+    KD-дерево, отсюда небольшие лимиты кэшей.
+
+    fit_rows — индексы строк X_train для обучения (spatial_sample); остальные
+    строки train размечаются approximate_predict, как valid. min_cluster_size
+    и min_samples — числа точек, на выборке доли f они соответствуют
+    f-кратно меньшим, поэтому масштабируются: параметры trials остаются в
+    единицах полного train.
+    """
+
+    def __init__(
+        self,
+        X_train,
+        X_valid,
+        core_dist_n_jobs=-1,
+        max_trees=16,
+        max_clusterers=4,
+        fit_rows=None,
+        _check=True,
+    ):
+        if _check:
+            check_hdbscan_internals()
+
+        self.X_train = X_train
+        self.X_valid = X_valid
+        self.fit_rows = fit_rows
+        self.X_fit = X_train if fit_rows is None else X_train[fit_rows]
+        self.fraction = len(self.X_fit) / len(X_train)
+        self.core_dist_n_jobs = core_dist_n_jobs
+        self._trees = LRUCache(max_trees)
+        self._clusterers = LRUCache(max_clusterers)
+        self._labels = LRUCache(256)
+
+    def fit_params(self, min_cluster_size, min_samples):
+        """Параметры для X_fit, эквивалентные заданным для всего X_train."""
+        if self.fit_rows is None:
+            return min_cluster_size, min_samples
+        return (
+            max(2, round(min_cluster_size * self.fraction)),
+            max(1, round(min_samples * self.fraction)),
+        )
+
+    def single_linkage_tree(self, min_samples):
+        def compute():
+            clusterer = hdbscan.HDBSCAN(
+                min_samples=min_samples, core_dist_n_jobs=self.core_dist_n_jobs
+            )
+            clusterer.fit(self.X_fit)
+            return clusterer._single_linkage_tree
+
+        return self._trees.get_or_compute(min_samples, compute)
+
+    def clusterer(self, min_cluster_size, min_samples):
+        """Обученный HDBSCAN с prediction_data, как после fit с этими параметрами."""
+
+        def compute():
+            clusterer = hdbscan.HDBSCAN(
+                min_cluster_size=min_cluster_size,
+                min_samples=min_samples,
+                prediction_data=True,
+                core_dist_n_jobs=self.core_dist_n_jobs,
+            )
+            (
+                clusterer.labels_,
+                clusterer.probabilities_,
+                clusterer.cluster_persistence_,
+                clusterer._condensed_tree,
+                clusterer._single_linkage_tree,
+            ) = _tree_to_labels(
+                self.X_fit,
+                self.single_linkage_tree(min_samples),
+                min_cluster_size=min_cluster_size,
+            )
+            clusterer._raw_data = self.X_fit
+            clusterer._metric_kwargs = {}
+            clusterer._all_finite = True
+            clusterer.generate_prediction_data()
+            return clusterer
+
+        return self._clusterers.get_or_compute(
+            (min_cluster_size, min_samples), compute
+        )
+
+    def labels(self, min_cluster_size, min_samples):
+        """Метки (train, valid); valid и train вне fit_rows — через approximate_predict."""
+
+        def compute():
+            clusterer = self.clusterer(*self.fit_params(min_cluster_size, min_samples))
+            valid_labels, _ = hdbscan.approximate_predict(clusterer, self.X_valid)
+
+            if self.fit_rows is None:
+                train_labels = clusterer.labels_.copy()
+            else:
+                rest = np.ones(len(self.X_train), dtype=bool)
+                rest[self.fit_rows] = False
+
+                train_labels = np.empty(len(self.X_train), dtype=valid_labels.dtype)
+                train_labels[self.fit_rows] = clusterer.labels_
+                rest_labels, _ = hdbscan.approximate_predict(
+                    clusterer, self.X_train[rest]
+                )
+                train_labels[rest] = rest_labels
+
+            for labels in (train_labels, valid_labels):
+                labels.setflags(write=False)
+            return train_labels, valid_labels
+
+        return self._labels.get_or_compute((min_cluster_size, min_samples), compute)
+
+
+class KMeansPath:
+    """
+    KMeans на CPU (sklearn, Lloyd) по (X_train, X_valid) для многих k.
+    Один раз обучается опорный KMeans с anchor_k кластерами (k-means++ с
+    seed), и любой k стартует с его центроидов: при меньшем k — слияние
+    ближайших по Ward пар, при большем — добор центров D²-сэмплированием
+    k-means++ от опорных (генератор от (seed, k)). Lloyd от такого старта
+    сходится за несколько итераций, а результат зависит только от данных,
+    k, seed и anchor_k — не от того, какие k считались раньше, поэтому
+    метки можно класть в общий CLUSTER_CACHE. Центроиды хранятся по k:
+    повтор k (FixedTrial в evaluate_on_test) — только разметка.
+
+    Сэмплирование начальных центров идет по seed_rows случайных строк train.
+    """
+
+    def __init__(
+        self, X_train, X_valid, seed=42, max_iter=100, seed_rows=100_000, anchor_k=10
+    ):
+        self.X_train = X_train
+        self.X_valid = X_valid
+        self.seed = seed
+        self.max_iter = max_iter
+        self.anchor_k = anchor_k
+
+        rng = np.random.default_rng(seed)
+        if len(X_train) > seed_rows:
+            self.X_seed = X_train[np.sort(rng.choice(len(X_train), seed_rows, replace=False))]
+        else:
+            self.X_seed = X_train
+        self._centers = {}
+
+    def _fit(self, k, init):
+        model = KMeans(n_clusters=k, init=init, n_init=1, max_iter=self.max_iter)
+        model.fit(self.X_train)
+        self._centers[k] = (
+            model.cluster_centers_,
+            np.bincount(model.labels_, minlength=k),
+        )
+
+    def _anchor(self):
+        if self.anchor_k not in self._centers:
+            init, _ = kmeans_plusplus(self.X_seed, self.anchor_k, random_state=self.seed)
+            self._fit(self.anchor_k, init)
+        return self._centers[self.anchor_k]
+
+    def _initial_centers(self, k):
+        centers, counts = self._anchor()
+        if k < self.anchor_k:
+            return self._merge(centers, counts, k)
+        return self._split(centers, k, np.random.default_rng([self.seed, k]))
+
+    @staticmethod
+    def _merge(centers, counts, k):
+        centers = list(centers.astype(np.float64))
+        counts = list(counts.astype(np.float64))
+        while len(centers) > k:
+            C = np.array(centers)
+            n = np.array(counts)
+            # Прирост инерции от слияния пары — критерий Ward
+            cost = euclidean_distances(C, squared=True) * (
+                n[:, None] * n[None] / np.maximum(n[:, None] + n[None], 1.0)
+            )
+            np.fill_diagonal(cost, np.inf)
+            i, j = sorted(np.unravel_index(np.argmin(cost), cost.shape))
+
+            total = max(counts[i] + counts[j], 1.0)
+            centers[i] = (centers[i] * counts[i] + centers[j] * counts[j]) / total
+            counts[i] = counts[i] + counts[j]
+            del centers[j], counts[j]
+        return np.array(centers, dtype=np.float32)
+
+    def _split(self, centers, k, rng):
+        centers = list(centers)
+        closest = euclidean_distances(self.X_seed, np.array(centers), squared=True).min(
+            axis=1
+        )
+        while len(centers) < k:
+            idx = rng.choice(len(closest), p=closest / closest.sum())
+            centers.append(self.X_seed[idx])
+            closest = np.minimum(
+                closest,
+                euclidean_distances(self.X_seed, self.X_seed[idx : idx + 1], squared=True)[
+                    :, 0
+                ],
+            )
+        return np.array(centers, dtype=np.float32)
+
+    def labels(self, k):
+        """Метки (train, valid) для k кластеров."""
+        if k == self.anchor_k:
+            self._anchor()
+        if k not in self._centers:
+            self._fit(k, self._initial_centers(k))
+
+        centers = self._centers[k][0]
+        return (
+            pairwise_distances_argmin(self.X_train, centers),
+            pairwise_distances_argmin(self.X_valid, centers),
+        )
+
+
+# Пути по (X_train, X_valid): evaluate_on_test собирает FeatureStore заново
+# на каждый вызов, центроиды переживают его через этот кэш
+_KMEANS_PATHS = LRUCache(maxsize=4)
+
+
+def kmeans_path(X_train, X_valid, seed=42, max_iter=100, anchor_k=10):
+    return _KMEANS_PATHS.get_or_compute(
+        (array_key(X_train, X_valid), seed, max_iter, anchor_k),
+        lambda: KMeansPath(
+            X_train, X_valid, seed=seed, max_iter=max_iter, anchor_k=anchor_k
+        ),
+    )
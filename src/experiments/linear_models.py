@@ -0,0 +1,257 @@
+"""
+Решатели линейных моделей для choose_model. Между trials одной study
+меняются только гиперпараметры, а матрица признаков та же, поэтому все,
+что зависит только от X и y (Gram-матрица и ее разложение), считается
+один раз и берется из кэша по содержимому массивов.
+"""
+
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+import torch
+
+
+def array_key(*arrays):
+    """Ключ кэша по содержимому массивов: хэш O(n·d) дешевле Gram-матрицы O(n·d²)."""
+    digest = hashlib.blake2b(digest_size=16)
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        digest.update(f"{array.shape}{array.dtype.str}".encode())
+        digest.update(array.data)
+    return digest.hexdigest()
+
+
+class LRUCache:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_compute(self, key, compute):
+        if key in self._items:
+            self.hits += 1
+            self._items.move_to_end(key)
+            return self._items[key]
+
+        self.misses += 1
+        value = compute()
+        self._items[key] = value
+        if len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+        return value
+
+
+class GramStats:
+    """
+    Достаточная статистика линейной модели с intercept: Gram-матрица
+    центрированного X и Xc^T yc (без деления на n), средние и n.
+    """
+
+    def __init__(self, X, y, device="cpu"):
+        X_t = torch.tensor(X, dtype=torch.float32, device=device)
+        y_t = torch.tensor(y, dtype=torch.float32, device=device).view(-1)
+
+        x_mean = X_t.mean(dim=0)
+        y_mean = y_t.mean()
+        X_t -= x_mean
+
+        self.device = device
+        self.n = X_t.shape[0]
+        self.gram = (X_t.T @ X_t).double()
+        self.xty = (X_t.T @ (y_t - y_mean)).double()
+        self.x_mean = x_mean.double()
+        self.y_mean = y_mean.double()
+
+        del X_t, y_t
+
+
+_GRAM_STATS = LRUCache(maxsize=1024)
+
+
+def gram_stats(X, y, device="cpu"):
+    return _GRAM_STATS.get_or_compute(
+        (array_key(X, y), str(device)), lambda: GramStats(X, y, device)
+    )
+
+
+class RidgePath:
+    """
+    Ridge с нештрафуемым intercept сразу для любых alpha. После центрирования
+    intercept уходит из системы: w(alpha) = (Xc^T Xc + alpha I)^-1 Xc^T yc.
+    Разложение Xc^T Xc = V diag(lam) V^T делается один раз, дальше
+    w(alpha) = V (V^T Xc^T yc / (lam + alpha)) — O(d²) на каждое alpha.
+    """
+
+    def __init__(self, stats):
+        eigvals, eigvecs = torch.linalg.eigh(stats.gram)
+        self.device = stats.device
+        self.eigvals = eigvals.clamp(min=0.0)
+        self.eigvecs = eigvecs
+        self.proj = eigvecs.T @ stats.xty
+        self.x_mean = stats.x_mean
+        self.y_mean = stats.y_mean
+
+    def coefs(self, alphas):
+        """Коэффициенты (d, k) и intercept'ы (k,) для k значений alpha."""
+        alphas = torch.as_tensor(alphas, dtype=torch.float64, device=self.device)
+        W = self.eigvecs @ (self.proj[:, None] / (self.eigvals[:, None] + alphas[None]))
+        intercepts = self.y_mean - self.x_mean @ W
+        return W, intercepts
+
+
+# Пути по (X, y): между trials повторяются base-матрицы FeatureStore и
+# кластеры при совпавшей кластеризации
+_RIDGE_PATHS = LRUCache(maxsize=1024)
+
+
+def ridge_path(X, y, device="cpu"):
+    return _RIDGE_PATHS.get_or_compute(
+        (array_key(X, y), str(device)), lambda: RidgePath(gram_stats(X, y, device))
+    )
+
+
+def elastic_net_cd(stats, l1_pen, l2_pen, max_iter=1000, tol=1e-5, w0=None):
+    """
+    Coordinate descent для
+        1/(2n) ||yc - Xc w||² + l1_pen ||w||_1 + l2_pen / 2 ||w||²
+    (та же цель, что у FISTA в TorchElasticNet) по Gram-матрице: итерация —
+    O(d²) и не зависит от n. Градиент ведется covariance update'ом
+    r = Xc^T yc / n - G w, где G = Xc^T Xc / n.
+
+    Остановка — как в sklearn: максимальный шаг координаты меньше
+    tol * max|w|. w0 — начальное приближение (warm start).
+    """
+    G = (stats.gram / stats.n).cpu().numpy()
+    c = (stats.xty / stats.n).cpu().numpy()
+    diag = np.diag(G) + l2_pen
+
+    w = np.zeros(len(c)) if w0 is None else np.array(w0, dtype=np.float64)
+    r = c - G @ w
+
+    for _ in range(max_iter):
+        max_step = 0.0
+        for j in range(len(w)):
+            if diag[j] <= 0.0:
+                continue
+
+            rho = r[j] + G[j, j] * w[j]
+            w_j = np.sign(rho) * max(abs(rho) - l1_pen, 0.0) / diag[j]
+
+            step = w_j - w[j]
+            if step != 0.0:
+                r -= G[:, j] * step
+                w[j] = w_j
+                max_step = max(max_step, abs(step))
+
+        if max_step <= tol * max(np.abs(w).max(), 1e-12):
+            break
+
+    return w
+
+
+def elastic_net_cd_path(
+    stats, alpha, l1_ratio, n_steps=5, max_iter=1000, tol=1e-5
+):
+    """
+    elastic_net_cd для (alpha, l1_ratio) с warm start по собственному пути
+    trial'а: n_steps значений alpha геометрически от alpha_max (где все
+    коэффициенты нулевые) до alpha, каждое стартует с решения предыдущего.
+    Результат зависит только от (X, y, alpha, l1_ratio), а не от того,
+    какие trials решались раньше в процессе.
+    """
+    c = np.abs((stats.xty / stats.n).cpu().numpy()).max()
+    alpha_max = c / l1_ratio if l1_ratio > 0 else 0.0
+    if alpha_max > alpha:
+        alphas = np.geomspace(alpha_max, alpha, n_steps)
+    else:
+        alphas = [alpha]
+
+    w = None
+    for step_alpha in alphas:
+        w = elastic_net_cd(
+            stats,
+            l1_pen=step_alpha * l1_ratio,
+            l2_pen=step_alpha * (1.0 - l1_ratio),
+            max_iter=max_iter,
+            tol=tol,
+            w0=w,
+        )
+    return w
+
+
+def segmented_gram(X, y, groups, n_groups, chunk_elements=2**24):
+    """
+    [1, X]^T [1, X] и [1, X]^T y для каждой группы строк за один проход:
+    внешние произведения строк складываются в свою группу через index_add_.
+    Строки обрабатываются кусками по chunk_elements чисел.
+    """
+    n, d = X.shape
+    ones = torch.ones((n, 1), dtype=X.dtype, device=X.device)
+    Xa = torch.cat([ones, X], dim=1)
+
+    gram = torch.zeros((n_groups, d + 1, d + 1), dtype=X.dtype, device=X.device)
+    xty = torch.zeros((n_groups, d + 1), dtype=X.dtype, device=X.device)
+    xty.index_add_(0, groups, Xa * y[:, None])
+
+    chunk = max(1, chunk_elements // (d + 1) ** 2)
+    for start in range(0, n, chunk):
+        rows = Xa[start : start + chunk]
+        gram.index_add_(
+            0, groups[start : start + chunk], rows[:, :, None] * rows[:, None, :]
+        )
+
+    return gram, xty
+
+
+def batched_ridge(X_blocks, y_blocks, alpha, device="cpu", rtol=1e-10):
+    """
+    Ridge (alpha=0 — OLS) с нештрафуемым intercept для каждого блока строк
+    сразу: матрица (G, d + 1) коэффициентов, intercept первым.
+
+    При alpha > 0 система положительно определена и все блоки решаются одним
+    batched linalg.solve. OLS в кластере часто вырожден без точного нуля в
+    LU (one-hot пара с drop="first", покрывающая весь кластер, коллинеарна
+    intercept'у), и solve дает там произвольные большие коэффициенты. Поэтому
+    OLS решается через псевдообратную Gram-матрицы по собственным значениям
+    с отсечением rtol — это min-norm решение lstsq с порогом rank.
+    """
+    lengths = torch.tensor([len(block) for block in X_blocks], device=device)
+    groups = torch.repeat_interleave(
+        torch.arange(len(X_blocks), device=device), lengths
+    )
+
+    X = torch.tensor(np.concatenate(X_blocks), dtype=torch.float64, device=device)
+    y = torch.tensor(np.concatenate(y_blocks), dtype=torch.float64, device=device)
+    gram, xty = segmented_gram(X, y, groups, len(X_blocks))
+    del X, y
+
+    penalty = torch.full(
+        (gram.shape[1],), float(alpha), dtype=torch.float64, device=device
+    )
+    penalty[0] = 0.0
+    A = gram + torch.diag(penalty)
+
+    if alpha > 0:
+        W, info = torch.linalg.solve_ex(A, xty)
+        singular = info != 0
+    else:
+        W = torch.empty_like(xty)
+        singular = torch.ones(len(A), dtype=torch.bool, device=device)
+    if singular.any():
+        pinv = torch.linalg.pinv(A[singular], rtol=rtol, hermitian=True)
+        W[singular] = (pinv @ xty[singular, :, None])[..., 0]
+
+    W = torch.nan_to_num(W, nan=0.0, posinf=0.0, neginf=0.0)
+    return W.float().cpu().numpy()
+
+
+def batched_predict(W, X_blocks):
+    """Предсказания блоков по строкам W из batched_ridge — одним einsum."""
+    lengths = [len(block) for block in X_blocks]
+    groups = np.repeat(np.arange(len(X_blocks)), lengths)
+
+    X = np.concatenate(X_blocks)
+    preds = np.einsum("nd,nd->n", X, W[groups, 1:]) + W[groups, 0]
+    return np.split(preds.astype(np.float32), np.cumsum(lengths)[:-1])
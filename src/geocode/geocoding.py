@@ -1,6 +1,35 @@
+import numpy as np
+import pandas as pd
+
 from .geocode_parser import geocode_df_yandex
 
 
+def _backfill_coordinates(df, df_geocoded):
+    # Один hash join вместо двух dict + Series.map по всему датафрейму:
+    # адреса словарно кодируются (category), и для каждой уникальной строки
+    # один раз ищется позиция в чекпоинте. Дальше — целочисленный gather.
+    df_geocoded = df_geocoded.drop_duplicates("address", keep="last")
+
+    missing = df["latitude"].isna() | df["longitude"].isna()
+    if not missing.any() or df_geocoded.empty:
+        return df
+
+    addresses = df.loc[missing, "address"].astype("category")
+    category_pos = pd.Index(df_geocoded["address"]).get_indexer(
+        addresses.cat.categories
+    )
+    codes = addresses.cat.codes.to_numpy()
+    pos = np.where(codes >= 0, category_pos[codes], -1)
+    found = pos >= 0
+
+    for col in ["latitude", "longitude"]:
+        looked_up = np.full(len(pos), np.nan, dtype=df[col].dtype)
+        looked_up[found] = df_geocoded[col].to_numpy()[pos[found]]
+        df[col] = df[col].fillna(pd.Series(looked_up, index=addresses.index))
+
+    return df
+
+
 def geocode_addresses(
     df,
     api_keys_path,
@@ -17,11 +46,7 @@ def geocode_addresses(
         df_geocoded["latitude"].notna() & df_geocoded["longitude"].notna()
     ]
 
-    lat_map = df_geocoded.set_index("address")["latitude"].to_dict()
-    lon_map = df_geocoded.set_index("address")["longitude"].to_dict()
-
-    df["latitude"] = df["latitude"].fillna(df["address"].map(lat_map))
-    df["longitude"] = df["longitude"].fillna(df["address"].map(lon_map))
+    df = _backfill_coordinates(df, df_geocoded)
 
     df = df.loc[
         df["latitude"].notna()
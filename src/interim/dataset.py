@@ -0,0 +1,130 @@
+import json
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+# Interim-данные после split хранятся одним hive-датасетом
+# (year=.../market_type=.../*.parquet): выборки train/valid/test — это
+# фильтры по году, а чтения только primary или только нужных колонок
+# не трогают лишние файлы и колонки.
+PARTITION_SCHEMA = pa.schema(
+    [
+        ("year", pa.uint16()),
+        ("market_type", pa.dictionary(pa.int32(), pa.string())),
+    ]
+)
+
+# Границы выборок по году: [from, to)
+SPLIT_YEARS = {
+    "train": (None, 2024),
+    "valid": (2024, 2025),
+    "test": (2025, None),
+}
+
+SPLITS = list(SPLIT_YEARS)
+
+# Номер строки в исходном df: партиции группируют строки по year/market_type,
+# read_interim_dataset сортирует по этой колонке и возвращает исходный порядок
+ROW_INDEX_COLUMN = "__row_index"
+
+
+def _year_filter(low, high):
+    year = ds.field("year")
+    if low is None:
+        return year < high
+    if high is None:
+        return year >= low
+    return (year >= low) & (year < high)
+
+
+SPLIT_FILTERS = {split: _year_filter(*years) for split, years in SPLIT_YEARS.items()}
+
+
+def split_mask(df, split):
+    """То же, что SPLIT_FILTERS[split], для DataFrame в памяти."""
+    low, high = SPLIT_YEARS[split]
+    mask = np.ones(len(df), dtype=bool)
+    if low is not None:
+        mask &= (df["year"] >= low).to_numpy()
+    if high is not None:
+        mask &= (df["year"] < high).to_numpy()
+    return mask
+
+
+def write_interim_dataset(
+    df, path, compression="zstd", compression_level=None, row_group_rows=262_144
+):
+    """
+    Перезаписывает датасет path содержимым df. Порядок строк df хранится
+    в ROW_INDEX_COLUMN.
+    """
+    path = Path(path)
+    if path.exists():
+        shutil.rmtree(path)
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.append_column(
+        ROW_INDEX_COLUMN, pa.array(np.arange(len(df), dtype=np.uint64))
+    )
+    file_options = ds.ParquetFileFormat().make_write_options(
+        compression=compression, compression_level=compression_level
+    )
+
+    ds.write_dataset(
+        table,
+        path,
+        format="parquet",
+        partitioning=ds.partitioning(PARTITION_SCHEMA, flavor="hive"),
+        file_options=file_options,
+        min_rows_per_group=min(row_group_rows, 16_384),
+        max_rows_per_group=row_group_rows,
+        existing_data_behavior="error",
+    )
+
+
+def open_interim_dataset(path):
+    return ds.dataset(
+        path,
+        format="parquet",
+        partitioning=ds.HivePartitioning.discover(schema=PARTITION_SCHEMA),
+    )
+
+
+def read_interim_dataset(path, columns=None, filter=None, split=None):
+    """
+    Читает датасет в pandas. columns — проекция, filter — выражение
+    pyarrow.dataset (например ds.field("market_type") == "primary"),
+    split — имя выборки из SPLIT_FILTERS. Фильтры по партициям отсекают
+    файлы целиком, остальные проверяются по статистикам row group'ов.
+    Строки возвращаются в порядке df, переданного write_interim_dataset.
+    """
+    dataset = open_interim_dataset(path)
+
+    if split is not None:
+        split_filter = SPLIT_FILTERS[split]
+        filter = split_filter if filter is None else filter & split_filter
+
+    has_row_index = ROW_INDEX_COLUMN in dataset.schema.names
+    read_columns = columns
+    if columns is not None and has_row_index:
+        read_columns = list(columns) + [ROW_INDEX_COLUMN]
+
+    table = dataset.to_table(columns=read_columns, filter=filter)
+    if has_row_index:
+        table = table.sort_by(ROW_INDEX_COLUMN).drop_columns([ROW_INDEX_COLUMN])
+    df = table.to_pandas()
+
+    if columns is None:
+        # Партиционные колонки приходят последними — возвращаем исходный порядок
+        pandas_meta = json.loads(dataset.schema.metadata[b"pandas"])
+        df = df[[col["name"] for col in pandas_meta["columns"]]]
+
+    # Словари файлов и партиций склеиваются в порядке обхода каталогов —
+    # возвращаем категории в отсортированном виде, как при записи
+    for col in df.select_dtypes("category").columns:
+        df[col] = df[col].cat.reorder_categories(sorted(df[col].cat.categories))
+
+    return df
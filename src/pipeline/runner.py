@@ -0,0 +1,143 @@
+"""
+Прогон цепочки стадий в одном процессе: выход стадии передается следующей
+как DataFrame, без записи и чтения parquet на каждой границе. DVC-выходы
+пишутся только на выбранных границах (по умолчанию — только у последней
+стадии), после прогона их нужно зафиксировать через `dvc commit`.
+
+    python -m src.pipeline.runner --from geocode --to wnir_all --write-at split
+    python -m src.pipeline.runner --measure-io
+
+--measure-io дополнительно замеряет, сколько стоили бы запись и чтение
+parquet на границах, где прогон их пропустил: запись — в буфер в памяти,
+чтение — обратно из него.
+"""
+
+import argparse
+import io
+import time
+from dataclasses import dataclass, field
+from importlib import import_module
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from dvc.api import params_show
+
+STAGES = [
+    "clean",
+    "geocode",
+    "administrative_district",
+    "split",
+    "price_discount",
+    "wnir_all",
+]
+
+
+@dataclass
+class StageTiming:
+    name: str
+    read: float = 0.0
+    compute: float = 0.0
+    write: float = 0.0
+    saved: float | None = None
+    rows: int = 0
+
+
+@dataclass
+class ChainReport:
+    stages: list = field(default_factory=list)
+
+    def print(self):
+        print(
+            f"{'stage':<24}{'rows':>12}{'read, s':>10}{'compute, s':>12}"
+            f"{'write, s':>10}{'saved, s':>10}"
+        )
+        for t in self.stages:
+            saved = "-" if t.saved is None else f"{t.saved:.2f}"
+            print(
+                f"{t.name:<24}{t.rows:>12,}{t.read:>10.2f}{t.compute:>12.2f}"
+                f"{t.write:>10.2f}{saved:>10}"
+            )
+
+        total = sum(t.read + t.compute + t.write for t in self.stages)
+        saved = sum(t.saved for t in self.stages if t.saved is not None)
+        print(f"total {total:.2f} s, serialization saved {saved:.2f} s")
+
+
+def _parquet_round_trip(df):
+    # Сколько стоила бы граница между процессами: df -> parquet -> df
+    start = time.perf_counter()
+    buffer = io.BytesIO()
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), buffer)
+    write = time.perf_counter() - start
+
+    start = time.perf_counter()
+    buffer.seek(0)
+    pq.read_table(buffer).to_pandas()
+    read = time.perf_counter() - start
+
+    return write, read
+
+
+def run_chain(stage_names, params, write_at=(), measure_io=False):
+    """
+    Выполняет стадии stage_names по порядку в текущем процессе. Вход первой
+    стадии читается с диска, выход пишется у стадий из write_at и у последней.
+    """
+    modules = {name: import_module(f"src.stages.{name}") for name in stage_names}
+    report = ChainReport()
+
+    df = None
+    for i, name in enumerate(stage_names):
+        stage = modules[name]
+        timing = StageTiming(name)
+
+        if i == 0:
+            start = time.perf_counter()
+            df = stage.read_input()
+            timing.read = time.perf_counter() - start
+
+        start = time.perf_counter()
+        df = stage.run(df, params)
+        timing.compute = time.perf_counter() - start
+        timing.rows = len(df)
+
+        is_last = i == len(stage_names) - 1
+        if is_last or name in write_at:
+            start = time.perf_counter()
+            stage.write_output(df, params)
+            timing.write = time.perf_counter() - start
+
+        if not is_last and measure_io:
+            # Записанный выход все равно не читается следующей стадией,
+            # пропущенный — еще и не пишется
+            write, read = _parquet_round_trip(df)
+            timing.saved = read if name in write_at else write + read
+
+        report.stages.append(timing)
+        print(f"[{name}] done in {timing.compute:.1f} s")
+
+    return df, report
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--from", dest="start", choices=STAGES, default=STAGES[0])
+    parser.add_argument("--to", dest="stop", choices=STAGES, default=STAGES[-1])
+    parser.add_argument("--write-at", nargs="*", choices=STAGES, default=[])
+    parser.add_argument("--measure-io", action="store_true")
+    args = parser.parse_args()
+
+    params = params_show()
+    if args.start == "clean" and params["clean"]["streaming"]["enabled"]:
+        raise ValueError("Потоковый clean пишет parquet сам: запустите его отдельно")
+
+    stage_names = STAGES[STAGES.index(args.start) : STAGES.index(args.stop) + 1]
+    if not stage_names:
+        raise ValueError(f"Стадия {args.stop} идет раньше {args.start}")
+
+    _, report = run_chain(stage_names, params, args.write_at, args.measure_io)
+    report.print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Мергеабельная гистограмма для квантилей по потоку значений: общая для
+стриминга clean (99-й перцентиль цены) и сводок цен в price_discount.
+"""
+
+import numpy as np
+
+
+class QuantileSketch:
+    """
+    Гистограмма цен в лог-бинах: за один проход дает бин, в котором лежит
+    нужный квантиль; точное значение добирается вторым проходом по этому бину.
+    """
+
+    def __init__(self, min_value, max_value, n_bins):
+        self.edges = np.geomspace(min_value, max_value, n_bins + 1)
+        self.counts = np.zeros(n_bins + 2, dtype=np.int64)  # + хвосты вне диапазона
+
+    def _bins(self, values):
+        return np.searchsorted(self.edges, values, side="right")
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        self.counts += np.bincount(self._bins(values), minlength=len(self.counts))
+
+    @property
+    def n(self):
+        return int(self.counts.sum())
+
+    def rank_bins(self, q):
+        # Позиции, участвующие в линейной интерполяции (как в Series.quantile)
+        pos = (self.n - 1) * q
+        ranks = np.array([np.floor(pos), np.ceil(pos)], dtype=np.int64)
+        cumulative = np.cumsum(self.counts)
+        bins = np.searchsorted(cumulative, ranks, side="right")
+        return pos, ranks, bins, cumulative
+
+    def quantile(self, q, read_values):
+        """read_values(lo_bin, hi_bin) -> все значения из бинов [lo_bin, hi_bin]."""
+        if self.n == 0:
+            return np.nan
+
+        pos, ranks, bins, cumulative = self.rank_bins(q)
+        below = int(cumulative[bins[0] - 1]) if bins[0] > 0 else 0
+
+        values = np.sort(read_values(bins[0], bins[1]))
+        lo, hi = values[ranks - below]
+
+        return lo + (hi - lo) * (pos - ranks[0])
+
+    def merge(self, other):
+        """Складывает гистограммы с одинаковыми границами бинов."""
+        self.counts += other.counts
+        return self
+
+    def approx_quantile(self, q):
+        """
+        Квантиль без второго прохода: значения внутри бина считаются
+        равномерно распределенными. Относительная ошибка — не больше ширины
+        бина (edges[i + 1] / edges[i] - 1); хвосты прижимаются к min/max.
+        """
+        if self.n == 0:
+            return np.nan
+
+        pos, ranks, bins, cumulative = self.rank_bins(q)
+        below = np.where(bins > 0, cumulative[np.maximum(bins - 1, 0)], 0)
+
+        # Бин b (1..n_bins) покрывает [edges[b - 1], edges[b])
+        lo = self.edges[np.clip(bins - 1, 0, len(self.edges) - 1)]
+        hi = self.edges[np.clip(bins, 0, len(self.edges) - 1)]
+        fraction = (ranks - below + 0.5) / self.counts[bins]
+        lo, hi = lo + (hi - lo) * fraction
+
+        return lo + (hi - lo) * (pos - ranks[0])
@@ -1,21 +1,66 @@
 import pandas as pd
+from dvc.api import params_show
 
-from src.administrative_district.enrich_df import add_administrative_district
+from src.administrative_district.enrich_df import (
+    add_administrative_district,
+    add_administrative_district_grid,
+    add_administrative_district_unique,
+)
 
+SHP_PATH = "data/complimentary/ao.shp"
+INPUT_PATH = "data/interim/geocode.parquet"
+OUTPUT_PATH = "data/interim/administrative_district.parquet"
+
+
+def _fill_outside_moscow(district):
+    district = district.astype("category")
+    if "outside_moscow" not in district.cat.categories:
+        district = district.cat.add_categories(["outside_moscow"])
+
+    district = district.fillna("outside_moscow").cat.remove_unused_categories()
+
+    return district.cat.reorder_categories(sorted(district.cat.categories))
+
+
+def read_input():
+    return pd.read_parquet(INPUT_PATH, engine="pyarrow")
 
-def main():
-    df = pd.read_parquet("data/interim/geocode.parquet", engine="pyarrow")
 
-    df = add_administrative_district(df, "data/complimentary/ao.shp")
+def run(df, params):
+    geo = params["geocode"]["geo"]
+    method = params["administrative_district"]["method"]
+    grid_params = params["administrative_district"]["grid"]
 
-    df["administrative_district"] = df["administrative_district"].fillna(
-        "outside_moscow"
-    )
+    if method == "grid":
+        df = add_administrative_district_grid(
+            df,
+            SHP_PATH,
+            cache_dir=grid_params["cache_dir"],
+            lon_min=geo["longitude"]["min"],
+            lon_max=geo["longitude"]["max"],
+            lat_min=geo["latitude"]["min"],
+            lat_max=geo["latitude"]["max"],
+            step=grid_params["step"],
+        )
+    elif method == "unique":
+        df = add_administrative_district_unique(df, SHP_PATH)
+    elif method == "sjoin":
+        df = add_administrative_district(df, SHP_PATH)
+    else:
+        raise ValueError(f"Неизвестный method: {method}")
 
-    df["administrative_district"] = df["administrative_district"].astype("category")
-    df.to_parquet(
-        "data/interim/administrative_district.parquet", index=False, engine="pyarrow"
-    )
+    df["administrative_district"] = _fill_outside_moscow(df["administrative_district"])
+
+    return df
+
+
+def write_output(df, params):
+    df.to_parquet(OUTPUT_PATH, index=False, engine="pyarrow")
+
+
+def main():
+    params = params_show()
+    write_output(run(read_input(), params), params)
 
 
 if __name__ == "__main__":
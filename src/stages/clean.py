@@ -1,3 +1,7 @@
+from pathlib import Path
+
+from dvc.api import params_show
+
 from src.clean.constants import INTERIM_CLEAN_COLUMNS
 from src.clean.adapters import (
     DF1_ADAPTER,
@@ -5,113 +9,187 @@ from src.clean.adapters import (
     DF3_ADAPTER,
     DF4_ADAPTER,
     DF5_ADAPTER,
+    COERCED_TO_NA,
+    DATE_FORMAT_FALLBACKS,
     adapt_dataframes,
 )
 from src.clean.concat import concat_dfs
-from src.clean.data_loader import read_dfs
+from src.clean.data_loader import RAW_CACHE_DIR, RAW_SOURCES, read_dfs_projected
+from src.clean.filter_pipeline import FilterStep, apply_filters, write_filter_report
 from src.clean.filters import (
-    drop_duplicates,
-    drop_nan_addresses,
-    drop_nan_prices,
-    drop_nan_rows,
-    filter_by_address_len,
-    filter_by_area,
-    filter_by_build_year,
-    filter_by_floor,
-    filter_by_price,
-    filter_common_moscow_geo_point,
-    select_residential,
-    filter_after_2017,
+    address_len_mask,
+    after_2017_mask,
+    build_year_mask,
+    common_moscow_geo_point_mask,
+    first_occurrence_mask,
+    not_all_nan_mask,
+    notna_mask,
+    price_quantile_mask,
+    range_mask,
+    residential_mask,
 )
 from src.clean.normalization import normalize_datasets
+from src.clean.streaming import run_streaming_clean
 from src.clean.type_casting import cast_types
-from dvc.api import params_show
-
 
-def main():
-    params = params_show()["clean"]
+OUTPUT_PATH = "data/interim/clean.parquet"
+
+# Состояние дедупликации стриминга между запусками; каталог — persist-out
+# стадии в dvc.yaml
+DEDUP_STATE_DIR = Path("data/cache/clean_dedup")
+DEDUP_STATE_PATH = DEDUP_STATE_DIR / "seen_rows.npz"
+
+ADAPTERS = [DF1_ADAPTER, DF2_ADAPTER, DF3_ADAPTER, DF4_ADAPTER, DF5_ADAPTER]
+
+DROPPED_COLUMNS = [
+    "housing_type",
+    "floor_count",
+    "ceiling_height",
+    "flat_type",
+    "balcony",
+]
+
+
+def build_filter_steps(params):
+    # Порядок шагов повторяет прежнюю цепочку фильтров clean
+    return [
+        FilterStep("select_residential", residential_mask),
+        FilterStep("drop_duplicates", first_occurrence_mask, staged=True),
+        FilterStep("drop_nan_rows", not_all_nan_mask),
+        FilterStep("drop_nan_addresses", lambda df: notna_mask(df, ["address"])),
+        FilterStep(
+            "drop_nan_prices",
+            lambda df: notna_mask(df, ["price", "price_per_square_meter"]),
+        ),
+        FilterStep(
+            "filter_by_area",
+            lambda df: range_mask(
+                df,
+                "area",
+                params["area"]["min"],
+                params["area"]["max"],
+                dtype="float32",
+            ),
+        ),
+        FilterStep(
+            "filter_by_floor",
+            lambda df: range_mask(
+                df, "floor", params["floor"]["min"], params["floor"]["max"]
+            ),
+        ),
+        FilterStep(
+            "filter_by_price",
+            lambda df: range_mask(
+                df,
+                "price",
+                params["price"]["min"],
+                params["price"]["max"],
+                dtype="float32",
+            ),
+        ),
+        FilterStep("filter_by_price_quantile", price_quantile_mask, staged=True),
+        FilterStep(
+            "filter_by_build_year",
+            lambda df: build_year_mask(
+                df, params["build_year"]["min"], params["build_year"]["max"]
+            ),
+        ),
+        FilterStep(
+            "filter_by_address_len",
+            lambda df: address_len_mask(df, params["address"]["min_len"]),
+        ),
+        FilterStep(
+            "filter_common_moscow_geo_point",
+            lambda df: common_moscow_geo_point_mask(
+                df,
+                params["common_moscow_point"]["longitude"],
+                params["common_moscow_point"]["latitude"],
+            ),
+        ),
+        FilterStep(
+            "drop_nan_room_count_build_year",
+            lambda df: notna_mask(df, ["room_count", "build_year"]),
+        ),
+        FilterStep("filter_after_2017", lambda df: after_2017_mask(df, "date")),
+    ]
+
+
+def main_streaming(params, adapters):
+    streaming = params["streaming"]
+    DATE_FORMAT_FALLBACKS.clear()
+    COERCED_TO_NA.clear()
+
+    report = run_streaming_clean(
+        RAW_SOURCES,
+        adapters,
+        build_filter_steps(params),
+        OUTPUT_PATH,
+        dropped_columns=DROPPED_COLUMNS,
+        price_min=params["price"]["min"],
+        price_max=params["price"]["max"],
+        csv_block_mb=streaming["csv_block_mb"],
+        parquet_batch_rows=streaming["parquet_batch_rows"],
+        quantile_bins=streaming["quantile_bins"],
+        cache_dir=RAW_CACHE_DIR,
+        dedup_state_path=DEDUP_STATE_PATH if streaming["dedup_state"] else None,
+    )
 
-    dfs = read_dfs()
+    report["date_format_fallbacks"] = DATE_FORMAT_FALLBACKS
+    report["coerced_to_na"] = COERCED_TO_NA
+    write_filter_report(report, "data/reports/clean_filters.json")
 
-    adapters = [DF1_ADAPTER, DF2_ADAPTER, DF3_ADAPTER, DF4_ADAPTER, DF5_ADAPTER]
-    dfs = adapt_dataframes(dfs, adapters)
 
-    dfs = normalize_datasets(dfs)
+def read_input():
+    """Сырые источники в порядке ADAPTERS, только нужные адаптерам колонки."""
+    return read_dfs_projected(ADAPTERS)
 
-    df_combined = concat_dfs(dfs)
 
-    df_residential = select_residential(df_combined)
+def run(dfs, params):
+    """Нестриминговый clean: сырые источники из read_input -> очищенный DataFrame."""
+    params = params["clean"]
+    DATE_FORMAT_FALLBACKS.clear()
+    COERCED_TO_NA.clear()
 
-    df_no_dups = drop_duplicates(df_residential)
+    dfs = adapt_dataframes(dfs, ADAPTERS)
 
-    df_no_nan_rows = drop_nan_rows(df_no_dups)
-    df_no_nan_addresses = drop_nan_addresses(df_no_nan_rows)
-    df_no_nan_prices = drop_nan_prices(df_no_nan_addresses)
+    dfs = normalize_datasets(dfs)
 
-    df_type_casted = cast_types(df_no_nan_prices, INTERIM_CLEAN_COLUMNS)
+    df_combined = concat_dfs(dfs)
 
-    df_filtered_by_area = filter_by_area(
-        df_type_casted,
-        params["area"]["min"],
-        params["area"]["max"],
-    )
-    df_filter_by_floor = filter_by_floor(
-        df_filtered_by_area,
-        params["floor"]["min"],
-        params["floor"]["max"],
-    )
-    df_filter_by_price = filter_by_price(
-        df_filter_by_floor,
-        params["price"]["min"],
-        params["price"]["max"],
-    )
-    df_filter_by_build_year = filter_by_build_year(
-        df_filter_by_price,
-        params["build_year"]["min"],
-        params["build_year"]["max"],
+    # Все фильтры считаются в одну маску, строки выбираются один раз
+    df_filtered, report = apply_filters(
+        df_combined,
+        build_filter_steps(params),
+        columns=[c for c in df_combined.columns if c not in DROPPED_COLUMNS],
     )
+    del df_combined
 
-    df_filter_by_address_len = filter_by_address_len(
-        df_filter_by_build_year,
-        params["address"]["min_len"],
-    )
-    df_filter_common_moscow_geo_point = filter_common_moscow_geo_point(
-        df_filter_by_address_len,
-        params["common_moscow_point"]["longitude"],
-        params["common_moscow_point"]["latitude"],
-    )
+    report["date_format_fallbacks"] = DATE_FORMAT_FALLBACKS
+    report["coerced_to_na"] = COERCED_TO_NA
+    write_filter_report(report, "data/reports/clean_filters.json")
 
-    df_drop_nans_room_count_build_year = df_filter_common_moscow_geo_point.dropna(
-        subset=["room_count", "build_year"]
-    )
+    df_clean = cast_types(df_filtered, INTERIM_CLEAN_COLUMNS)
 
-    df_drop_columns_floor_count_ceiling_height = (
-        df_drop_nans_room_count_build_year.drop(
-            columns=["floor_count", "ceiling_height"]
-        )
-    )
+    df_clean["year"] = df_clean["date"].dt.year.astype("uint16")
+    df_clean["month"] = df_clean["date"].dt.month.astype("uint8")
+    df_clean["day"] = df_clean["date"].dt.day.astype("uint8")
 
-    df_fileter_after_2017 = filter_after_2017(
-        df_drop_columns_floor_count_ceiling_height, "date"
-    )
+    return df_clean
 
-    df_fileter_after_2017["year"] = df_fileter_after_2017["date"].dt.year.astype(
-        "uint16"
-    )
-    df_fileter_after_2017["month"] = df_fileter_after_2017["date"].dt.month.astype(
-        "uint8"
-    )
-    df_fileter_after_2017["day"] = df_fileter_after_2017["date"].dt.day.astype("uint8")
 
-    df_no_flat_type = df_fileter_after_2017.drop(columns=["flat_type"])
+def write_output(df_clean, params):
+    df_clean.to_parquet(OUTPUT_PATH, index=False, engine="pyarrow")
 
-    df_no_balcony = df_no_flat_type.drop(columns=["balcony"])
 
-    df_clean = df_no_balcony
+def main():
+    params = params_show()
+    DEDUP_STATE_DIR.mkdir(parents=True, exist_ok=True)
 
-    # df_clean = cast_types(df_fileter_after_2017, CANONICAL_COLUMNS)
+    if params["clean"]["streaming"]["enabled"]:
+        main_streaming(params["clean"], ADAPTERS)
+        return
 
-    df_clean.to_parquet("data/interim/clean.parquet", index=False, engine="pyarrow")
+    write_output(run(read_input(), params), params)
 
 
 if __name__ == "__main__":
@@ -5,10 +5,16 @@ from src.geocode.filters import filter_by_geo
 from src.geocode.geocoding import geocode_addresses
 
 
-def main():
-    params = params_show()["geocode"]
+INPUT_PATH = "data/interim/clean.parquet"
+OUTPUT_PATH = "data/interim/geocode.parquet"
+
+
+def read_input():
+    return pd.read_parquet(INPUT_PATH)
+
 
-    df_clean = pd.read_parquet("data/interim/clean.parquet")
+def run(df_clean, params):
+    params = params["geocode"]
 
     # Захардкодил очкистку от нулевых координат, чтобы не вызывать геокодинг. Не помню, почему его не хочу запускать. Мб из-за того что нужно преедавать api адреса на сервер
     df_clean = df_clean.dropna(subset=["latitude", "longitude"])
@@ -27,9 +33,16 @@ def main():
         params["geo"]["latitude"]["max"],
     )
 
-    df_filtered_by_geo = df_filtered_by_geo.drop(columns=["address"])
+    return df_filtered_by_geo.drop(columns=["address"])
 
-    df_filtered_by_geo.to_parquet("data/interim/geocode.parquet", index=False)
+
+def write_output(df, params):
+    df.to_parquet(OUTPUT_PATH, index=False)
+
+
+def main():
+    params = params_show()
+    write_output(run(read_input(), params), params)
 
 
 if __name__ == "__main__":
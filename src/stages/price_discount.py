@@ -1,39 +1,228 @@
+import copy
+from pathlib import Path
+
+import joblib
+import numpy as np
 import pandas as pd
+from dvc.api import params_show
 from sklearn.base import BaseEstimator, TransformerMixin
 
+from src.clean.concat import concat_dfs
+from src.interim.dataset import (
+    SPLITS,
+    read_interim_dataset,
+    split_mask,
+    write_interim_dataset,
+)
+from src.sketch import QuantileSketch
+
+
+def month_codes(dates):
+    """Номер месяца от 1970-01 (year * 12 + month - 1 - 1970 * 12); NaT -> -1."""
+    months = dates.to_numpy(dtype="datetime64[ns]").astype("datetime64[M]")
+    return np.where(np.isnat(months), -1, months.astype(np.int64))
+
 
 class PriceDiscounter(BaseEstimator, TransformerMixin):
-    def __init__(self, min_obs=30):
+    """
+    discount_map_ — плотная float32-матрица индексов (рынок x месяц):
+    строка — позиция market_type в markets_, столбец — month_codes() минус
+    month_offset_. Ячейки без данных в train равны 1.0, так что transform —
+    это одна выборка по индексам вместо merge.
+
+    Для каждой ячейки (рынок, месяц) хранится мергеабельная сводка: число
+    сделок в monthly_ и гистограмма цены за м² в summaries_. partial_fit
+    вливает новые сделки только в затронутые ячейки и пересчитывает их
+    медианы по гистограмме (с точностью до ширины бина). Базовый месяц рынка
+    при этом не сдвигается (если не передать reanchor=True), поэтому индексы
+    остальных ячеек не меняются и заново нормализовать нужно только строки
+    из updated_rows().
+    """
+
+    def __init__(self, min_obs=30, sketch_min=1e3, sketch_max=1e9, sketch_bins=8192):
         self.min_obs = min_obs
+        self.sketch_min = sketch_min
+        self.sketch_max = sketch_max
+        self.sketch_bins = sketch_bins
         self.discount_map_ = None
 
-    def fit(self, df, y=None):
+    @staticmethod
+    def _cells_frame(df):
+        months = month_codes(df["date"])
+        dated = months >= 0
 
-        df_ = df.copy()
-        # df_["date"] = pd.to_datetime(df_[["year", "month", "day"]])
-        df_["period"] = df_["date"].dt.to_period("M").dt.to_timestamp()
+        return pd.DataFrame(
+            {
+                "market_type": df["market_type"].array[dated],
+                "month": months[dated],
+                "price_per_square_meter": df["price_per_square_meter"].array[dated],
+            }
+        )
 
-        monthly = (
-            df_.groupby(["market_type", "period"], as_index=False)
+    @staticmethod
+    def _monthly(frame, median):
+        return (
+            frame.groupby(["market_type", "month"], as_index=False, observed=True)
             .agg(
-                price_sqm_median=("price_per_square_meter", "median"),
+                price_sqm_median=("price_per_square_meter", median),
                 n_obs=("price_per_square_meter", "size"),
             )
-            .sort_values(["market_type", "period"])
+            .astype({"market_type": "str"})
+        )
+
+    def _summaries(self, frame):
+        """Гистограммы цен по ячейкам frame: {(market_type, month): QuantileSketch}."""
+        markets, market_labels = pd.factorize(frame["market_type"])
+        months = frame["month"].to_numpy()
+        cell_codes, cell_keys = pd.factorize(markets * 2**20 + months)
+
+        values = frame["price_per_square_meter"].to_numpy(
+            dtype=np.float64, na_value=np.nan
         )
+        priced = ~np.isnan(values)
 
-        monthly = monthly[monthly["n_obs"] >= self.min_obs].copy()
+        n_bins = len(self.sketch_.counts)
+        counts = np.bincount(
+            cell_codes[priced] * n_bins + self.sketch_._bins(values[priced]),
+            minlength=len(cell_keys) * n_bins,
+        ).reshape(len(cell_keys), n_bins)
 
-        monthly["base_value"] = monthly.groupby("market_type")[
-            "price_sqm_median"
-        ].transform("last")
+        summaries = {}
+        for key, cell_counts in zip(cell_keys, counts):
+            sketch = copy.copy(self.sketch_)  # границы бинов общие
+            sketch.counts = cell_counts.copy()
+            summaries[(str(market_labels[key // 2**20]), int(key % 2**20))] = sketch
 
-        monthly["discount_index"] = monthly["price_sqm_median"] / monthly["base_value"]
+        return summaries
 
-        self.discount_map_ = monthly[["market_type", "period", "discount_index"]]
+    def fit(self, df, y=None):
+
+        self.sketch_ = QuantileSketch(
+            self.sketch_min, self.sketch_max, self.sketch_bins
+        )
+        self.discount_map_ = None
+        self.base_month_ = {}
+
+        frame = self._cells_frame(df)
+        self.monthly_ = self._monthly(frame, "median")
+        self.summaries_ = self._summaries(frame)
+
+        self._update_discount_map(reanchor=True)
 
         return self
 
+    def partial_fit(self, df, y=None, reanchor=False):
+        """
+        Вливает новые сделки df в сводки. Медианы пересчитываются только
+        в затронутых ячейках; после вызова updated_rows() отмечает строки,
+        индекс которых изменился.
+        """
+        if self.discount_map_ is None:
+            return self.fit(df)
+
+        frame = self._cells_frame(df)
+
+        for cell, sketch in self._summaries(frame).items():
+            if cell in self.summaries_:
+                self.summaries_[cell].merge(sketch)
+            else:
+                self.summaries_[cell] = sketch
+
+        added = self._monthly(frame, "size")[["market_type", "month", "n_obs"]]
+        monthly = self.monthly_.merge(
+            added, on=["market_type", "month"], how="outer", suffixes=("", "_added")
+        )
+        monthly["n_obs"] = monthly["n_obs"].fillna(0) + monthly["n_obs_added"].fillna(0)
+        monthly["n_obs"] = monthly["n_obs"].astype(np.int64)
+
+        touched = monthly["n_obs_added"].notna().to_numpy()
+        monthly.loc[touched, "price_sqm_median"] = [
+            self.summaries_[(market, month)].approx_quantile(0.5)
+            for market, month in zip(
+                monthly.loc[touched, "market_type"], monthly.loc[touched, "month"]
+            )
+        ]
+
+        self.monthly_ = monthly.drop(columns=["n_obs_added"])
+        self._update_discount_map(reanchor)
+
+        return self
+
+    def _update_discount_map(self, reanchor):
+        monthly = self.monthly_.sort_values(["market_type", "month"])
+        monthly = monthly[monthly["n_obs"] >= self.min_obs].reset_index(drop=True)
+
+        # Базовый месяц рынка — последний месяц с достаточным числом сделок
+        for market, month in monthly.groupby("market_type")["month"].last().items():
+            if reanchor or market not in self.base_month_:
+                self.base_month_[market] = month
+
+        medians = monthly.set_index(["market_type", "month"])["price_sqm_median"]
+        base_value = medians.loc[
+            [(market, self.base_month_[market]) for market in monthly["market_type"]]
+        ].to_numpy()
+        monthly["discount_index"] = monthly["price_sqm_median"].to_numpy() / base_value
+
+        previous = None
+        if self.discount_map_ is not None:
+            previous = self._lookup(monthly["market_type"], monthly["month"].to_numpy())
+
+        self._set_discount_map(monthly)
+
+        # Ячейки, индекс которых изменился (при первом fit — все)
+        self.updated_ = np.zeros_like(self.discount_map_, dtype=bool)
+        market, month, _ = self._positions(
+            monthly["market_type"], monthly["month"].to_numpy()
+        )
+        current = self.discount_map_[market, month]
+        self.updated_[market, month] = True if previous is None else current != previous
+
+    def _set_discount_map(self, monthly):
+        self.markets_ = pd.Index(monthly["market_type"].unique())
+        self.month_offset_ = 0
+        n_months = 0
+        if len(monthly) > 0:
+            self.month_offset_ = int(monthly["month"].min())
+            n_months = int(monthly["month"].max()) + 1 - self.month_offset_
+
+        self.discount_map_ = np.ones((len(self.markets_), n_months), dtype=np.float32)
+        self.discount_map_[
+            self.markets_.get_indexer(monthly["market_type"]),
+            monthly["month"].to_numpy() - self.month_offset_,
+        ] = monthly["discount_index"].to_numpy()
+
+    def _positions(self, market_type, months):
+        """Позиции (рынок, месяц) в discount_map_ и маска ячеек, которые в ней есть."""
+        market = self.markets_.get_indexer(market_type)
+        known = (market >= 0) & (months >= 0)
+
+        month = months - self.month_offset_
+        known &= (month >= 0) & (month < self.discount_map_.shape[1])
+
+        return market, month, known
+
+    def _lookup(self, market_type, months):
+        market, month, known = self._positions(market_type, months)
+
+        discount = np.ones(len(market), dtype=np.float32)
+        discount[known] = self.discount_map_[market[known], month[known]]
+
+        return discount
+
+    def discount_index(self, df):
+        """Индекс каждой строки df; 1.0 для месяцев/рынков, которых не было в train."""
+        return self._lookup(df["market_type"], month_codes(df["date"]))
+
+    def updated_rows(self, df):
+        """Строки df, индекс которых изменился при последнем fit/partial_fit."""
+        months = month_codes(df["date"])
+        market, month, known = self._positions(df["market_type"], months)
+
+        updated = np.zeros(len(df), dtype=bool)
+        updated[known] = self.updated_[market[known], month[known]]
+
+        return updated
+
     def transform(self, df):
 
         # Проверяем, был ли вызван fit
@@ -42,30 +231,22 @@ class PriceDiscounter(BaseEstimator, TransformerMixin):
                 "Этот экземпляр PriceDiscounter еще не был обучен. Вызовите .fit() перед .transform()."
             )
 
-        df_ = df.copy()
-        # df_["date"] = pd.to_datetime(df_[["year", "month", "day"]])
-        df_["period"] = df_["date"].dt.to_period("M").dt.to_timestamp()
-
-        # Присоединяем карту, полученную на train-данных
-        df_ = df_.merge(
-            self.discount_map_,
-            on=["market_type", "period"],
-            how="left",
-        )
+        discount = self.discount_index(df)
 
-        # Fallback для месяцев/рынков, которых не было в train
-        df_["discount_index"] = df_["discount_index"].fillna(1.0)
+        # Неглубокая копия: исходные колонки не копируются, df не меняется
+        df_ = df.copy(deep=False)
 
         # Нормализация
         df_["price_per_square_meter_normalized"] = (
-            df_["price_per_square_meter"] / df_["discount_index"]
-        ).astype("float32")
+            df["price_per_square_meter"].to_numpy(dtype=np.float32, na_value=np.nan)
+            / discount
+        )
 
         df_["price_normalized"] = (
-            df_["price_per_square_meter_normalized"] * df_["area"]
+            df_["price_per_square_meter_normalized"] * df["area"]
         ).astype("float32")
 
-        return df_.drop(columns=["period", "discount_index"])
+        return df_
 
     def fit_transform(self, df, y=None):
 
@@ -73,32 +254,63 @@ class PriceDiscounter(BaseEstimator, TransformerMixin):
         return self.transform(df)
 
 
-def main():
-    df_train = pd.read_parquet("data/interim/split_train.parquet", engine="pyarrow")
-    df_valid = pd.read_parquet("data/interim/split_valid.parquet", engine="pyarrow")
-    df_test = pd.read_parquet("data/interim/split_test.parquet", engine="pyarrow")
+INPUT_PATH = "data/interim/split"
+OUTPUT_PATH = "data/interim/price_discount"
+# Обученный PriceDiscounter прошлого запуска (persist-out стадии)
+STATE_PATH = Path("data/cache/price_discounter.joblib")
 
+
+def read_input():
+    return read_interim_dataset(INPUT_PATH)
+
+
+def fit_discounter(df_train, incremental):
+    """
+    PriceDiscounter по train. incremental — вместо полного fit дообучить
+    (partial_fit) сохраненный в STATE_PATH только на сделках месяцев позже
+    последнего, который он видел. Годится, пока train лишь дополняется новыми
+    месяцами; при других параметрах сохраненной модели — полный fit.
+    """
     price_discounter = PriceDiscounter(min_obs=30)
 
-    train_processed = price_discounter.fit_transform(df_train).drop(
-        columns=["price", "price_per_square_meter"]
-    )
-    valid_processed = price_discounter.transform(df_valid).drop(
-        columns=["price", "price_per_square_meter"]
-    )
-    test_processed = price_discounter.transform(df_test).drop(
-        columns=["price", "price_per_square_meter"]
-    )
+    if incremental and STATE_PATH.exists():
+        saved = joblib.load(STATE_PATH)
+        if saved.get_params() == price_discounter.get_params():
+            new = month_codes(df_train["date"]) > int(saved.monthly_["month"].max())
+            print(f"price_discount: partial_fit on {int(new.sum())} new train rows")
+            if new.any():
+                # Базовый месяц — последний, как при полном fit
+                saved.partial_fit(df_train.loc[new], reanchor=True)
+            return saved
 
-    train_processed.to_parquet(
-        "data/interim/price_discount_train.parquet", index=False, engine="pyarrow"
-    )
-    valid_processed.to_parquet(
-        "data/interim/price_discount_valid.parquet", index=False, engine="pyarrow"
-    )
-    test_processed.to_parquet(
-        "data/interim/price_discount_test.parquet", index=False, engine="pyarrow"
+    return price_discounter.fit(df_train)
+
+
+def run(df, params):
+    df_train, df_valid, df_test = (df.loc[split_mask(df, split)] for split in SPLITS)
+
+    price_discounter = fit_discounter(
+        df_train, params["price_discount"]["incremental"]
     )
+    STATE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    joblib.dump(price_discounter, STATE_PATH)
+
+    return concat_dfs(
+        [
+            price_discounter.transform(df_train),
+            price_discounter.transform(df_valid),
+            price_discounter.transform(df_test),
+        ]
+    ).drop(columns=["price", "price_per_square_meter"])
+
+
+def write_output(df, params):
+    write_interim_dataset(df, OUTPUT_PATH, **params["interim_dataset"])
+
+
+def main():
+    params = params_show()
+    write_output(run(read_input(), params), params)
 
 
 if __name__ == "__main__":
@@ -1,20 +1,29 @@
 import pandas as pd
+from dvc.api import params_show
+
+from src.interim.dataset import write_interim_dataset
+
+INPUT_PATH = "data/interim/administrative_district.parquet"
+OUTPUT_PATH = "data/interim/split"
+
+
+def read_input():
+    return pd.read_parquet(INPUT_PATH)
+
+
+def run(df, params):
+    # train/valid/test больше не пишутся отдельными файлами: выборки —
+    # фильтры по year (SPLIT_FILTERS), а year — ключ партиционирования
+    return df
+
+
+def write_output(df, params):
+    write_interim_dataset(df, OUTPUT_PATH, **params["interim_dataset"])
 
 
 def main():
-    df = pd.read_parquet("data/interim/administrative_district.parquet")
-
-    df_train = df[df["year"] < 2024]
-    df_valid = df[(df["year"] >= 2024) & (df["year"] < 2025)]
-    df_test = df[df["year"] >= 2025]
-
-    df_train.to_parquet(
-        "data/interim/split_train.parquet", index=False, engine="pyarrow"
-    )
-    df_valid.to_parquet(
-        "data/interim/split_valid.parquet", index=False, engine="pyarrow"
-    )
-    df_test.to_parquet("data/interim/split_test.parquet", index=False, engine="pyarrow")
+    params = params_show()
+    write_output(run(read_input(), params), params)
 
 
 if __name__ == "__main__":
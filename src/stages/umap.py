@@ -7,15 +7,17 @@ from sklearn.pipeline import Pipeline
 # Replace standard umap with cuml
 from cuml.manifold import UMAP
 
+from src.interim.dataset import read_interim_dataset
+
 
 def main():
     params = params_show()["umap"]
     n_comp = params["umap_n_components"]
 
     print("Loading interim datasets...")
-    df_train = pd.read_parquet("data/interim/price_discount_train.parquet")
-    df_valid = pd.read_parquet("data/interim/price_discount_valid.parquet")
-    df_test = pd.read_parquet("data/interim/price_discount_test.parquet")
+    df_train = read_interim_dataset("data/interim/price_discount", split="train")
+    df_valid = read_interim_dataset("data/interim/price_discount", split="valid")
+    df_test = read_interim_dataset("data/interim/price_discount", split="test")
 
     date_cols = ["date", "year", "month", "day"]
     price_cols = ["price_per_square_meter_normalized", "price_normalized"]
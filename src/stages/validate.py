@@ -1,10 +1,13 @@
 import argparse
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import pandas as pd
 
 import src.validation.schemas as schemas
+from src.interim.dataset import read_interim_dataset
+from src.validation.fast import validate_fast
 
 
 def main():
@@ -12,6 +15,11 @@ def main():
     parser.add_argument("--stage", required=True)
     parser.add_argument("--inputs", nargs="+", required=True)
     parser.add_argument("--flag-file", required=True)
+    # fast — по parquet-схеме, статистикам и отдельным колонкам (validation/fast.py),
+    # full — pandera на полностью загруженном фрейме
+    parser.add_argument("--mode", choices=["fast", "full"], default="full")
+    # Потоки fast: в памяти одновременно не больше стольких колонок
+    parser.add_argument("--workers", type=int, default=8)
     args = parser.parse_args()
 
     schema_name = f"{args.stage}_schema"
@@ -20,12 +28,21 @@ def main():
 
     schema = getattr(schemas, schema_name)
 
-    # 2. Проверяем каждый переданный файл
-    for path in args.inputs:
-        df = pd.read_parquet(path)
-
-        # Строгая валидация (если что-то не так, скрипт выбросит ошибку и DVC остановится)
-        schema.validate(df)
+    # 2. Проверяем каждый переданный файл (или партиционированный датасет)
+    if args.mode == "fast":
+        # Входы — по очереди, колонки каждого — в одном общем пуле
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            for path in args.inputs:
+                validate_fast(schema, path, executor)
+    else:
+        for path in args.inputs:
+            if Path(path).is_dir():
+                df = read_interim_dataset(path)
+            else:
+                df = pd.read_parquet(path)
+
+            # Строгая валидация (если что-то не так, скрипт выбросит ошибку и DVC остановится)
+            schema.validate(df)
 
     # 3. Если всё прошло успешно, создаем пустой файл для DVC
     Path(args.flag_file).parent.mkdir(parents=True, exist_ok=True)
@@ -1,27 +1,38 @@
-import pandas as pd
 from dvc.api import params_show
 import gc
 import torch
+from src.clean.concat import concat_dfs
+from src.interim.dataset import (
+    SPLITS,
+    read_interim_dataset,
+    split_mask,
+    write_interim_dataset,
+)
 from src.wnir.wnir import calculate_and_impute_wnir
 
+INPUT_PATH = "data/interim/price_discount"
+OUTPUT_PATH = "data/interim/wnir_all"
 
-def main():
-    params = params_show()["wnir"]
+
+def read_input():
+    print("Loading data...")
+    return read_interim_dataset(INPUT_PATH)
+
+
+def run(df, params):
+    params = params["wnir"]
     h = params["h"]
     Rs = list(params["R"].values())
     batch_size = params.get("batch_size", 20000)
     device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
-    print("Loading data...")
-    df_train = pd.read_parquet("data/interim/price_discount_train.parquet")
-    df_train["set_type"] = "train"
-    df_valid = pd.read_parquet("data/interim/price_discount_valid.parquet")
-    df_valid["set_type"] = "valid"
-    df_test = pd.read_parquet("data/interim/price_discount_test.parquet")
-    df_test["set_type"] = "test"
-
-    df = pd.concat([df_train, df_valid, df_test], axis=0, ignore_index=True)
-    df["date"] = pd.to_datetime(df["date"])
+    dfs = []
+    for split in SPLITS:
+        df_split = df.loc[split_mask(df, split)].copy()
+        df_split["set_type"] = split
+        dfs.append(df_split)
+
+    df = concat_dfs(dfs)
     df = df.sort_values("date").reset_index(drop=True)
     gc.collect()
 
@@ -47,14 +58,17 @@ def main():
     # Pandas автоматически проставит NaN во всех колонках wnir для secondary.
     df_master = df_master.join(new_features_all)
 
-    print("\nSaving splits...")
-    for stype in ["train", "valid", "test"]:
-        out_path = f"data/interim/wnir_all_{stype}.parquet"
+    return df_master.drop(columns=["set_type"])
+
+
+def write_output(df, params):
+    print("\nSaving dataset...")
+    write_interim_dataset(df, OUTPUT_PATH, **params["interim_dataset"])
 
-        # Сохраняем обратно в соответствующие выборки
-        df_master[df_master["set_type"] == stype].drop(columns=["set_type"]).to_parquet(
-            out_path, index=False
-        )
+
+def main():
+    params = params_show()
+    write_output(run(read_input(), params), params)
 
     print("WNIR stage completed successfully.")
 
@@ -0,0 +1,183 @@
+"""
+Быстрая проверка parquet-выходов по pandera-схеме без загрузки всего фрейма.
+
+- dtypes и состав колонок проверяются самой схемой на пустом фрейме,
+  восстановленном из parquet-схемы (pandas-метаданные дают те же dtypes,
+  что и read_parquet);
+- nullable=False для целых, дат и категорий проверяется по null_count из
+  статистик row group'ов. NaN в статистики не попадает, поэтому
+  float-колонки (и колонки без статистик) читаются — по одной;
+- isin и strict_nan_logic считаются по одной колонке за раз: в памяти
+  одновременно только проверяемая колонка, market_type и маска строк.
+  strict_nan_logic проверяется, только если схема его задает; колонки
+  правила берутся из metadata схемы.
+
+Колонки проверяются параллельно в потоках общего пула (pyarrow отпускает
+GIL): в памяти не больше колонок, чем потоков в пуле.
+"""
+
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from src.interim.dataset import ROW_INDEX_COLUMN, open_interim_dataset
+
+
+class FastValidationError(ValueError):
+    pass
+
+
+def open_dataset(path):
+    if Path(path).is_dir():
+        return open_interim_dataset(path)
+    return ds.dataset(path, format="parquet")
+
+
+def _null_counts_from_statistics(dataset):
+    """{колонка: число null} по статистикам файлов; None, если статистик нет."""
+    counts = {}
+    for fragment in dataset.get_fragments():
+        metadata = pq.ParquetFile(fragment.path).metadata
+        for i in range(metadata.num_row_groups):
+            row_group = metadata.row_group(i)
+            for j in range(row_group.num_columns):
+                column = row_group.column(j)
+                name = column.path_in_schema
+                stats = column.statistics
+                if stats is None or not stats.has_null_count:
+                    counts[name] = None
+                elif counts.get(name, 0) is not None:
+                    counts[name] = counts.get(name, 0) + stats.null_count
+    return counts
+
+
+def _read_column(dataset, column):
+    return dataset.to_table(columns=[column]).column(column)
+
+
+def _count_missing(values):
+    return pc.sum(pc.is_null(values, nan_is_null=True)).as_py() or 0
+
+
+def check_schema(schema, dataset):
+    # Пустой фрейм с dtypes из pandas-метаданных: проверяет типы и strict.
+    # Служебный номер строки read_interim_dataset во фрейм не попадает
+    arrow_schema = dataset.schema
+    if ROW_INDEX_COLUMN in arrow_schema.names:
+        arrow_schema = arrow_schema.remove(arrow_schema.get_field_index(ROW_INDEX_COLUMN))
+    schema.validate(arrow_schema.empty_table().to_pandas())
+
+
+def check_not_null(schema, dataset, executor):
+    stats_nulls = _null_counts_from_statistics(dataset)
+    errors = []
+
+    def check(name):
+        values_type = dataset.schema.field(name).type
+        if not pa.types.is_floating(values_type) and stats_nulls.get(name) is not None:
+            missing = stats_nulls[name]
+        else:
+            missing = _count_missing(_read_column(dataset, name))
+        if missing:
+            errors.append(f"{name}: {missing} пропусков при nullable=False")
+
+    columns = [
+        name
+        for name, column in schema.columns.items()
+        if not column.nullable and not column.regex
+    ]
+    list(executor.map(check, columns))
+
+    return errors
+
+
+def check_isin(schema, dataset):
+    errors = []
+    for name, column in schema.columns.items():
+        for check in column.checks:
+            allowed = check.statistics.get("allowed_values")
+            if check.name != "isin" or allowed is None:
+                continue
+
+            values = pc.unique(_read_column(dataset, name).combine_chunks())
+            if pa.types.is_dictionary(values.type):
+                values = values.dictionary_decode()
+            extra = set(values.drop_null().to_pylist()) - set(allowed)
+            if extra:
+                errors.append(f"{name}: значения вне {list(allowed)}: {sorted(extra)}")
+    return errors
+
+
+def wnir_nan_logic_failures(dataset, wnir_cols, executor):
+    """
+    Номера строк, где NaN в wnir-колонке не совпадает с market_type ==
+    "secondary" — то же, что strict_nan_logic, но без фрейма результатов.
+    """
+    is_secondary = pc.equal(
+        _read_column(dataset, "market_type").cast(pa.string()), "secondary"
+    )
+    is_secondary = is_secondary.to_numpy(zero_copy_only=False)
+
+    def failing(col):
+        values = _read_column(dataset, col)
+        missing = pc.is_null(values, nan_is_null=True)
+        return missing.to_numpy(zero_copy_only=False) != is_secondary
+
+    failed = np.zeros(len(is_secondary), dtype=bool)
+    for col_failed in executor.map(failing, wnir_cols):
+        failed |= col_failed
+
+    return np.flatnonzero(failed)
+
+
+# dataframe-проверки схем, которые fast умеет считать по колонкам
+FAST_DATAFRAME_CHECKS = {"strict_nan_logic"}
+
+
+def nan_logic_columns(schema):
+    """Колонки strict_nan_logic схемы (из statistics проверки); None — его нет."""
+    for check in schema.checks:
+        if check.name == "strict_nan_logic":
+            columns = check.statistics.get("columns")
+            if columns is None:
+                raise FastValidationError(
+                    "strict_nan_logic без statistics['columns'] в схеме"
+                )
+            return columns
+    return None
+
+
+def validate_fast(schema, path, executor):
+    """
+    Проверяет parquet-файл или датасет path, при ошибках — FastValidationError.
+    executor — общий пул потоков для поколоночных проверок.
+    """
+    unsupported = {check.name for check in schema.checks} - FAST_DATAFRAME_CHECKS
+    if unsupported:
+        raise FastValidationError(
+            f"{path}: проверки {sorted(unsupported)} не поддерживаются в fast, "
+            "нужен --mode full"
+        )
+
+    dataset = open_dataset(path)
+
+    check_schema(schema, dataset)
+
+    errors = check_not_null(schema, dataset, executor)
+    errors += check_isin(schema, dataset)
+
+    columns = nan_logic_columns(schema)
+    if columns is not None:
+        failed_rows = wnir_nan_logic_failures(dataset, columns, executor)
+        if len(failed_rows) > 0:
+            errors.append(
+                f"strict_nan_logic: {len(failed_rows)} строк, "
+                f"первые: {failed_rows[:10].tolist()}"
+            )
+
+    if errors:
+        raise FastValidationError(f"{path}:\n" + "\n".join(errors))
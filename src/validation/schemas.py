@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 import pandera.pandas as pa
 from pandera.pandas import Check, Column, DataFrameSchema, Field
@@ -75,18 +76,19 @@ class WnirAllSchema(pa.DataFrameModel):
     class Config:
         strict = True
 
-    @pa.dataframe_check(name="strict_nan_logic")
-    def check_wnir_nan_logic(cls, df: DataFrame) -> DataFrame:
-        is_secondary = df["market_type"] == "secondary"
+    # statistics — колонки правила для validation/fast.py, который считает
+    # его по колонкам, не запуская саму проверку
+    @pa.dataframe_check(name="strict_nan_logic", statistics={"columns": wnir_cols})
+    def check_wnir_nan_logic(cls, df: DataFrame) -> Series[bool]:
+        # Построчный результат: колонки сворачиваются по одной, без фрейма
+        # из bool размером с весь df
+        is_secondary = (df["market_type"] == "secondary").to_numpy()
 
-        wnir_df = df[wnir_cols]
-        wnir_check = wnir_df.isna().eq(is_secondary, axis=0)
+        passed = np.ones(len(df), dtype=bool)
+        for col in wnir_cols:
+            passed &= df[col].isna().to_numpy() == is_secondary
 
-        result = pd.DataFrame(True, index=df.index, columns=df.columns)
-
-        result[wnir_cols] = wnir_check
-
-        return result
+        return pd.Series(passed, index=df.index)
 
 
 wnir_all_schema = WnirAllSchema.to_schema()
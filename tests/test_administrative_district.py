@@ -0,0 +1,83 @@
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pytest
+import shapely
+
+from src.administrative_district.enrich_df import (
+    add_administrative_district,
+    add_administrative_district_grid,
+    add_administrative_district_unique,
+)
+
+BBOX = dict(lon_min=37.0, lon_max=38.0, lat_min=55.0, lat_max=56.0)
+STEP = 0.02
+
+
+@pytest.fixture(scope="module")
+def shp_path(tmp_path_factory):
+    # Округа — ячейки Вороного внутри квадрата с вырезанным углом, чтобы
+    # были и общие границы, и точки вне всех округов внутри сетки
+    rng = np.random.default_rng(0)
+    seeds = shapely.multipoints(rng.uniform([37.1, 55.1], [37.9, 55.9], (8, 2)))
+    area = shapely.difference(
+        shapely.box(37.05, 55.05, 37.95, 55.95), shapely.box(37.7, 55.7, 38.0, 56.0)
+    )
+    cells = shapely.get_parts(shapely.voronoi_polygons(seeds, extend_to=area))
+    districts = [
+        cell for cell in shapely.intersection(cells, area) if not cell.is_empty
+    ]
+
+    path = tmp_path_factory.mktemp("ao") / "ao.shp"
+    gpd.GeoDataFrame(
+        {"NAME": [f"district_{i}" for i in range(len(districts))]},
+        geometry=districts,
+        crs="EPSG:4326",
+    ).to_file(path)
+    return path
+
+
+@pytest.fixture(scope="module")
+def points(shp_path):
+    rng = np.random.default_rng(1)
+    lon = rng.uniform(36.95, 38.05, 5000)
+    lat = rng.uniform(54.95, 56.05, 5000)
+
+    # Точки на границах и рядом с ними: вершины и середины ребер полигонов
+    boundary = shapely.get_coordinates(
+        shapely.segmentize(shapely.boundary(gpd.read_file(shp_path).geometry.values), STEP)
+    )
+    jitter = rng.normal(0.0, 1e-6, boundary.shape)
+    lon = np.concatenate([lon, boundary[:, 0], boundary[:, 0] + jitter[:, 0], [np.nan]])
+    lat = np.concatenate([lat, boundary[:, 1], boundary[:, 1] + jitter[:, 1], [55.5]])
+
+    # Повторы координат, как у сделок в одном доме
+    idx = rng.integers(0, len(lon), 500)
+    return pd.DataFrame({"longitude": np.r_[lon, lon[idx]], "latitude": np.r_[lat, lat[idx]]})
+
+
+def _districts(df):
+    return df["administrative_district"].astype(object).where(
+        df["administrative_district"].notna(), None
+    ).tolist()
+
+
+def test_grid_matches_sjoin(shp_path, points, tmp_path):
+    expected = add_administrative_district(points, shp_path)
+    result = add_administrative_district_grid(
+        points, shp_path, cache_dir=tmp_path, step=STEP, **BBOX
+    )
+    assert _districts(result) == _districts(expected)
+
+    # Второй вызов берет растр из кэша
+    cached = add_administrative_district_grid(
+        points, shp_path, cache_dir=tmp_path, step=STEP, **BBOX
+    )
+    assert len(list(tmp_path.glob("ao_grid_*.npy"))) == 1
+    assert _districts(cached) == _districts(expected)
+
+
+def test_unique_matches_sjoin(shp_path, points):
+    expected = add_administrative_district(points, shp_path)
+    result = add_administrative_district_unique(points, shp_path)
+    assert _districts(result) == _districts(expected)
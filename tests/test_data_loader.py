@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+
+from src.clean.data_loader import read_dfs_projected
+
+CSV = """address,area_total,price,rooms,date,unused
+"ул. Тверская, 1",45.5,10000000,2,2021-01-05,x
+,,,,,
+NA,NaN,n/a,null,,y
+"Арбат, 5",,NULL,3,2022-03-01,
+None,17.5,1.5e6,,#N/A,z
+"",60,,1,2020-12-31,
+"""
+
+ADAPTER = {
+    "address": "address",
+    "area": "area_total",
+    "price": lambda src: src.numeric("price"),
+    "room_count": "rooms",
+    "date": lambda src: src.datetime("date"),
+    "build_year": "missing_in_file",
+}
+
+
+def _csv(tmp_path):
+    path = tmp_path / "source.csv"
+    path.write_text(CSV, encoding="utf-8")
+    return str(path)
+
+
+def test_read_dfs_projected_matches_read_csv(tmp_path):
+    path = _csv(tmp_path)
+    (df,) = read_dfs_projected([ADAPTER], paths=[path], cache_dir=None)
+
+    # area — прямая числовая колонка, остальное читается строками
+    expected = pd.read_csv(
+        path,
+        usecols=["address", "area_total", "price", "rooms", "date"],
+        dtype={"area_total": np.float64, "price": str, "rooms": str, "date": str},
+    )
+    expected = expected[list(df.columns)]
+
+    assert list(df.columns) == ["address", "area_total", "price", "rooms", "date"]
+    pd.testing.assert_frame_equal(df.isna(), expected.isna())
+    pd.testing.assert_frame_equal(
+        df.astype(object).where(df.notna(), None),
+        expected.astype(object).where(expected.notna(), None),
+    )
+
+
+def test_raw_cache_round_trip(tmp_path):
+    path = _csv(tmp_path)
+    (tmp_path / "source.csv.dvc").write_text(
+        "outs:\n- md5: 0123456789abcdef0123456789abcdef\n  path: source.csv\n"
+    )
+    cache_dir = tmp_path / "cache"
+
+    (first,) = read_dfs_projected([ADAPTER], paths=[path], cache_dir=cache_dir)
+    assert len(list(cache_dir.glob("*.parquet"))) == 1
+    (cached,) = read_dfs_projected([ADAPTER], paths=[path], cache_dir=cache_dir)
+
+    pd.testing.assert_frame_equal(first, cached)
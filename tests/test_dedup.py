@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.clean.dedup import SeenRows, first_occurrence
+
+
+def _synthetic_frame(n, seed):
+    rng = np.random.default_rng(seed)
+    price = rng.choice([0.0, -0.0, 1.5, np.nan, 2.25], n)
+    return pd.DataFrame(
+        {
+            "price": price,
+            "rooms": pd.array(rng.choice([1, 2, None], n), dtype="Int64"),
+            "address": rng.choice(["a", "b", "c", None], n),
+            "date": pd.to_datetime(rng.choice(["2020-01-01", "2021-06-01"], n)),
+        }
+    )
+
+
+def test_first_occurrence_matches_duplicated():
+    df = _synthetic_frame(2000, seed=0)
+    np.testing.assert_array_equal(first_occurrence(df), ~df.duplicated().to_numpy())
+
+
+def test_signed_zero_and_nan_are_duplicates():
+    df = pd.DataFrame({"x": [0.0, -0.0, np.nan, -np.nan, 1.0]})
+    np.testing.assert_array_equal(first_occurrence(df), ~df.duplicated().to_numpy())
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 500])
+def test_streaming_dedup_matches_drop_duplicates(chunk_size):
+    df = _synthetic_frame(1000, seed=1)
+    seen = SeenRows()
+    seen.start_source("synthetic")
+
+    keep = []
+    for start in range(0, len(df), chunk_size):
+        # Каждый кусок — отдельный фрейм со своими категориями строк
+        chunk = df.iloc[start : start + chunk_size].reset_index(drop=True)
+        keep.append(seen.first_occurrence(chunk))
+
+    result = df.loc[np.concatenate(keep)]
+    pd.testing.assert_frame_equal(result, df.drop_duplicates())
+    np.testing.assert_array_equal(seen.keys, np.unique(seen.keys))
+
+
+def test_saved_state_applies_only_to_new_sources(tmp_path):
+    path = tmp_path / "seen_rows.npz"
+    old = _synthetic_frame(500, seed=2)
+
+    seen = SeenRows(path)
+    seen.start_source("old")
+    seen.first_occurrence(old)
+    seen.save()
+
+    rerun = SeenRows(path)
+    rerun.start_source("old")
+    assert rerun.first_occurrence(old).sum() == len(old.drop_duplicates())
+
+    rerun.start_source("new")
+    assert not rerun.first_occurrence(old).any()
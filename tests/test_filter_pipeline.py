@@ -0,0 +1,113 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+import yaml
+
+from src.clean.constants import INTERIM_CLEAN_COLUMNS
+from src.clean.filter_pipeline import apply_filters
+from src.clean.filters import (
+    drop_duplicates,
+    drop_nan_addresses,
+    drop_nan_prices,
+    drop_nan_rows,
+    filter_after_2017,
+    filter_by_address_len,
+    filter_by_area,
+    filter_by_build_year,
+    filter_by_floor,
+    filter_by_price,
+    filter_common_moscow_geo_point,
+    select_residential,
+)
+from src.clean.type_casting import cast_types
+from src.stages.clean import DROPPED_COLUMNS, build_filter_steps
+
+
+@pytest.fixture(scope="module")
+def params():
+    with open(Path(__file__).parents[1] / "params.yaml") as f:
+        return yaml.safe_load(f)["clean"]
+
+
+def _synthetic_adapted(n, params, seed=0):
+    """Кадр после adapt/normalize/concat: граничные значения, NaN и повторы."""
+    rng = np.random.default_rng(seed)
+    point = params["common_moscow_point"]
+
+    def pick(values, p_nan=0.1):
+        values = np.asarray(values, dtype=object)[rng.integers(0, len(values), n)]
+        values[rng.random(n) < p_nan] = None
+        return values
+
+    df = pd.DataFrame(
+        {
+            "address": pick(["ул. Тверская, 1", "Арбат, 5", "пр. Мира, д. 100, к. 2"]),
+            "latitude": pick([55.75, 55.8, point["latitude"]]),
+            "longitude": pick([37.6, 37.5, point["longitude"]]),
+            "area": pick([10.0, 17.5, 45.3, 1100.0, 1200.0]),
+            "room_count": pick([1, 2, 3]),
+            "floor": pick([-5, -4, 3, 85, 86]),
+            "floor_count": pick([5, 25]),
+            "housing_type": pick(["residential", "commercial"], p_nan=0.0),
+            "flat_type": pick(["flat", "apartment"]),
+            "ceiling_height": pick([2.7, 3.0]),
+            "build_year": pick([1960, 2015]),
+            "balcony": pick([0, 1]),
+            "price": pick([1_000_000.0, 1_100_000.0, 9_500_000.0, 25_000_000.0, 2e8]),
+            "price_per_square_meter": pick([150_000.0, 300_000.0]),
+            "date": pick(pd.to_datetime(["2016-05-01", "2017-12-31", "2018-01-01", "2023-06-15"])),
+            "market_type": pick(["primary", "secondary"], p_nan=0.0),
+        }
+    )
+    df = pd.concat([df, df.sample(n // 5, random_state=seed)], ignore_index=True)
+    df.loc[::97] = None  # полностью пустые строки
+    df["housing_type"] = df["housing_type"].fillna("residential")
+    df["market_type"] = df["market_type"].fillna("secondary")
+
+    return cast_types(df, INTERIM_CLEAN_COLUMNS)
+
+
+def _old_chain(df, params):
+    # Цепочка фильтров clean до apply_filters
+    df = select_residential(df)
+    df = drop_duplicates(df)
+    df = drop_nan_rows(df)
+    df = drop_nan_addresses(df)
+    df = drop_nan_prices(df)
+    df = cast_types(df, INTERIM_CLEAN_COLUMNS)
+    df = filter_by_area(df, params["area"]["min"], params["area"]["max"])
+    df = filter_by_floor(df, params["floor"]["min"], params["floor"]["max"])
+    df = filter_by_price(df, params["price"]["min"], params["price"]["max"])
+    df = filter_by_build_year(
+        df, params["build_year"]["min"], params["build_year"]["max"]
+    )
+    df = filter_by_address_len(df, params["address"]["min_len"])
+    df = filter_common_moscow_geo_point(
+        df,
+        params["common_moscow_point"]["longitude"],
+        params["common_moscow_point"]["latitude"],
+    )
+    df = df.dropna(subset=["room_count", "build_year"])
+    df = filter_after_2017(df.copy(), "date")
+    return df.drop(columns=[c for c in DROPPED_COLUMNS if c in df.columns])
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_apply_filters_matches_old_chain(params, seed):
+    df = _synthetic_adapted(10_000, params, seed)
+    expected = _old_chain(df.copy(), params).reset_index(drop=True)
+
+    result, report = apply_filters(
+        df,
+        build_filter_steps(params),
+        columns=[c for c in df.columns if c not in DROPPED_COLUMNS],
+    )
+
+    assert len(expected) > 0
+    pd.testing.assert_frame_equal(result, expected)
+    assert report["rows_out"] == len(expected)
+    assert report["rows_in"] - sum(
+        step["dropped"] for step in report["steps"].values()
+    ) == len(expected)
@@ -0,0 +1,65 @@
+import joblib
+import numpy as np
+import pandas as pd
+
+from src.stages import price_discount
+from src.stages.price_discount import PriceDiscounter, fit_discounter
+
+
+def _deals(n, months, seed):
+    rng = np.random.default_rng(seed)
+    dates = pd.to_datetime(rng.choice(months, n)) + pd.to_timedelta(
+        rng.integers(0, 28, n), unit="D"
+    )
+    market_type = rng.choice(["primary", "secondary"], n)
+    # Цены растут от месяца к месяцу, чтобы индексы были разными
+    trend = 1.0 + 0.01 * (dates.year * 12 + dates.month - 2019 * 12).to_numpy()
+    price_sqm = rng.lognormal(np.log(200_000), 0.3, n) * trend
+    price_sqm[rng.random(n) < 0.02] = np.nan
+
+    return pd.DataFrame(
+        {
+            "market_type": pd.Categorical(market_type),
+            "date": dates,
+            "price_per_square_meter": price_sqm.astype("float32"),
+            "area": rng.uniform(20, 120, n).astype("float32"),
+        }
+    )
+
+
+OLD_MONTHS = pd.date_range("2019-01-01", "2021-06-01", freq="MS")
+NEW_MONTHS = pd.date_range("2021-07-01", "2021-12-01", freq="MS")
+
+# partial_fit берет медианы новых ячеек из гистограммы: точность — ширина бина
+RTOL = 5e-3
+
+
+def _assert_transform_close(fitted, expected, df):
+    a = fitted.transform(df)
+    b = expected.transform(df)
+    for col in ["price_per_square_meter_normalized", "price_normalized"]:
+        np.testing.assert_allclose(a[col], b[col], rtol=RTOL)
+
+
+def test_partial_fit_matches_full_fit():
+    old = _deals(20_000, OLD_MONTHS, seed=0)
+    new = _deals(5_000, NEW_MONTHS, seed=1)
+    everything = pd.concat([old, new], ignore_index=True)
+
+    incremental = PriceDiscounter(min_obs=30).fit(old).partial_fit(new, reanchor=True)
+    full = PriceDiscounter(min_obs=30).fit(everything)
+
+    _assert_transform_close(incremental, full, everything)
+
+
+def test_incremental_stage_fit_matches_full_fit(tmp_path, monkeypatch):
+    monkeypatch.setattr(price_discount, "STATE_PATH", tmp_path / "state.joblib")
+    old = _deals(20_000, OLD_MONTHS, seed=0)
+    everything = pd.concat([old, _deals(5_000, NEW_MONTHS, seed=1)], ignore_index=True)
+
+    joblib.dump(fit_discounter(old, incremental=True), price_discount.STATE_PATH)
+    incremental = fit_discounter(everything, incremental=True)
+    full = fit_discounter(everything, incremental=False)
+
+    assert incremental.monthly_["month"].max() == full.monthly_["month"].max()
+    _assert_transform_close(incremental, full, everything)